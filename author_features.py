@@ -0,0 +1,120 @@
+"""
+Per-author aggregation of scraped TikTok videos.
+
+Raw scraper items are flattened once into columnar arrays and every author
+feature is computed in a single grouped pass with pandas, instead of walking
+the item dicts per author.
+"""
+
+import numpy as np
+import pandas as pd
+
+VIDEO_COLUMNS = ['video_id', 'author_id', 'profile_name', 'fans', 'hearts', 'videos',
+                 'plays', 'shares', 'comments', 'diggs', 'created_at', 'search_query']
+
+
+def items_to_frame(items):
+    """
+    Flatten scraper items into a columnar DataFrame, one row per unique video.
+
+    Parameters:
+    - items (iterable): Items returned by query_tiktok / query_tiktok_many.
+
+    Returns:
+    - DataFrame with VIDEO_COLUMNS.
+    """
+    columns = {name: [] for name in VIDEO_COLUMNS}
+    for item in items:
+        author = item.get('authorMeta') or {}
+        columns['video_id'].append(item.get('id') or item.get('webVideoUrl'))
+        columns['author_id'].append(author.get('id') or author.get('name'))
+        columns['profile_name'].append(author.get('name'))
+        columns['fans'].append(author.get('fans'))
+        columns['hearts'].append(author.get('heart', author.get('hearts')))
+        columns['videos'].append(author.get('video', author.get('videos')))
+        columns['plays'].append(item.get('playCount'))
+        columns['shares'].append(item.get('shareCount'))
+        columns['comments'].append(item.get('commentCount'))
+        columns['diggs'].append(item.get('diggCount'))
+        columns['created_at'].append(item.get('createTimeISO'))
+        columns['search_query'].append(item.get('searchQuery'))
+
+    frame = pd.DataFrame(columns, columns=VIDEO_COLUMNS)
+    for name in ('fans', 'hearts', 'videos', 'plays', 'shares', 'comments', 'diggs'):
+        frame[name] = pd.to_numeric(frame[name], errors='coerce').astype('float64')
+    frame['created_at'] = pd.to_datetime(frame['created_at'], errors='coerce', utc=True)
+
+    # Multi-query result sets repeat videos; count each one once
+    with_id = frame['video_id'].notna()
+    frame = pd.concat([frame[with_id].drop_duplicates('video_id'), frame[~with_id]], ignore_index=True)
+    return frame
+
+
+def aggregate_author_features(items):
+    """
+    Compute per-author totals and distributions in one grouped pass.
+
+    Parameters:
+    - items (iterable or DataFrame): Scraper items, or the output of items_to_frame.
+
+    Returns:
+    - DataFrame indexed by author_id with profile stats, video_count, total/median/mean
+      plays, shares_per_video, comment_rate (comments per play), engagement_rate
+      ((diggs + comments + shares) per play), first/last post and posting_cadence_days
+      (mean days between posts; NaN for authors with a single video).
+    """
+    frame = items if isinstance(items, pd.DataFrame) else items_to_frame(items)
+    if frame.empty:
+        columns = [
+            'profile_name', 'fans', 'hearts', 'videos', 'video_count', 'total_plays', 'median_plays',
+            'mean_plays', 'total_shares', 'shares_per_video', 'total_comments', 'comment_rate',
+            'engagement_rate', 'first_post', 'last_post', 'posting_cadence_days'
+        ]
+        # Same dtypes as a populated frame, so numeric operations such as nlargest still work
+        dtypes = dict.fromkeys(columns, 'float64')
+        dtypes.update(profile_name='object', first_post='datetime64[ns, UTC]', last_post='datetime64[ns, UTC]')
+        return pd.DataFrame(columns=columns).astype(dtypes).rename_axis('author_id')
+
+    features = frame.groupby('author_id', sort=False).agg(
+        profile_name=('profile_name', 'first'),
+        fans=('fans', 'max'),
+        hearts=('hearts', 'max'),
+        videos=('videos', 'max'),
+        video_count=('plays', 'size'),
+        total_plays=('plays', 'sum'),
+        median_plays=('plays', 'median'),
+        mean_plays=('plays', 'mean'),
+        total_shares=('shares', 'sum'),
+        total_comments=('comments', 'sum'),
+        total_diggs=('diggs', 'sum'),
+        first_post=('created_at', 'min'),
+        last_post=('created_at', 'max'),
+    )
+
+    plays = features['total_plays'].replace(0, np.nan)
+    features['shares_per_video'] = features['total_shares'] / features['video_count']
+    features['comment_rate'] = features['total_comments'] / plays
+    features['engagement_rate'] = (features['total_diggs'] + features['total_comments']
+                                   + features['total_shares']) / plays
+    span_days = (features['last_post'] - features['first_post']).dt.total_seconds() / 86400
+    features['posting_cadence_days'] = span_days / (features['video_count'] - 1).replace(0, np.nan)
+    return features.drop(columns=['total_diggs'])
+
+
+def rank_authors(features, by='median_plays', top_k=10):
+    """
+    Pick the top_k authors by any feature column.
+
+    Parameters:
+    - features (DataFrame): Output of aggregate_author_features.
+    - by (str): Feature to rank on.
+    - top_k (int): Number of authors to return.
+
+    Returns:
+    - DataFrame with the top_k rows, best first.
+    """
+    if by not in features.columns:
+        raise ValueError(f"Unknown feature: {by}")
+    if features.empty:
+        return features.head(0)
+    return features.nlargest(top_k, by)
@@ -1,12 +1,18 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-import os
 import time
+import json
+import base64
+import binascii
+from datetime import datetime
 from dotenv import load_dotenv
-import psycopg2
-from urllib.parse import urlparse
-from render_db import fetch_data, insert_data, update_data
-from scrap_tiktok import query_tiktok, get_top_authors
+from render_db import fetch_page, stream_data, update_data
+from db_pool import pooled_connection, pool_stats
+from statement_cache import statement_cache
+from scrape_cache import get_scrape_cache
+from metrics_refresher import freshness_report
+from metrics_history import metric_trend
+from search_jobs import submit_search, submit_import, get_job, job_events
 
 app = Flask(__name__)
 CORS(app)
@@ -15,96 +21,347 @@ CORS(app)
 load_dotenv()
 
 def get_db_connection():
-    """Create a connection to the PostgreSQL database."""
-    result = urlparse(os.getenv("DATABASE_URL"))
-    username = result.username
-    password = result.password
-    database = result.path[1:]
-    hostname = result.hostname
-    
-    return psycopg2.connect(
-        user=username,
-        password=password,
-        host=hostname,
-        port="5432",
-        database=database
-    )
+    """Borrow a connection from the shared PostgreSQL pool (use as a context manager)."""
+    return pooled_connection()
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint to verify the API is running."""
     return jsonify({"status": "healthy", "message": "Flask API is running"}), 200
 
+@app.route('/api/health/db', methods=['GET'])
+def db_pool_health():
+    """Report connection pool, statement cache and scraper cache usage for this worker process."""
+    try:
+        return jsonify({
+            "pool": pool_stats(),
+            "statements": statement_cache.stats(),
+            "scrapeCache": get_scrape_cache().stats()
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# API field name -> column in the leads table
+LEAD_FIELDS = {
+    'id': 'id',
+    'name': 'profile_name',
+    'followers': 'fans',
+    'hearts': 'hearts',
+    'videos': 'videos',
+    'platform': 'platform',
+    'email': 'email',
+    'leadStage': 'lead_stage',
+    'contractVideo': 'contract_vid',
+    'createdAt': 'created_at',
+    'contractShares': 'contract_shares',
+    'contractPlays': 'contract_plays',
+    'contractComments': 'contract_comments'
+}
+SORTABLE_FIELDS = {'id', 'followers', 'hearts', 'videos', 'platform', 'leadStage'}
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_ITERSIZE = 2000
+SEARCH_RANKING_KEYS = {'fans', 'hearts', 'avg_plays', 'median_plays', 'engagement_rate',
+                       'comment_rate', 'shares_per_video'}
+MAX_SEARCH_QUERIES = 20
+STREAM_MIMETYPES = {'ndjson': 'application/x-ndjson', 'json': 'application/json'}
+
+def lead_to_json(row):
+    """Map a leads row (dict keyed by column) to the API representation."""
+    influencer = {}
+    for field, column in LEAD_FIELDS.items():
+        if column in row:
+            value = row[column]
+            if field == 'createdAt' and value is not None:
+                value = value.isoformat()
+            influencer[field] = value
+    return influencer
+
+def encode_cursor(after):
+    """Turn a fetch_page cursor into an opaque query-string token."""
+    if after is None:
+        return None
+    if not isinstance(after, tuple):
+        return str(after)
+    return base64.urlsafe_b64encode(json.dumps(list(after)).encode()).decode()
+
+def decode_cursor(token, sort_field):
+    """Inverse of encode_cursor; a plain id is accepted when sorting by id."""
+    if not token:
+        return None
+    if sort_field == 'id':
+        return int(token)
+    value, key = json.loads(base64.urlsafe_b64decode(token.encode()))
+    return value, key
+
+def parse_lead_query(args):
+    """
+    Validate the projection, sort and filter query parameters shared by the
+    paginated and streaming /api/influencers modes.
+    Raises ValueError on bad input.
+    """
+    fields = [f.strip() for f in args.get('fields', '').split(',') if f.strip()] or list(LEAD_FIELDS)
+    unknown = [f for f in fields if f not in LEAD_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+    sort = args.get('sort', 'id')
+    descending = sort.startswith('-')
+    sort_field = sort.lstrip('-')
+    if sort_field not in SORTABLE_FIELDS:
+        raise ValueError(f"Cannot sort by {sort_field}")
+
+    filters = {}
+    if args.get('platform'):
+        filters['platform'] = args['platform']
+    lead_stage = args.get('leadStage', args.get('lead_stage'))
+    if lead_stage:
+        filters['lead_stage'] = lead_stage
+    follower_range = []
+    if args.get('minFollowers'):
+        follower_range.append(('>=', int(args['minFollowers'])))
+    if args.get('maxFollowers'):
+        follower_range.append(('<=', int(args['maxFollowers'])))
+    if follower_range:
+        filters['fans'] = follower_range
+
+    return {
+        "fields": fields,
+        "sort_field": sort_field,
+        "descending": descending,
+        "filters": filters
+    }
+
+def stream_influencers(lead_query, stream_format):
+    """
+    Generator writing every matching lead as NDJSON lines or as one chunked JSON array.
+    Rows come from a server-side cursor, so memory stays flat however large the table is.
+    """
+    fields = lead_query["fields"]
+    columns = [LEAD_FIELDS[f] for f in fields]
+    ndjson = stream_format == 'ndjson'
+    if not ndjson:
+        yield '['
+    first = True
+    try:
+        with get_db_connection() as conn:
+            rows = stream_data(
+                conn, 'leads', columns,
+                filters=lead_query["filters"],
+                order_by=LEAD_FIELDS[lead_query["sort_field"]],
+                descending=lead_query["descending"],
+                itersize=STREAM_ITERSIZE
+            )
+            for row in rows:
+                line = json.dumps(lead_to_json(row))
+                if ndjson:
+                    yield line + '\n'
+                else:
+                    yield line if first else ',' + line
+                first = False
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        app.logger.error(f"Error streaming influencers: {e}")
+        error = json.dumps({"error": str(e)})
+        if ndjson:
+            yield error + '\n'
+        else:
+            # Append the error and leave the array unclosed, so a truncated export
+            # cannot be parsed as a complete one
+            yield error if first else ',' + error
+        return
+    if not ndjson:
+        yield ']'
+
+@app.route('/api/metrics/freshness', methods=['GET'])
+def metrics_freshness():
+    """Report how far behind the contract video metrics are (refresher queue depth and lag)."""
+    try:
+        max_age = float(request.args.get('maxAge', 3600))
+        with get_db_connection() as conn:
+            return jsonify(freshness_report(conn, max_age))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/metrics/trends', methods=['GET'])
+def metrics_trends():
+    """
+    Contract video metric trends, read from the hourly/daily rollups.
+
+    Query parameters:
+        granularity: 'hourly' or 'daily' (default)
+        video: contract video URL, may be repeated
+        since: ISO timestamp (UTC) of the earliest bucket
+        groupBy: 'profile' to sum each influencer's videos per bucket
+    """
+    try:
+        args = request.args
+        granularity = args.get('granularity', 'daily')
+        since = datetime.fromisoformat(args['since']) if args.get('since') else None
+        group_by_profile = args.get('groupBy') == 'profile'
+        with get_db_connection() as conn:
+            points = metric_trend(conn, granularity, args.getlist('video') or None, since, group_by_profile)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {e}"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    for point in points:
+        point["bucket"] = point["bucket"].isoformat()
+    return jsonify({"granularity": granularity, "points": points})
+
 @app.route('/api/influencers', methods=['GET'])
 def get_influencers():
-    """Get all influencers from the database."""
+    """
+    Get influencers from the database, one page at a time or as a stream.
+
+    Query parameters:
+        after: nextCursor of the previous page (a lead id when sorting by id)
+        limit: page size, at most MAX_PAGE_SIZE
+        fields: comma-separated API fields to return, e.g. fields=id,name,followers
+        sort: one of SORTABLE_FIELDS, prefixed with '-' for descending order
+        platform, leadStage: exact-match filters
+        minFollowers, maxFollowers: follower range filters
+        stream: 'ndjson' or 'json' to export every matching row instead of a page
+    """
     try:
-        conn = get_db_connection()
-        results = fetch_data(conn, 'leads')
-        
+        args = request.args
+        lead_query = parse_lead_query(args)
+        stream_format = args.get('stream')
+        if stream_format:
+            if stream_format not in STREAM_MIMETYPES:
+                raise ValueError(f"Unsupported stream format: {stream_format}")
+            return Response(
+                stream_influencers(lead_query, stream_format),
+                mimetype=STREAM_MIMETYPES[stream_format],
+                headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"}
+            )
+
+        limit = min(max(int(args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        after = decode_cursor(args.get('after'), lead_query["sort_field"])
+    except (ValueError, TypeError, binascii.Error) as e:
+        return jsonify({"error": f"Invalid query parameter: {e}"}), 400
+
+    try:
+        fields = lead_query["fields"]
+        with get_db_connection() as conn:
+            rows, next_after = fetch_page(
+                conn, 'leads', [LEAD_FIELDS[f] for f in fields],
+                filters=lead_query["filters"],
+                order_by=LEAD_FIELDS[lead_query["sort_field"]],
+                descending=lead_query["descending"],
+                after=after,
+                limit=limit
+            )
+
         influencers = []
-        for result in results:
-            # Map database columns to JSON response
-            # Adjust column indices based on your actual schema
-            influencer = {
-                'id': result[0],
-                'name': result[1],  # profile_name
-                'followers': result[2],  # fans
-                'hearts': result[3],
-                'videos': result[4],
-                'platform': result[5],
-                'email': result[6],
-                'leadStage': result[7],
-                'contractVideo': result[8],
-                'createdAt': result[9].isoformat() if result[9] else None,
-                'contractShares': result[10],
-                'contractPlays': result[11],
-                'contractComments': result[12]
-            }
-            influencers.append(influencer)
-        
-        conn.close()
-        return jsonify(influencers)
+        for row in rows:
+            influencer = lead_to_json(row)
+            # Drop the sort/key columns that were only selected for the cursor
+            influencers.append({f: influencer[f] for f in fields})
+
+        return jsonify({
+            "items": influencers,
+            "nextCursor": encode_cursor(next_after),
+            "limit": limit
+        })
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def invalid_queries(queries):
+    """Return why a queries field is unacceptable, or None if it is a usable list of strings."""
+    if (not isinstance(queries, list) or not queries
+            or not all(isinstance(q, str) and q.strip() for q in queries)):
+        return "queries must be a non-empty list of non-empty strings"
+    if len(queries) > MAX_SEARCH_QUERIES:
+        return f"At most {MAX_SEARCH_QUERIES} queries per search"
+    return None
+
 @app.route('/api/influencers/search', methods=['POST'])
 def search_influencers():
-    """Search for influencers using TikTok API."""
+    """
+    Submit a TikTok influencer search as a background job.
+    Body: query, or queries (list of keyword variants run together); limit; forceRefresh;
+    rankBy (fans, hearts, avg_plays, or an author feature: median_plays, engagement_rate,
+    comment_rate, shares_per_video).
+    Returns 202 with the job id; follow it via /api/jobs/<id> or /api/jobs/<id>/events.
+    """
     data = request.json
     query = data.get('query', '')
     top_k = data.get('limit', 10)
+    queries = data.get('queries')
+    if queries is not None:
+        error = invalid_queries(queries)
+        if error:
+            return jsonify({"error": error}), 400
+    force_refresh = bool(data.get('forceRefresh', False))
+    rank_by = data.get('rankBy', 'fans')
+    if rank_by not in SEARCH_RANKING_KEYS:
+        return jsonify({"error": f"Cannot rank by {rank_by}"}), 400
     
     try:
-        # Use the existing scraping functionality
-        tiktok_data = query_tiktok(query)
-        top_influencers = get_top_authors(tiktok_data, top_k)
-        
-        # Store the results in the database
-        conn = get_db_connection()
-        for profile in top_influencers:
-            profile_name = profile["authorMeta"]['name']
-            fans = profile["authorMeta"]['fans']
-            hearts = profile["authorMeta"]['hearts']
-            videos = profile["authorMeta"]['videos']
-            
-            insert_data(conn, 'leads', {
-                'profile_name': profile_name,
-                'fans': fans,
-                'hearts': hearts,
-                'videos': videos,
-                'platform': 'tiktok',
-                'email': profile_name + '@gmail.com',
-                'lead_stage': 'prospect'
-            })
-        
-        conn.close()
-        return jsonify(top_influencers)
+        job_id = submit_search(query, top_k, force_refresh, queries, rank_by)
+        return jsonify({
+            "jobId": job_id,
+            "status": "queued",
+            "statusUrl": f"/api/jobs/{job_id}",
+            "eventsUrl": f"/api/jobs/{job_id}/events"
+        }), 202
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/influencers/import', methods=['POST'])
+def import_influencers():
+    """
+    Submit a bulk import job that streams every author a search returns into leads.
+    Body: queries (list); batchSize (leads per upsert, default 200).
+    Returns 202 with the job id; the finished job's result holds per-stage throughput counters.
+    """
+    data = request.json or {}
+    queries = data.get('queries')
+    error = invalid_queries(queries)
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        batch_size = min(max(int(data.get('batchSize', 200)), 1), MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return jsonify({"error": "batchSize must be an integer"}), 400
+    
+    try:
+        job_id = submit_import(queries, batch_size)
+        return jsonify({
+            "jobId": job_id,
+            "status": "queued",
+            "statusUrl": f"/api/jobs/{job_id}",
+            "eventsUrl": f"/api/jobs/{job_id}/events"
+        }), 202
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_search_job(job_id):
+    """Get status, progress and (partial) results of a search job."""
+    try:
+        job = get_job(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job)
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def stream_search_job(job_id):
+    """Server-Sent Events stream of a search job's progress until it finishes."""
+    return Response(
+        job_events(job_id),
+        mimetype='text/event-stream',
+        headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"}
+    )
+
 @app.route('/api/briefs', methods=['POST'])
 def create_brief():
     """Create a new client brief."""
@@ -134,14 +391,14 @@ def contact_influencer():
     # For now, we'll just update the lead stage in the database
     
     try:
-        conn = get_db_connection()
-        update_data(
-            conn, 
-            'leads', 
-            {'lead_stage': 'contacted'}, 
-            f"id = {influencer_id}"
-        )
-        conn.close()
+        with get_db_connection() as conn:
+            update_data(
+                conn, 
+                'leads', 
+                {'lead_stage': 'contacted'}, 
+                "id = %s",
+                [influencer_id]
+            )
         
         return jsonify({
             "success": True,
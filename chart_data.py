@@ -0,0 +1,134 @@
+"""
+Chart-ready aggregates of the per-profile metrics frame.
+
+The dashboard never plots one mark per influencer. Every figure is built
+from one of these summaries, whose size is bounded by `top_n` / `max_groups`
+however many profiles are tracked; individual profiles are only listed on
+drill-down.
+"""
+
+import numpy as np
+import pandas as pd
+
+CHART_METRICS = ['contract_shares', 'contract_plays', 'contract_comments']
+GROUP_COLUMNS = ['niche', 'campaign']
+OTHERS_LABEL = 'Others'
+DEFAULT_PERCENTILES = (10, 50, 90)
+
+
+def top_n_with_others(frame, metric='contract_plays', top_n=20, metrics=CHART_METRICS):
+    """
+    Keep the top_n profiles by one metric and fold the rest into a single bucket.
+
+    Parameters:
+    - frame (DataFrame): Metrics indexed by profile_name.
+    - metric (str): Column used to rank profiles.
+    - top_n (int): Number of profiles plotted individually.
+    - metrics (list): Columns to total per bar.
+
+    Returns:
+    - DataFrame indexed by label (profile name or OTHERS_LABEL) with the metric totals
+      and a `profiles` count, best first, at most top_n + 1 rows.
+    """
+    values = frame[metrics].apply(pd.to_numeric, errors='coerce').fillna(0)
+    if len(values) <= top_n:
+        top = values.sort_values(metric, ascending=False)
+        return top.assign(profiles=1)
+
+    # argpartition finds the top_n in linear time; only those are sorted
+    ranking = values[metric].to_numpy()
+    top_positions = np.argpartition(-ranking, top_n - 1)[:top_n]
+    is_top = np.zeros(len(values), dtype=bool)
+    is_top[top_positions] = True
+
+    top = values[is_top].sort_values(metric, ascending=False).assign(profiles=1)
+    others = values[~is_top]
+    others_row = pd.DataFrame([{**others.sum().to_dict(), 'profiles': len(others)}], index=[OTHERS_LABEL])
+    return pd.concat([top, others_row])
+
+
+def _limit_groups(labels, weights, max_groups):
+    """Relabel all but the max_groups heaviest groups as OTHERS_LABEL."""
+    labels = labels.fillna('Unassigned').astype(str)
+    totals = weights.groupby(labels).sum()
+    if len(totals) <= max_groups:
+        return labels
+    keep = set(totals.nlargest(max_groups).index)
+    return labels.where(labels.isin(keep), OTHERS_LABEL)
+
+
+def group_summary(frame, group_by, metric='contract_plays', max_groups=20, percentiles=DEFAULT_PERCENTILES):
+    """
+    Totals and percentile bands of one metric per group (e.g. niche or campaign).
+
+    Parameters:
+    - frame (DataFrame): Metrics indexed by profile_name, including the group_by column.
+    - group_by (str): Column to group on.
+    - metric (str): Metric to summarize.
+    - max_groups (int): Groups shown individually; smaller ones are merged into OTHERS_LABEL.
+    - percentiles (tuple): Percentiles computed per group.
+
+    Returns:
+    - DataFrame indexed by group with profiles, total, mean and one p<N> column per percentile,
+      largest total first.
+    """
+    if group_by not in frame.columns:
+        raise ValueError(f"Unknown group column: {group_by}")
+    values = pd.to_numeric(frame[metric], errors='coerce').fillna(0)
+    labels = _limit_groups(frame[group_by], values, max_groups)
+
+    grouped = values.groupby(labels)
+    summary = pd.DataFrame({
+        'profiles': grouped.size(),
+        'total': grouped.sum(),
+        'mean': grouped.mean(),
+    })
+    bands = grouped.quantile([p / 100 for p in percentiles]).unstack()
+    bands.columns = [f"p{p}" for p in percentiles]
+    return summary.join(bands).sort_values('total', ascending=False)
+
+
+def percentile_bands(frame, metrics=CHART_METRICS, percentiles=DEFAULT_PERCENTILES):
+    """
+    Distribution of each metric across all profiles.
+
+    Parameters:
+    - frame (DataFrame): Metrics indexed by profile_name.
+    - metrics (list): Columns to summarize.
+    - percentiles (tuple): Percentiles to compute.
+
+    Returns:
+    - DataFrame indexed by metric with one p<N> column per percentile.
+    """
+    values = frame[metrics].apply(pd.to_numeric, errors='coerce').to_numpy(dtype='float64')
+    if len(values) == 0:
+        return pd.DataFrame(index=metrics, columns=[f"p{p}" for p in percentiles], dtype='float64')
+    bands = np.nanpercentile(values, percentiles, axis=0)
+    return pd.DataFrame(bands.T, index=metrics, columns=[f"p{p}" for p in percentiles])
+
+
+def drill_down(frame, label, metric='contract_plays', group_by=None, top_n=20, limit=100):
+    """
+    Profiles behind one bar of a summary chart.
+
+    Parameters:
+    - frame (DataFrame): Metrics indexed by profile_name.
+    - label (str): Clicked bar: a profile, a group value, or OTHERS_LABEL.
+    - metric (str): Metric the chart was ranked by.
+    - group_by (str): Group column of the chart, or None for the top-N chart.
+    - top_n (int): top_n / max_groups the chart was built with.
+    - limit (int): Maximum number of profiles returned.
+
+    Returns:
+    - DataFrame of at most `limit` profiles, highest metric first.
+    """
+    values = pd.to_numeric(frame[metric], errors='coerce').fillna(0)
+    if group_by is None:
+        if label != OTHERS_LABEL:
+            members = frame.index == label
+        else:
+            members = ~frame.index.isin(values.nlargest(top_n).index)
+    else:
+        members = (_limit_groups(frame[group_by], values, top_n) == label).to_numpy()
+    detail = frame[members]
+    return detail.loc[values[members].nlargest(limit).index]
@@ -1,7 +1,8 @@
 import psycopg2
 from psycopg2 import Error
 import json
-from typing import List, Dict, Any, Optional, Tuple
+import uuid
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator
 
 class DatabaseManager:
     def __init__(self, host: str = "dpg-cvfgf7ggph6c73bcmh40-a.oregon-postgres.render.com",
@@ -94,15 +95,55 @@ class DatabaseManager:
             print(f"Error executing query: {error}")
             return None, None
 
-    def execute_query_to_json(self, query: str, params: Optional[tuple] = None) -> List[Dict[Any, Any]]:
+    def iter_query_to_json(self, query: str, params: Optional[tuple] = None,
+                           itersize: int = 2000) -> Iterator[Dict[Any, Any]]:
+        """
+        Execute a SQL query through a server-side cursor and yield rows one at a time
+        Args:
+            query: SQL query string
+            params: Optional tuple of parameters for the SQL query
+            itersize: Number of rows fetched from the server per round trip
+        Returns:
+            Generator of dictionaries, one per result row
+        Raises:
+            The database error if the query fails part-way
+        """
+        if not self.connection or self.connection.closed:
+            self.connect()
+
+        cursor = self.connection.cursor(name=f"stream_{uuid.uuid4().hex[:12]}")
+        cursor.itersize = itersize
+        try:
+            cursor.execute(query, params)
+            columns = None
+            for row in cursor:
+                if columns is None:
+                    columns = [desc[0] for desc in cursor.description]
+                yield dict(zip(columns, row))
+        except (Exception, Error) as error:
+            # Re-raise: a stream cut short must not look like a complete result
+            print(f"Error streaming query: {error}")
+            raise
+        finally:
+            cursor.close()
+            # Release the transaction that backs the named cursor
+            self.connection.rollback()
+
+    def execute_query_to_json(self, query: str, params: Optional[tuple] = None,
+                              stream: bool = False, itersize: int = 2000):
         """
         Execute a SQL query and return results in JSON format
         Args:
             query: SQL query string
             params: Optional tuple of parameters for the SQL query
+            stream: Return a generator backed by a server-side cursor instead of a list
+            itersize: Rows per round trip when streaming
         Returns:
-            List of dictionaries containing the query results
+            List of dictionaries containing the query results (generator if stream=True)
         """
+        if stream:
+            return self.iter_query_to_json(query, params, itersize)
+
         results = []
         rows, columns = self.execute_query_with_columns(query, params)
         
@@ -126,6 +167,27 @@ class DatabaseManager:
         except Exception as error:
             print(f"Error saving results to file: {error}")
 
+    def save_results_to_ndjson(self, results: Iterable[Dict[Any, Any]], filename: str) -> int:
+        """
+        Write query results to a newline-delimited JSON file without materializing them
+        Args:
+            results: Iterable of row dictionaries, e.g. from iter_query_to_json
+            filename: Name of the file to save the results to
+        Returns:
+            Number of rows written
+        """
+        count = 0
+        try:
+            with open(filename, 'w', encoding='utf-8') as f:
+                for row in results:
+                    f.write(json.dumps(row, default=str))
+                    f.write('\n')
+                    count += 1
+            print(f"{count} rows successfully saved to {filename}")
+        except Exception as error:
+            print(f"Error saving results to file: {error}")
+        return count
+
     def get_table_names(self) -> List[str]:
         """
         Get list of all tables in the database
@@ -199,6 +261,19 @@ def execute_query_to_json(query: str, params: Optional[tuple] = None) -> List[Di
     with DatabaseManager() as db:
         return db.execute_query_to_json(query, params)
 
+def iter_query_to_json(query: str, params: Optional[tuple] = None, itersize: int = 2000) -> Iterator[Dict[Any, Any]]:
+    """
+    Streaming counterpart of execute_query_to_json
+    Args:
+        query: SQL query string
+        params: Optional tuple of parameters
+        itersize: Rows fetched per round trip
+    Returns:
+        Generator of dictionaries; the connection is closed once it is exhausted
+    """
+    with DatabaseManager() as db:
+        yield from db.iter_query_to_json(query, params, itersize)
+
 # Example usage
 if __name__ == "__main__":
     # Using the class directly
@@ -221,6 +296,10 @@ if __name__ == "__main__":
         # Save results to file
         if results:
             db.save_results_to_json(results, "query_results.json")
+
+        # Stream a full table export with flat memory use
+        rows = db.execute_query_to_json("SELECT * FROM influencer_metrics", stream=True)
+        db.save_results_to_ndjson(rows, "influencer_metrics.ndjson")
     
     # Example 2: Using individual methods
     db = DatabaseManager()
@@ -0,0 +1,357 @@
+"""
+Shared PostgreSQL connection pool.
+
+One bounded, thread-safe pool per process (i.e. per gunicorn worker) that the
+Flask API, the scraper helpers and the render_db scripts borrow connections
+from instead of opening a fresh TCP+TLS connection for every request.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+import psycopg2
+from psycopg2 import extensions
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection could be checked out within the timeout."""
+
+
+class PooledConnection(extensions.connection):
+    """psycopg2 connection that remembers the statements PREPAREd on it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = OrderedDict()
+
+
+def connection_params_from_url(database_url: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build psycopg2.connect() keyword arguments from a DATABASE_URL.
+
+    Parameters:
+    - database_url (str): postgres:// URL; defaults to the DATABASE_URL environment variable.
+
+    Returns:
+    - Dictionary of connection parameters.
+    """
+    result = urlparse(database_url or os.getenv("DATABASE_URL"))
+    return {
+        "user": result.username,
+        "password": result.password,
+        "host": result.hostname,
+        "port": str(result.port or 5432),
+        "database": result.path[1:],
+    }
+
+
+class ConnectionPool:
+    """
+    Bounded pool of psycopg2 connections.
+
+    Connections are validated when borrowed, rolled back when returned and
+    recycled once they have sat idle (or lived) for too long.
+    """
+
+    def __init__(self, connect_params: Dict[str, Any],
+                 minconn: int = 1,
+                 maxconn: int = 10,
+                 checkout_timeout: float = 10.0,
+                 max_idle: float = 300.0,
+                 max_lifetime: float = 3600.0,
+                 health_check_after: float = 30.0):
+        """
+        Initialize the pool
+        Args:
+            connect_params: Keyword arguments passed to psycopg2.connect()
+            minconn: Connections opened eagerly and kept warm
+            maxconn: Hard upper bound on open connections
+            checkout_timeout: Seconds to wait for a free connection before giving up
+            max_idle: Idle connections older than this (seconds) are closed and reopened
+            max_lifetime: Connections older than this (seconds) are recycled on return
+            health_check_after: Run a SELECT 1 on borrow if the connection was idle this long
+        """
+        if maxconn < 1 or minconn < 0 or minconn > maxconn:
+            raise ValueError("Pool bounds must satisfy 0 <= minconn <= maxconn and maxconn >= 1")
+
+        self.connect_params = connect_params
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.checkout_timeout = checkout_timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = deque()       # (connection, last_used)
+        self._created_at = {}      # id(connection) -> creation time
+        self._in_use = set()       # id(connection)
+        self._closed = False
+
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "total_wait_time": 0.0,
+            "max_wait_time": 0.0,
+            "connections_created": 0,
+            "connections_discarded": 0,
+            "failed_health_checks": 0,
+        }
+
+        for _ in range(minconn):
+            conn = self._open()
+            self._idle.append((conn, time.monotonic()))
+
+    def _connect(self):
+        return psycopg2.connect(connection_factory=PooledConnection, **self.connect_params)
+
+    def _open(self):
+        conn = self._connect()
+        self._created_at[id(conn)] = time.monotonic()
+        self._stats["connections_created"] += 1
+        return conn
+
+    def _discard(self, conn) -> None:
+        self._created_at.pop(id(conn), None)
+        self._stats["connections_discarded"] += 1
+        try:
+            if not conn.closed:
+                conn.close()
+        except Exception:
+            pass
+
+    def _size(self) -> int:
+        return len(self._idle) + len(self._in_use)
+
+    def _is_usable(self, conn, last_used: float, now: float) -> bool:
+        """Decide whether an idle connection may be handed out (cheap checks, no I/O)."""
+        if conn.closed:
+            return False
+        if now - last_used > self.max_idle:
+            return False
+        if now - self._created_at.get(id(conn), now) > self.max_lifetime:
+            return False
+        return True
+
+    def _ping(self, conn) -> bool:
+        """Round-trip health check; called without holding the pool lock."""
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self, timeout: Optional[float] = None):
+        """
+        Check a connection out of the pool
+        Args:
+            timeout: Seconds to wait for a free slot; defaults to checkout_timeout
+        Returns:
+            psycopg2 connection that must be handed back with putconn()
+        """
+        timeout = self.checkout_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("Connection pool is closed")
+
+                now = time.monotonic()
+                while self._idle:
+                    conn, last_used = self._idle.pop()
+                    if not self._is_usable(conn, last_used, now):
+                        self._discard(conn)
+                        continue
+                    if now - last_used <= self.health_check_after:
+                        return self._checkout(conn, start, waited)
+                    # Ping without the lock so a slow socket cannot stall every other caller;
+                    # the connection stays counted as in use meanwhile
+                    self._in_use.add(id(conn))
+                    self._cond.release()
+                    try:
+                        healthy = self._ping(conn)
+                    finally:
+                        self._cond.acquire()
+                        self._in_use.discard(id(conn))
+                    if healthy:
+                        return self._checkout(conn, start, waited)
+                    self._stats["failed_health_checks"] += 1
+                    self._discard(conn)
+                    self._cond.notify()
+                    now = time.monotonic()
+
+                if self._size() < self.maxconn:
+                    # Reserve the slot before connecting so concurrent callers respect maxconn.
+                    placeholder = object()
+                    self._in_use.add(id(placeholder))
+                    self._cond.release()
+                    connected = False
+                    try:
+                        conn = self._connect()
+                        connected = True
+                    finally:
+                        self._cond.acquire()
+                        self._in_use.discard(id(placeholder))
+                        if not connected:
+                            # The reserved slot is free again; let a waiter have it
+                            self._cond.notify()
+                    self._created_at[id(conn)] = time.monotonic()
+                    self._stats["connections_created"] += 1
+                    return self._checkout(conn, start, waited)
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeoutError(
+                        f"Timed out after {timeout:.1f}s waiting for a database connection "
+                        f"({len(self._in_use)}/{self.maxconn} in use)"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+    def _checkout(self, conn, start: float, waited: bool):
+        wait_time = time.monotonic() - start
+        self._in_use.add(id(conn))
+        self._stats["checkouts"] += 1
+        self._stats["total_wait_time"] += wait_time
+        self._stats["max_wait_time"] = max(self._stats["max_wait_time"], wait_time)
+        if waited:
+            self._stats["waits"] += 1
+        return conn
+
+    def putconn(self, conn, discard: bool = False) -> None:
+        """
+        Return a connection to the pool
+        Args:
+            conn: Connection previously obtained from getconn()
+            discard: Close the connection instead of keeping it idle
+        """
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            self._in_use.discard(id(conn))
+            now = time.monotonic()
+            too_old = now - self._created_at.get(id(conn), now) > self.max_lifetime
+            if discard or conn.closed or self._closed or too_old:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, now))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """
+        Borrow a connection for the duration of a with-block.
+
+        Example:
+        with pool.connection() as conn:
+            fetch_data(conn, 'leads')
+        """
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            self.putconn(conn, discard=True)
+            raise
+        except BaseException:
+            self.putconn(conn)
+            raise
+        else:
+            self.putconn(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of pool usage, for sizing maxconn per worker
+        Returns:
+            Dictionary with in-use/idle counts and checkout wait statistics
+        """
+        with self._cond:
+            checkouts = self._stats["checkouts"]
+            return {
+                "pid": os.getpid(),
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "size": self._size(),
+                "minconn": self.minconn,
+                "maxconn": self.maxconn,
+                "avg_wait_time": self._stats["total_wait_time"] / checkouts if checkouts else 0.0,
+                **self._stats,
+            }
+
+    def closeall(self) -> None:
+        """Close every idle connection and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+            self._cond.notify_all()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Return the process-wide pool, creating it on first use.
+
+    The pool is rebuilt after a fork so every gunicorn worker owns its own
+    sockets. Sizing is read from DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT,
+    DB_POOL_MAX_IDLE and DB_POOL_MAX_LIFETIME.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = ConnectionPool(
+                connection_params_from_url(),
+                minconn=int(os.getenv("DB_POOL_MIN", "1")),
+                maxconn=int(os.getenv("DB_POOL_MAX", "10")),
+                checkout_timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+                max_idle=float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+                max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", "3600")),
+            )
+            _pool_pid = pid
+    return _pool
+
+
+@contextmanager
+def pooled_connection(timeout: Optional[float] = None):
+    """
+    Borrow a connection from the shared pool.
+
+    Example:
+    with pooled_connection() as conn:
+        insert_data(conn, 'leads', {...})
+    """
+    with get_pool().connection(timeout) as conn:
+        yield conn
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Usage statistics of the shared pool for this process."""
+    return get_pool().stats()
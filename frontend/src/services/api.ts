@@ -47,7 +47,47 @@ export interface ContactRequest {
 
 export interface SearchRequest {
   query: string;
+  queries?: string[];
   limit?: number;
+  rankBy?: 'fans' | 'hearts' | 'avg_plays' | 'median_plays' | 'engagement_rate' | 'comment_rate' | 'shares_per_video';
+  forceRefresh?: boolean;
+}
+
+export interface SearchJob {
+  id: string;
+  status: 'queued' | 'running' | 'completed' | 'failed';
+  query: string;
+  top_k: number;
+  progress: number;
+  message?: string;
+  result?: any[] | null;
+  error?: string | null;
+  created_at?: string;
+  updated_at?: string;
+}
+
+export interface SearchJobSubmission {
+  jobId: string;
+  status: string;
+  statusUrl: string;
+  eventsUrl: string;
+}
+
+export interface InfluencerPageParams {
+  after?: string | null;
+  limit?: number;
+  fields?: (keyof Influencer)[];
+  sort?: string;
+  platform?: string;
+  leadStage?: string;
+  minFollowers?: number;
+  maxFollowers?: number;
+}
+
+export interface InfluencerPage {
+  items: Influencer[];
+  nextCursor: string | null;
+  limit: number;
 }
 
 /**
@@ -89,12 +129,47 @@ async function apiRequest<T>(
  * API functions for influencers
  */
 export const influencersApi = {
-  getAll: (): Promise<Influencer[]> => {
-    return apiRequest<Influencer[]>('/influencers');
+  getPage: (params: InfluencerPageParams = {}): Promise<InfluencerPage> => {
+    const query = new URLSearchParams();
+    Object.entries(params).forEach(([key, value]) => {
+      if (value === undefined || value === null || value === '') return;
+      query.set(key, Array.isArray(value) ? value.join(',') : String(value));
+    });
+    const qs = query.toString();
+    return apiRequest<InfluencerPage>(`/influencers${qs ? `?${qs}` : ''}`);
+  },
+
+  getAll: async (params: Omit<InfluencerPageParams, 'after'> = {}): Promise<Influencer[]> => {
+    const influencers: Influencer[] = [];
+    let after: string | null = null;
+    do {
+      const page: InfluencerPage = await influencersApi.getPage({ ...params, after });
+      influencers.push(...page.items);
+      after = page.nextCursor;
+    } while (after);
+    return influencers;
   },
   
-  search: (searchParams: SearchRequest): Promise<Influencer[]> => {
-    return apiRequest<Influencer[]>('/influencers/search', 'POST', searchParams);
+  submitSearch: (searchParams: SearchRequest): Promise<SearchJobSubmission> => {
+    return apiRequest<SearchJobSubmission>('/influencers/search', 'POST', searchParams);
+  },
+
+  /**
+   * Submit a search job and poll it until it finishes, reporting progress along the way
+   */
+  search: async (
+    searchParams: SearchRequest,
+    onProgress?: (job: SearchJob) => void,
+    pollIntervalMs = 2000
+  ): Promise<any[]> => {
+    const { jobId } = await influencersApi.submitSearch(searchParams);
+    for (;;) {
+      const job = await jobsApi.get(jobId);
+      onProgress?.(job);
+      if (job.status === 'completed') return job.result ?? [];
+      if (job.status === 'failed') throw new Error(job.error || 'Search failed');
+      await new Promise((resolve) => setTimeout(resolve, pollIntervalMs));
+    }
   },
   
   contact: (contactRequest: ContactRequest): Promise<{success: boolean, message: string}> => {
@@ -102,6 +177,26 @@ export const influencersApi = {
   },
 };
 
+/**
+ * API functions for background search jobs
+ */
+export const jobsApi = {
+  get: (jobId: string): Promise<SearchJob> => {
+    return apiRequest<SearchJob>(`/jobs/${jobId}`);
+  },
+
+  /**
+   * Subscribe to Server-Sent Events for a job; returns a function that closes the stream
+   */
+  subscribe: (jobId: string, onProgress: (job: SearchJob) => void): (() => void) => {
+    const source = new EventSource(`${API_BASE_URL}/jobs/${jobId}/events`);
+    source.addEventListener('progress', (event) => onProgress(JSON.parse((event as MessageEvent).data)));
+    source.addEventListener('done', () => source.close());
+    source.addEventListener('error', () => source.close());
+    return () => source.close();
+  },
+};
+
 /**
  * API functions for client briefs
  */
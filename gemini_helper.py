@@ -1,41 +1,156 @@
-import google.generativeai as genai
 from typing import Optional, Dict, Any, List
 import os
+import re
+import json
+import threading
 from PIL import Image
+from gemini_registry import configure, get_model, list_models
+from llm_cache import get_llm_cache, make_llm_key
+from gemini_limiter import call_gemini
+
+STRUCTURED_MODEL_NAME = 'models/gemini-2.0-flash'
+
+# Type names used in output_structure specs, mapped to Gemini schema types
+SCHEMA_TYPES = {
+    "str": "STRING", "string": "STRING",
+    "int": "INTEGER", "integer": "INTEGER",
+    "float": "NUMBER", "number": "NUMBER",
+    "bool": "BOOLEAN", "boolean": "BOOLEAN",
+    "list": "ARRAY", "array": "ARRAY",
+}
+JSON_TYPES = {
+    "STRING": str, "INTEGER": int, "NUMBER": (int, float), "BOOLEAN": bool,
+    "ARRAY": list, "OBJECT": dict,
+}
+CODE_FENCE = re.compile(r"^\s*```(?:json)?\s*(.*?)\s*```\s*$", re.DOTALL)
+
+_structured_stats = {}
+_structured_stats_lock = threading.Lock()
+
+def structure_to_schema(structure: Any) -> Dict[str, Any]:
+    """
+    Convert an output_structure spec into a Gemini response schema
+    Args:
+        structure: Nested dict of field names to type names ("str", "list", ...),
+            a one-element list for typed arrays, or a type name
+    Returns:
+        Schema dictionary usable as generation_config["response_schema"]
+    """
+    if isinstance(structure, dict):
+        return {
+            "type": "OBJECT",
+            "properties": {key: structure_to_schema(value) for key, value in structure.items()},
+            "required": list(structure.keys()),
+        }
+    if isinstance(structure, list):
+        return {"type": "ARRAY", "items": structure_to_schema(structure[0] if structure else "str")}
+    schema_type = SCHEMA_TYPES.get(str(structure).lower(), "STRING")
+    if schema_type == "ARRAY":
+        # Untyped lists hold strings
+        return {"type": "ARRAY", "items": {"type": "STRING"}}
+    return {"type": schema_type}
+
+def validate_schema(value: Any, schema: Dict[str, Any], path: str = "$") -> List[str]:
+    """
+    Check a decoded value against a schema from structure_to_schema
+    Args:
+        value: Decoded JSON value
+        schema: Schema dictionary
+        path: Location reported in error messages
+    Returns:
+        List of validation errors; empty when the value matches
+    """
+    if value is None and schema.get("nullable"):
+        return []
+    expected = JSON_TYPES[schema["type"]]
+    if not isinstance(value, expected) or (schema["type"] in ("INTEGER", "NUMBER") and isinstance(value, bool)):
+        return [f"{path}: expected {schema['type'].lower()}, got {type(value).__name__}"]
+    errors = []
+    if schema["type"] == "OBJECT":
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}.{key}: missing")
+        for key, child in schema.get("properties", {}).items():
+            if key in value:
+                errors.extend(validate_schema(value[key], child, f"{path}.{key}"))
+    elif schema["type"] == "ARRAY":
+        for i, item in enumerate(value):
+            errors.extend(validate_schema(item, schema["items"], f"{path}[{i}]"))
+    return errors
+
+def parse_json_response(text: str) -> Any:
+    """Decode a model answer as JSON, tolerating a surrounding code fence."""
+    match = CODE_FENCE.match(text)
+    return json.loads(match.group(1) if match else text)
+
+def _record(call_site: str, **increments) -> None:
+    with _structured_stats_lock:
+        site = _structured_stats.setdefault(call_site, {
+            "calls": 0, "attempts": 0, "retries": 0, "parse_failures": 0,
+            "validation_failures": 0, "request_failures": 0, "failures": 0,
+        })
+        for key, amount in increments.items():
+            site[key] += amount
+
+def structured_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Per-call-site counters of structured_analysis
+    Returns:
+        Dictionary of call sites with attempt/retry/failure counts and their rates
+    """
+    with _structured_stats_lock:
+        stats = {}
+        for call_site, counters in _structured_stats.items():
+            attempts = counters["attempts"]
+            stats[call_site] = {
+                **counters,
+                "retries_per_call": counters["retries"] / counters["calls"] if counters["calls"] else 0.0,
+                "parse_failure_rate": counters["parse_failures"] / attempts if attempts else 0.0,
+                "validation_failure_rate": counters["validation_failures"] / attempts if attempts else 0.0,
+            }
+        return stats
 
 class GeminiHelper:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, show_models: bool = False):
         """
         Initialize the Gemini helper with your API key
         Args:
             api_key: Your Google API key for Gemini
+            show_models: Print the available models (an extra API call)
         """
         self.api_key = api_key
-        genai.configure(api_key=self.api_key)
-        
-        try:
-            # List available models
-            for m in genai.list_models():
-                print(f"Available model: {m.name}")
-        except Exception as e:
-            print(f"Error listing models: {str(e)}")
+        configure(self.api_key)
         
-        # Initialize models with Gemini 2.0 Flash
-        self.text_model = genai.GenerativeModel('models/gemini-2.0-flash')
+        if show_models:
+            try:
+                # List available models
+                for name in list_models():
+                    print(f"Available model: {name}")
+            except Exception as e:
+                print(f"Error listing models: {str(e)}")
+    
+    @property
+    def text_model(self):
+        """Shared Gemini 2.0 Flash handle, created on first use"""
+        return get_model('models/gemini-2.0-flash')
         
-    def generate_text(self, prompt: str, temperature: float = 0.7) -> str:
+    def generate_text(self, prompt: str, temperature: float = 0.7, cache: Optional[bool] = None) -> str:
         """
         Generate text using Gemini 2.0 Flash
         Args:
             prompt: The text prompt to generate from
             temperature: Controls randomness (0.0 to 1.0)
+            cache: Serve repeats from the response cache; defaults to on only at temperature 0
         Returns:
             Generated text response
         """
         try:
-            response = self.text_model.generate_content(
-                prompt,
-                generation_config={"temperature": temperature}
+            generation_config = {"temperature": temperature}
+            response = get_llm_cache().get_or_generate(
+                "generate_text",
+                make_llm_key('models/gemini-2.0-flash', prompt, generation_config),
+                lambda: call_gemini(self.text_model.generate_content, prompt, generation_config=generation_config).text,
+                enabled=temperature == 0 if cache is None else cache
             )
             return response.text
         except Exception as e:
@@ -52,7 +167,7 @@ class GeminiHelper:
         """
         try:
             image = Image.open(image_path)
-            response = self.text_model.generate_content([prompt, image])
+            response = call_gemini(self.text_model.generate_content, [prompt, image])
             return response.text
         except Exception as e:
             return f"Error analyzing image: {str(e)}"
@@ -70,39 +185,76 @@ class GeminiHelper:
             
             for message in messages:
                 if message['role'] == 'user':
-                    response = chat.send_message(message['content'])
+                    response = call_gemini(chat.send_message, message['content'])
             
             return response.text
         except Exception as e:
             return f"Error in chat conversation: {str(e)}"
 
-    def structured_analysis(self, prompt: str, output_structure: Dict[str, Any]) -> Dict[str, Any]:
+    def structured_analysis(self, prompt: str, output_structure: Dict[str, Any],
+                            call_site: str = "structured_analysis", max_retries: int = 2) -> Dict[str, Any]:
         """
         Get structured analysis from Gemini
         Args:
             prompt: The analysis prompt
             output_structure: Dictionary defining the expected output structure
+            call_site: Name the parse/retry counters are reported under
+            max_retries: Repair requests allowed after an invalid answer
         Returns:
-            Structured response matching the output_structure
+            Structured response matching the output_structure, or {"error": ...}
         """
-        try:
-            # Create a prompt that requests structured output
-            structured_prompt = f"""
+        schema = structure_to_schema(output_structure)
+        # The model is constrained to the schema; the answer is still parsed and validated
+        model = get_model(STRUCTURED_MODEL_NAME, generation_config={
+            "response_mime_type": "application/json",
+            "response_schema": schema,
+        })
+        request = f"""
             Please analyze the following and provide output in the exact structure specified:
             {prompt}
+            """
+        _record(call_site, calls=1)
+        
+        error = None
+        for attempt in range(max_retries + 1):
+            if attempt:
+                _record(call_site, retries=1)
+            _record(call_site, attempts=1)
+            try:
+                response = call_gemini(model.generate_content, request)
+            except Exception as e:
+                _record(call_site, request_failures=1)
+                error = str(e)
+                continue
             
-            Required output structure:
-            {output_structure}
+            # .text raises ValueError for a blocked or empty candidate; read it once, guarded
+            answer_text = ""
+            try:
+                answer_text = response.text
+                result = parse_json_response(answer_text)
+            except ValueError as e:
+                _record(call_site, parse_failures=1)
+                error = f"Invalid JSON: {str(e)}" if answer_text else f"Empty or blocked answer: {str(e)}"
+            else:
+                problems = validate_schema(result, schema)
+                if not problems:
+                    return result
+                _record(call_site, validation_failures=1)
+                error = "Schema mismatch: " + "; ".join(problems[:10])
             
-            Provide the response in a way that can be parsed as a Python dictionary.
-            """
+            # Ask the model to repair its own answer rather than starting over
+            request = f"""
+            Your previous answer did not match the required JSON schema.
+            Problem: {error}
+            Previous answer:
+            {answer_text}
             
-            response = self.text_model.generate_content(structured_prompt)
-            # Note: You might need to add additional parsing logic here
-            # depending on how Gemini formats its response
-            return eval(response.text)
-        except Exception as e:
-            return {"error": str(e)}
+            Return only the corrected JSON for this request:
+            {prompt}
+            """
+        
+        _record(call_site, failures=1)
+        return {"error": error}
 
 # Example usage
 if __name__ == "__main__":
@@ -110,7 +262,7 @@ if __name__ == "__main__":
     
     if API_KEY:
         # Initialize the helper
-        gemini = GeminiHelper(API_KEY)
+        gemini = GeminiHelper(API_KEY, show_models=True)
         
         # Example text generation
         response = gemini.generate_text("Write a short poem about coding")
@@ -137,4 +289,5 @@ if __name__ == "__main__":
         "sentiment": "str"
     }
     response = gemini.structured_analysis("Analyze the impact of AI on healthcare", structure)
-    print("Structured Analysis:", response) 
\ No newline at end of file
+    print("Structured Analysis:", response)
+    print("Structured Output Stats:", structured_stats()) 
\ No newline at end of file
@@ -0,0 +1,372 @@
+"""
+Rate-limited asyncio execution layer for Gemini requests.
+
+Every Gemini call is submitted here instead of being made inline. A
+scheduler coroutine on a dedicated event loop releases requests only when
+both the requests-per-minute and the tokens-per-minute sliding windows allow it,
+keeps at most `concurrency` requests in flight, and always serves the
+interactive lane before the bulk lane. The blocking SDK calls run on a
+worker pool sized to the concurrency limit. Synchronous code uses call();
+bulk work submits everything at once with run_many() and lets the limiter
+pace it.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+INTERACTIVE = 0
+BULK = 1
+LANES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+DEFAULT_OUTPUT_TOKENS = 512
+
+
+def estimate_tokens(text: Any, output_tokens: int = DEFAULT_OUTPUT_TOKENS) -> int:
+    """
+    Rough token cost of a request (about four characters per token) plus its expected output
+    Args:
+        text: Prompt text, or a list of prompt parts
+        output_tokens: Tokens reserved for the response
+    Returns:
+        Estimated total tokens
+    """
+    if isinstance(text, (list, tuple)):
+        chars = sum(len(part) for part in text if isinstance(part, str))
+    else:
+        chars = len(str(text))
+    return chars // 4 + 1 + output_tokens
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True for quota (429) and overload (503) errors worth retrying after a pause."""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if code in (429, 503):
+        return True
+    return type(error).__name__ in ("ResourceExhausted", "TooManyRequests", "ServiceUnavailable")
+
+
+class SlidingWindow:
+    """
+    Quota of `limit` units per rolling `window` seconds.
+
+    Every grant is remembered until it leaves the window, so no 60-second span
+    ever admits more than the quota (a refilling bucket with a full-minute burst
+    admits up to twice that).
+    """
+
+    def __init__(self, limit: float, window: float = 60.0):
+        """
+        Create an empty window
+        Args:
+            limit: Units allowed in any window
+            window: Window length in seconds
+        """
+        self.limit = limit
+        self.window = window
+        self._grants = deque()     # [granted_at, amount], oldest first
+        self._used = 0.0
+        # stats() reads the window from other threads
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        while self._grants and now - self._grants[0][0] >= self.window:
+            self._used -= self._grants.popleft()[1]
+
+    @property
+    def remaining(self) -> float:
+        """Units still available in the current window."""
+        with self._lock:
+            self._expire(time.monotonic())
+            return self.limit - self._used
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units fit in the window (0 if they do now)."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            # A request larger than the whole quota waits for an empty window
+            amount = min(amount, self.limit)
+            excess = self._used + amount - self.limit
+            if excess <= 0:
+                return 0.0
+            for granted_at, granted in self._grants:
+                excess -= granted
+                if excess <= 0:
+                    return granted_at + self.window - now
+        return self.window
+
+    def take(self, amount: float) -> list:
+        """
+        Record a grant
+        Returns:
+            Grant handle for settle()
+        """
+        grant = [time.monotonic(), amount]
+        with self._lock:
+            self._grants.append(grant)
+            self._used += amount
+        return grant
+
+    def settle(self, grant: list, actual: float) -> None:
+        """Replace a grant's estimate with the actual amount, if it is still in the window."""
+        with self._lock:
+            if any(entry is grant for entry in self._grants):
+                self._used += actual - grant[1]
+                grant[1] = actual
+
+
+class _Job:
+    __slots__ = ("priority", "sequence", "fn", "tokens", "future", "attempts", "enqueued_at", "grant")
+
+    def __init__(self, priority, sequence, fn, tokens, future):
+        self.priority = priority
+        self.sequence = sequence
+        self.fn = fn
+        self.tokens = tokens
+        self.future = future
+        self.attempts = 0
+        self.enqueued_at = time.monotonic()
+        self.grant = None
+
+    def __lt__(self, other):
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+class GeminiExecutor:
+    """Shared RPM/TPM-limited, priority-aware executor of Gemini calls."""
+
+    def __init__(self, requests_per_minute: float = 60, tokens_per_minute: float = 1_000_000,
+                 concurrency: int = 8, max_retries: int = 3, retry_base_delay: float = 2.0):
+        """
+        Start the executor's event loop thread
+        Args:
+            requests_per_minute: Request quota
+            tokens_per_minute: Token quota (input plus output)
+            concurrency: Requests in flight at once
+            max_retries: Retries of a request rejected with 429/503
+            retry_base_delay: First backoff in seconds; doubles per retry, with jitter
+        """
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self._requests = SlidingWindow(requests_per_minute)
+        self._tokens = SlidingWindow(tokens_per_minute)
+        self._heap = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="gemini")
+        self._stats = {
+            "submitted": 0, "completed": 0, "failed": 0, "rate_limited": 0,
+            "tokens_estimated": 0, "tokens_used": 0,
+            "queue_wait_seconds": {name: 0.0 for name in LANES.values()},
+            "started": {name: 0 for name in LANES.values()},
+        }
+
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, name="gemini-limiter", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._loop.create_task(self._schedule())
+        self._ready.set()
+        self._loop.run_forever()
+
+    def _enqueue(self, job: _Job) -> None:
+        heapq.heappush(self._heap, job)
+        self._wakeup.set()
+
+    async def _schedule(self) -> None:
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self._slots.acquire()
+            while True:
+                # Re-check the head each time: a more urgent job may have arrived meanwhile
+                job = self._heap[0]
+                wait = max(
+                    self._requests.wait_time(1),
+                    self._tokens.wait_time(job.tokens),
+                    self._paused_until - time.monotonic(),
+                )
+                if wait <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+            heapq.heappop(self._heap)
+            self._requests.take(1)
+            job.grant = self._tokens.take(job.tokens)
+            lane = LANES[job.priority]
+            self._stats["started"][lane] += 1
+            self._stats["queue_wait_seconds"][lane] += time.monotonic() - job.enqueued_at
+            self._loop.create_task(self._execute(job))
+
+    async def _execute(self, job: _Job) -> None:
+        try:
+            result = await self._loop.run_in_executor(self._pool, job.fn)
+        except Exception as error:
+            if is_rate_limit_error(error) and job.attempts < self.max_retries:
+                job.attempts += 1
+                self._stats["rate_limited"] += 1
+                delay = self.retry_base_delay * (2 ** (job.attempts - 1)) * random.uniform(0.5, 1.5)
+                # The quota is shared, so hold back every request, not just this one
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                job.enqueued_at = time.monotonic()
+                self._enqueue(job)
+            else:
+                self._stats["failed"] += 1
+                if not job.future.done():
+                    job.future.set_exception(error)
+        else:
+            used = self._usage_tokens(result)
+            if used is not None:
+                # Replace the estimate with what the API reports
+                self._tokens.settle(job.grant, used)
+                self._stats["tokens_used"] += used
+            self._stats["completed"] += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _usage_tokens(result: Any) -> Optional[int]:
+        usage = getattr(result, "usage_metadata", None)
+        total = getattr(usage, "total_token_count", None)
+        return total if isinstance(total, int) else None
+
+    async def _submit(self, fn: Callable[[], Any], priority: int, tokens: int) -> Any:
+        future = self._loop.create_future()
+        self._stats["submitted"] += 1
+        self._stats["tokens_estimated"] += tokens
+        self._enqueue(_Job(priority, next(self._sequence), fn, tokens, future))
+        return await future
+
+    def submit(self, fn: Callable, *args, priority: int = INTERACTIVE, tokens: Optional[int] = None,
+               **kwargs):
+        """
+        Queue one call without waiting for it
+        Args:
+            fn: Blocking SDK call, e.g. model.generate_content
+            *args: Positional arguments for fn
+            priority: INTERACTIVE or BULK
+            tokens: Estimated tokens; defaults to an estimate from the first argument
+            **kwargs: Keyword arguments for fn
+        Returns:
+            concurrent.futures.Future with the call's result
+        """
+        if tokens is None:
+            tokens = estimate_tokens(args[0] if args else "")
+        return asyncio.run_coroutine_threadsafe(
+            self._submit(partial(fn, *args, **kwargs), priority, tokens), self._loop
+        )
+
+    def call(self, fn: Callable, *args, priority: int = INTERACTIVE, tokens: Optional[int] = None,
+             **kwargs) -> Any:
+        """
+        Make one call through the limiter and wait for its result
+        Args:
+            fn: Blocking SDK call, e.g. model.generate_content
+            *args: Positional arguments for fn
+            priority: INTERACTIVE or BULK
+            tokens: Estimated tokens; defaults to an estimate from the first argument
+            **kwargs: Keyword arguments for fn
+        Returns:
+            Whatever fn returns
+        """
+        return self.submit(fn, *args, priority=priority, tokens=tokens, **kwargs).result()
+
+    async def acall(self, fn: Callable, *args, priority: int = INTERACTIVE, tokens: Optional[int] = None,
+                    **kwargs) -> Any:
+        """Awaitable form of call() for code running on its own event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args, priority=priority, tokens=tokens, **kwargs))
+
+    def run_many(self, calls: Sequence[Tuple[Callable, tuple, Dict[str, Any]]], priority: int = BULK,
+                 tokens: Optional[Sequence[int]] = None) -> List[Any]:
+        """
+        Submit many calls at once and wait for all of them
+        Args:
+            calls: (fn, args, kwargs) tuples
+            priority: Lane for all calls (BULK by default)
+            tokens: Optional per-call token estimates
+        Returns:
+            Results in input order; a failed call yields its exception instead of raising
+        """
+        futures = [
+            self.submit(fn, *args, priority=priority,
+                        tokens=tokens[i] if tokens is not None else None, **kwargs)
+            for i, (fn, args, kwargs) in enumerate(calls)
+        ]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as error:
+                results.append(error)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Throughput and queueing counters
+        Returns:
+            Dictionary with request counts, token accounting, queue depth per lane and remaining window quotas
+        """
+        queued = {name: 0 for name in LANES.values()}
+        for job in list(self._heap):
+            queued[LANES[job.priority]] += 1
+        return {
+            **self._stats,
+            "queued": queued,
+            "request_budget": round(self._requests.remaining, 2),
+            "token_budget": round(self._tokens.remaining, 2),
+            "concurrency": self.concurrency,
+        }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> GeminiExecutor:
+    """
+    Return the process-wide executor, configured from GEMINI_RPM, GEMINI_TPM,
+    GEMINI_CONCURRENCY and GEMINI_MAX_RETRIES.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = GeminiExecutor(
+                    requests_per_minute=float(os.getenv("GEMINI_RPM", "60")),
+                    tokens_per_minute=float(os.getenv("GEMINI_TPM", "1000000")),
+                    concurrency=int(os.getenv("GEMINI_CONCURRENCY", "8")),
+                    max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "3")),
+                )
+    return _executor
+
+
+def call_gemini(fn: Callable, *args, priority: int = INTERACTIVE, tokens: Optional[int] = None, **kwargs) -> Any:
+    """Shortcut for get_executor().call(...)."""
+    return get_executor().call(fn, *args, priority=priority, tokens=tokens, **kwargs)
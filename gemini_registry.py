@@ -0,0 +1,177 @@
+"""
+Process-wide registry of Gemini clients and model handles.
+
+Everything that talks to Gemini goes through here instead of configuring the
+SDK or building GenerativeModel / genai.Client objects itself. Handles are
+created lazily on first use and then reused, so the HTTP connections behind
+them are reused too. Model handles are cached per (model, tools, config);
+handles whose tools are bound methods belong to one instance and are built
+uncached, for that instance to keep.
+Listing the available models is a network call and only happens when
+list_models() is called explicitly.
+"""
+
+import inspect
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import google.generativeai as genai
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+_lock = threading.RLock()
+_configured_key = None
+_models = {}
+_clients = {}
+_available_models = None
+_stats = {"model_hits": 0, "model_misses": 0, "model_uncached": 0, "client_hits": 0, "client_misses": 0}
+
+
+def _api_key(api_key: Optional[str]) -> str:
+    api_key = api_key or _configured_key or os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("No Gemini API key provided. Set GEMINI_API_KEY in .env file or pass as parameter.")
+    return api_key
+
+
+def _freeze(value: Any) -> Any:
+    """Hashable, order-independent form of a config value."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, set):
+        return tuple(sorted(_freeze(item) for item in value))
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+
+def _tool_key(tool: Any) -> Any:
+    name = getattr(tool, "__qualname__", None) or getattr(tool, "__name__", None)
+    if name is None:
+        return _freeze(tool)
+    return (getattr(tool, "__module__", None), name)
+
+
+def configure(api_key: Optional[str] = None) -> None:
+    """
+    Configure the google.generativeai SDK once per API key
+    Args:
+        api_key: Gemini API key; defaults to GEMINI_API_KEY
+    """
+    global _configured_key
+    api_key = _api_key(api_key)
+    with _lock:
+        if api_key == _configured_key:
+            return
+        genai.configure(api_key=api_key)
+        _configured_key = api_key
+        # Handles created under another key must not be reused
+        _models.clear()
+
+
+def get_model(model_name: str = DEFAULT_MODEL,
+              tools: Optional[Sequence[Any]] = None,
+              generation_config: Optional[Dict[str, Any]] = None,
+              **model_kwargs) -> genai.GenerativeModel:
+    """
+    Shared GenerativeModel handle for a (model, tools, config) combination
+    Args:
+        model_name: Model to use
+        tools: Functions exposed to the model for function calling
+        generation_config: Default generation config of the handle
+        **model_kwargs: Any other GenerativeModel argument (system_instruction, ...)
+    Returns:
+        Cached GenerativeModel, created on first request. If any tool is a bound
+        method the handle is new and not cached: caching it would keep the instance
+        alive for the life of the process, so the caller should hold on to it instead
+    """
+    if any(inspect.ismethod(tool) for tool in tools or ()):
+        with _lock:
+            if _configured_key is None:
+                configure()
+            _stats["model_uncached"] += 1
+        return genai.GenerativeModel(
+            model_name,
+            tools=list(tools),
+            generation_config=generation_config,
+            **model_kwargs
+        )
+
+    key = (
+        model_name,
+        tuple(_tool_key(tool) for tool in tools or ()),
+        _freeze(generation_config),
+        _freeze(model_kwargs),
+    )
+    with _lock:
+        model = _models.get(key)
+        if model is not None:
+            _stats["model_hits"] += 1
+            return model
+        if _configured_key is None:
+            configure()
+        _stats["model_misses"] += 1
+        model = genai.GenerativeModel(
+            model_name,
+            tools=list(tools) if tools else None,
+            generation_config=generation_config,
+            **model_kwargs
+        )
+        _models[key] = model
+        return model
+
+
+def get_client(api_key: Optional[str] = None):
+    """
+    Shared google.genai Client, one per API key
+    Args:
+        api_key: Gemini API key; defaults to GEMINI_API_KEY
+    Returns:
+        Cached genai.Client
+    """
+    api_key = _api_key(api_key)
+    with _lock:
+        client = _clients.get(api_key)
+        if client is not None:
+            _stats["client_hits"] += 1
+            return client
+        from google import genai as genai_client
+        _stats["client_misses"] += 1
+        client = genai_client.Client(api_key=api_key)
+        _clients[api_key] = client
+        return client
+
+
+def list_models(refresh: bool = False) -> List[str]:
+    """
+    Names of the models available to the configured key (a network call, cached)
+    Args:
+        refresh: Query the API again instead of returning the cached list
+    Returns:
+        List of model names
+    """
+    global _available_models
+    with _lock:
+        if _available_models is None or refresh:
+            if _configured_key is None:
+                configure()
+            _available_models = [m.name for m in genai.list_models()]
+        return list(_available_models)
+
+
+def registry_stats() -> Dict[str, Any]:
+    """
+    Cache counters of the registry
+    Returns:
+        Dictionary with hit/miss counts and the number of live handles
+    """
+    with _lock:
+        return {**_stats, "models": len(_models), "clients": len(_clients)}
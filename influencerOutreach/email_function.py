@@ -1,7 +1,12 @@
 import os
+import json
+import time
+import threading
 import requests
 import logging
-from typing import Optional
+from email.utils import parseaddr
+from typing import Any, Dict, List, Optional
+from requests.adapters import HTTPAdapter
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -17,9 +22,48 @@ MAILGUN_API_KEY = os.getenv('MAILGUN_API_KEY')
 DEFAULT_RECIPIENT = "Zhang Yifan Jem <zhangjem321@gmail.com>"
 DEFAULT_SUBJECT = "Message from LeadFetch Influencer Agent"
 DEFAULT_FROM_EMAIL = "Mailgun Sandbox <postmaster@sandbox405609ba02c346768e9e41e94625d494.mailgun.org>"
-MAILGUN_DOMAIN = "sandbox405609ba02c346768e9e41e94625d494.mailgun.org"
+MAILGUN_DOMAIN = os.getenv('MAILGUN_DOMAIN', "sandbox405609ba02c346768e9e41e94625d494.mailgun.org")
+# Point at a local stand-in of the Mailgun API (e.g. http://127.0.0.1:8025/v3) for testing
+MAILGUN_API_BASE = os.getenv('MAILGUN_API_BASE', "https://api.mailgun.net/v3").rstrip("/")
+# Mailgun's limit on recipients per batch call
+MAX_BATCH_RECIPIENTS = 1000
+# (connect, read) seconds, so a stalled Mailgun call cannot hold a dispatcher worker forever
+MAILGUN_TIMEOUT = (
+    float(os.getenv('MAILGUN_CONNECT_TIMEOUT', '5')),
+    float(os.getenv('MAILGUN_READ_TIMEOUT', '30'))
+)
 
-def send_simple_message(message: str, recipient: Optional[str] = None, subject: Optional[str] = None, from_email: Optional[str] = None):
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Return the process-wide Mailgun session.
+
+    Connections are kept alive and pooled, so consecutive sends reuse the same
+    TLS connection instead of paying a handshake each time.
+
+    Returns:
+        Shared requests.Session
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                pool_size = int(os.getenv('MAILGUN_POOL_SIZE', '10'))
+                session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+                session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+                _session = session
+    return _session
+
+
+def _messages_url() -> str:
+    return f"{MAILGUN_API_BASE}/{MAILGUN_DOMAIN}/messages"
+
+def send_simple_message(message: str, recipient: Optional[str] = None, subject: Optional[str] = None, from_email: Optional[str] = None,
+                        raise_errors: bool = False):
     """
     Send an email message using Mailgun API.
     
@@ -28,19 +72,20 @@ def send_simple_message(message: str, recipient: Optional[str] = None, subject:
         recipient: The recipient email address (optional)
         subject: The email subject (optional)
         from_email: The sender email address (optional)
+        raise_errors: Re-raise transport errors (connection failures, timeouts) instead of returning None
     
     Returns:
         Response object from the API request
     """
-    if (MAILGUN_API_KEY == ''):
+    if not MAILGUN_API_KEY:
         logger.error("MAILGUN_API_KEY is not set")
         print("MAILGUN_API_KEY is not set")
         return None
         
     # Use provided values or defaults
-    to_email = DEFAULT_RECIPIENT
-    email_subject = DEFAULT_SUBJECT
-    sender = DEFAULT_FROM_EMAIL
+    to_email = recipient or DEFAULT_RECIPIENT
+    email_subject = subject or DEFAULT_SUBJECT
+    sender = from_email or DEFAULT_FROM_EMAIL
     
     data = {
         "from": sender,
@@ -52,17 +97,125 @@ def send_simple_message(message: str, recipient: Optional[str] = None, subject:
     logger.info(f"Sending email with following payload: {data}")
     
     try:
-        response = requests.post(
-            f"https://api.mailgun.net/v3/{MAILGUN_DOMAIN}/messages",
+        response = get_session().post(
+            _messages_url(),
             auth=("api", MAILGUN_API_KEY),
-            data=data
+            data=data,
+            timeout=MAILGUN_TIMEOUT
         )
         logger.info(f"Email sent with response: {response}")
         return response
     except Exception as e:
         logger.error(f"Error sending email: {str(e)}")
+        if raise_errors:
+            raise
         return None
 
+
+def _batch_groups(messages: List[Dict[str, Any]], batch_size: int) -> List[List[int]]:
+    """
+    Group message indexes into batch calls.
+
+    Messages can share a call only when their subject and body templates are
+    identical, and each recipient may appear once per call because
+    recipient-variables are keyed by address.
+    """
+    templates = {}
+    for index, message in enumerate(messages):
+        templates.setdefault((message["subject"], message["body"]), []).append(index)
+
+    batches = []
+    for indexes in templates.values():
+        batch, addresses = [], set()
+        for index in indexes:
+            address = parseaddr(messages[index]["to"])[1].lower()
+            if len(batch) >= batch_size or address in addresses:
+                batches.append(batch)
+                batch, addresses = [], set()
+            batch.append(index)
+            addresses.add(address)
+        batches.append(batch)
+    return batches
+
+
+def send_batch_messages(messages: List[Dict[str, Any]], from_email: Optional[str] = None,
+                        batch_size: int = MAX_BATCH_RECIPIENTS) -> List[Dict[str, Any]]:
+    """
+    Send personalized messages using Mailgun batch sending.
+
+    Messages with the same subject and body template are sent in one API call
+    of up to batch_size recipients. Per-recipient values go into
+    recipient-variables and are substituted by Mailgun wherever the template
+    says %recipient.<name>%; every recipient still receives an individual email.
+    All calls share one keep-alive session.
+
+    Args:
+        messages: Dictionaries with to, subject and body, plus an optional
+            variables dictionary for the %recipient.<name>% placeholders
+        from_email: The sender email address (optional)
+        batch_size: Recipients per call, at most MAX_BATCH_RECIPIENTS
+
+    Returns:
+        One status dictionary per message, in input order, shaped like
+        send_email's result (status, message_id, recipient, timestamp, response_code,
+        and transport_error when the request never reached Mailgun; a read timeout
+        is not flagged because the batch may already have been accepted)
+    """
+    batch_size = max(1, min(batch_size, MAX_BATCH_RECIPIENTS))
+    results = [None] * len(messages)
+    timestamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+    for batch in _batch_groups(messages, batch_size):
+        first = messages[batch[0]]
+        recipient_variables = {
+            parseaddr(messages[index]["to"])[1]: messages[index].get("variables") or {}
+            for index in batch
+        }
+        data = {
+            "from": from_email or DEFAULT_FROM_EMAIL,
+            "to": [messages[index]["to"] for index in batch],
+            "subject": first["subject"],
+            "text": first["body"],
+            # Always sent, even when empty, so recipients never see each other
+            "recipient-variables": json.dumps(recipient_variables)
+        }
+
+        batch_result = {"status": "failed", "message_id": None, "response_code": None}
+        if not MAILGUN_API_KEY:
+            logger.error("MAILGUN_API_KEY is not set")
+            batch_result["reason"] = "MAILGUN_API_KEY is not set"
+        else:
+            try:
+                response = get_session().post(_messages_url(), auth=("api", MAILGUN_API_KEY), data=data,
+                                              timeout=MAILGUN_TIMEOUT)
+            except requests.exceptions.ReadTimeout as e:
+                # Mailgun may have accepted the batch already, so sending it again could deliver twice
+                logger.error(f"No response to batch of {len(batch)} emails: {str(e)}")
+                batch_result["reason"] = str(e)
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Error sending batch of {len(batch)} emails: {str(e)}")
+                batch_result["reason"] = str(e)
+                # No response at all, so the batch may succeed if sent again
+                batch_result["transport_error"] = True
+            else:
+                batch_result["response_code"] = response.status_code
+                if response.status_code == 200:
+                    batch_result["status"] = "sent"
+                    try:
+                        batch_result["message_id"] = response.json().get("id")
+                    except (ValueError, AttributeError):
+                        logger.warning(f"Batch accepted without a readable message id: {response.text[:200]}")
+                else:
+                    batch_result["reason"] = response.text[:500]
+                    if response.headers.get("Retry-After"):
+                        batch_result["retry_after"] = response.headers["Retry-After"]
+                logger.info(f"Batch of {len(batch)} emails sent with response: {response}")
+
+        for index in batch:
+            results[index] = {**batch_result, "recipient": messages[index]["to"], "timestamp": timestamp}
+
+    return results
+
 # Example code for testing - uncomment to run
 # if __name__ == "__main__":
 #     send_simple_message(
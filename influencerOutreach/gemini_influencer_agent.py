@@ -17,14 +17,18 @@ import sys
 # Add the parent directory to sys.path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-# Import Google Generative AI library
-import google.generativeai as genai
 from dotenv import load_dotenv
 
+# Shared Gemini model handles
+from gemini_registry import configure, get_model
+from llm_cache import get_llm_cache, make_llm_key
+from gemini_limiter import call_gemini, get_executor, estimate_tokens, BULK
+
 # Import utility functions
 from influencerOutreach.utils import setup_logging, convert_to_serializable
 # Import the email function
 from influencerOutreach.email_function import send_simple_message
+from influencerOutreach.outreach_dispatcher import OutreachDispatcher
 
 # Load environment variables from .env file
 load_dotenv()
@@ -33,6 +37,44 @@ load_dotenv()
 log_file_path = setup_logging()
 
 MODEL_NAME = "gemini-2.0-flash"
+ANALYSIS_MODEL_NAME = "gemini-1.5-flash"
+# Email analysis is run deterministically so repeated emails can be served from the response cache
+ANALYSIS_CONFIG = {"temperature": 0}
+
+# Batched email analysis: one JSON array entry per email, tagged with the email id
+SENTIMENTS = ["positive", "neutral", "negative"]
+ANALYSIS_KEYS = ["sentiment", "key_points", "requested_compensation", "timeline_mentioned", "questions_asked"]
+EMAIL_ANALYSIS_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "email_id": {"type": "STRING"},
+            "sentiment": {"type": "STRING", "enum": SENTIMENTS},
+            "key_points": {"type": "ARRAY", "items": {"type": "STRING"}},
+            "requested_compensation": {"type": "STRING", "nullable": True},
+            "timeline_mentioned": {"type": "STRING", "nullable": True},
+            "questions_asked": {"type": "ARRAY", "items": {"type": "STRING"}}
+        },
+        "required": ["email_id"] + ANALYSIS_KEYS
+    }
+}
+BATCH_ANALYSIS_CONFIG = {
+    "temperature": 0,
+    "response_mime_type": "application/json",
+    "response_schema": EMAIL_ANALYSIS_SCHEMA
+}
+BATCH_ANALYSIS_PROMPT = """Analyze each of the following email responses from influencers. For every email, extract:
+    1. Overall sentiment (positive, neutral, or negative)
+    2. Key points mentioned
+    3. Any requested compensation amounts
+    4. Any timeline mentioned
+    5. Any questions asked
+    
+    Return one array entry per email and copy its id into email_id.
+    
+    """
+EMAIL_OVERHEAD_TOKENS = 20
 
 # Mock functions for database and email operations
 def mock_query_database(query: str) -> List[Dict[str, Any]]:
@@ -192,20 +234,33 @@ def send_email(to: str, subject: str, body: str) -> Dict[str, Any]:
     logging.info(f"Body: {body}")
     
     # Use the improved send_simple_message function with all parameters
-    response = send_simple_message(
-        message=body,
-        recipient=to,
-        subject=subject
-    )
+    try:
+        response = send_simple_message(
+            message=body,
+            recipient=to,
+            subject=subject,
+            raise_errors=True
+        )
+    except Exception as e:
+        # No response at all: the outreach dispatcher retries these, unlike a missing API key
+        return {
+            "status": "failed",
+            "recipient": to,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "reason": str(e),
+            "transport_error": True
+        }
     
     # Return a standardized response format
     status_code = getattr(response, 'status_code', None)
     return {
-        "status": "sent" if response and status_code == 200 else "failed",
+        "status": "sent" if response is not None and status_code == 200 else "failed",
         "message_id": f"msg_{int(time.time())}",
         "recipient": to,
         "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-        "response_code": status_code
+        "response_code": status_code,
+        # Lets the outreach dispatcher honour Mailgun's throttling hint
+        "retry_after": response.headers.get("Retry-After") if response is not None else None
     }
 
 # Define the tools (functions) that will be available to the Gemini model
@@ -236,7 +291,7 @@ def analyze_email_response(email_body: str) -> str:
         JSON string with analysis results
     """
     # Use Gemini to analyze the email
-    model = genai.GenerativeModel("gemini-1.5-flash")
+    model = get_model(ANALYSIS_MODEL_NAME, generation_config=ANALYSIS_CONFIG)
     
     prompt = f"""Analyze the following email response from an influencer. Extract the following information:
     1. Overall sentiment (positive, neutral, or negative)
@@ -253,33 +308,130 @@ def analyze_email_response(email_body: str) -> str:
     {email_body}
     """
     
-    response = model.generate_content(prompt)
+    response = get_llm_cache().get_or_generate(
+        "analyze_email_response",
+        make_llm_key(ANALYSIS_MODEL_NAME, prompt, ANALYSIS_CONFIG),
+        lambda: call_gemini(model.generate_content, prompt).text
+    )
     
     try:
         # Try to parse the response as JSON
         analysis = json.loads(response.text)
     except json.JSONDecodeError:
         # If parsing fails, create a basic structure and extract what we can
-        analysis = {
-            "sentiment": "positive" if "interested" in email_body.lower() else "neutral",
-            "key_points": [],
-            "requested_compensation": None,
-            "timeline_mentioned": None,
-            "questions_asked": []
-        }
-        
-        # Extract some basic information
-        if "budget" in email_body.lower() or "$" in email_body:
-            analysis["key_points"].append("Discussed compensation")
-        if "call" in email_body.lower() or "meet" in email_body.lower():
-            analysis["key_points"].append("Requested meeting")
-        if "next week" in email_body.lower():
-            analysis["key_points"].append("Proposed timeline")
-            analysis["timeline_mentioned"] = "next week"
-        if "?" in email_body:
-            analysis["key_points"].append("Asked questions")
+        analysis = keyword_email_analysis(email_body)
     return json.dumps(analysis)
 
+def keyword_email_analysis(email_body: str) -> Dict[str, Any]:
+    """
+    Keyword-based analysis used when the model's answer cannot be parsed.
+    
+    Args:
+        email_body: The body text of the email
+        
+    Returns:
+        Dictionary with the same keys as the model analysis
+    """
+    analysis = {
+        "sentiment": "positive" if "interested" in email_body.lower() else "neutral",
+        "key_points": [],
+        "requested_compensation": None,
+        "timeline_mentioned": None,
+        "questions_asked": []
+    }
+    
+    # Extract some basic information
+    if "budget" in email_body.lower() or "$" in email_body:
+        analysis["key_points"].append("Discussed compensation")
+    if "call" in email_body.lower() or "meet" in email_body.lower():
+        analysis["key_points"].append("Requested meeting")
+    if "next week" in email_body.lower():
+        analysis["key_points"].append("Proposed timeline")
+        analysis["timeline_mentioned"] = "next week"
+    if "?" in email_body:
+        analysis["key_points"].append("Asked questions")
+    return analysis
+
+def _pack_email_batches(emails: List[Dict[str, Any]], batch_size: int, token_budget: int) -> List[List[Dict[str, Any]]]:
+    """Group emails so each batch stays within batch_size emails and token_budget prompt tokens."""
+    batches = []
+    current = []
+    current_tokens = estimate_tokens(BATCH_ANALYSIS_PROMPT, output_tokens=0)
+    for email in emails:
+        tokens = estimate_tokens(email["body"], output_tokens=0) + EMAIL_OVERHEAD_TOKENS
+        if current and (len(current) >= batch_size or current_tokens + tokens > token_budget):
+            batches.append(current)
+            current = []
+            current_tokens = estimate_tokens(BATCH_ANALYSIS_PROMPT, output_tokens=0)
+        current.append(email)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def _valid_analysis(item: Any) -> bool:
+    """Check that one batch result has every field with the expected type."""
+    return (
+        isinstance(item, dict)
+        and item.get("sentiment") in SENTIMENTS
+        and isinstance(item.get("key_points"), list)
+        and isinstance(item.get("questions_asked"), list)
+        and all(item.get(key) is None or isinstance(item.get(key), str)
+                for key in ("requested_compensation", "timeline_mentioned"))
+    )
+
+def analyze_email_responses(emails: List[Dict[str, Any]], batch_size: int = 20,
+                            token_budget: int = 8000) -> Dict[str, Dict[str, Any]]:
+    """
+    Analyze many influencer emails with as few Gemini requests as possible.
+    
+    Emails are packed into schema-constrained batch requests of at most batch_size
+    emails and roughly token_budget prompt tokens. Results are matched back by email
+    id; any email missing from or malformed in its batch's answer is re-analyzed on
+    its own with analyze_email_response, which keeps the keyword fallback.
+    
+    Args:
+        emails: Dictionaries with at least 'id' and 'body'
+        batch_size: Maximum emails per request
+        token_budget: Maximum estimated prompt tokens per request
+        
+    Returns:
+        Dictionary mapping each email id to its analysis
+    """
+    model = get_model(ANALYSIS_MODEL_NAME, generation_config=BATCH_ANALYSIS_CONFIG)
+    results = {}
+    retry = []
+    batches = _pack_email_batches(emails, batch_size, token_budget)
+    
+    for batch in batches:
+        prompt = BATCH_ANALYSIS_PROMPT + "\n".join(
+            f'<email id="{email["id"]}">\n{email["body"]}\n</email>' for email in batch
+        )
+        try:
+            answer = json.loads(call_gemini(model.generate_content, prompt, priority=BULK,
+                                            tokens=estimate_tokens(prompt, output_tokens=100 * len(batch))).text)
+            by_id = {str(item.get("email_id")): item for item in answer if isinstance(item, dict)}
+        except Exception as e:
+            logging.warning(f"⚠️ Batch analysis of {len(batch)} emails failed, retrying individually: {str(e)}")
+            by_id = {}
+        
+        for email in batch:
+            item = by_id.get(str(email["id"]))
+            if _valid_analysis(item):
+                results[email["id"]] = {key: item[key] for key in ANALYSIS_KEYS}
+            else:
+                retry.append(email)
+    
+    for email in retry:
+        try:
+            results[email["id"]] = json.loads(analyze_email_response(email["body"]))
+        except Exception as e:
+            logging.warning(f"⚠️ Analysis of email {email['id']} failed, using keyword fallback: {str(e)}")
+            results[email["id"]] = keyword_email_analysis(email["body"])
+    
+    logging.info(f"Analyzed {len(emails)} emails in {len(batches)} batch request(s) and {len(retry)} individual retries")
+    return results
+
 def draft_response_email(influencer_name: str, influencer_niche: str, sentiment: str, key_points: List[str]) -> str:
     """
     Draft a response email to an influencer based on their previous communication.
@@ -294,9 +446,55 @@ def draft_response_email(influencer_name: str, influencer_niche: str, sentiment:
         JSON string with draft email subject and body
     """
     # Use Gemini to generate the email
-    model = genai.GenerativeModel(MODEL_NAME)
+    model = get_model(MODEL_NAME)
+    prompt = _draft_prompt(influencer_name, influencer_niche, sentiment, key_points)
     
-    prompt = """
+    try:
+        response_text = call_gemini(model.generate_content, prompt).text
+    except Exception as e:
+        logging.warning(f"⚠️ Drafting email for {influencer_name} failed, using template: {str(e)}")
+        response_text = ""
+    
+    return json.dumps(_parse_draft(response_text, influencer_name, influencer_niche, sentiment, key_points))
+
+def draft_response_emails(drafts: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """
+    Draft many response emails at once on the bulk lane of the Gemini limiter.
+    
+    All requests are queued together and released as fast as the RPM/TPM quota
+    allows; interactive calls made meanwhile still go first.
+    
+    Args:
+        drafts: Dictionaries with the arguments of draft_response_email
+            (influencer_name, influencer_niche, sentiment, key_points)
+        
+    Returns:
+        List of dictionaries with subject and body, in input order
+    """
+    model = get_model(MODEL_NAME)
+    prompts = [
+        _draft_prompt(d["influencer_name"], d["influencer_niche"], d["sentiment"], d["key_points"])
+        for d in drafts
+    ]
+    responses = get_executor().run_many(
+        [(model.generate_content, (prompt,), {}) for prompt in prompts],
+        priority=BULK
+    )
+    
+    emails = []
+    for draft, response in zip(drafts, responses):
+        if isinstance(response, Exception):
+            logging.warning(f"⚠️ Drafting email for {draft['influencer_name']} failed, using template: {str(response)}")
+            response_text = ""
+        else:
+            response_text = response.text
+        emails.append(_parse_draft(response_text, draft["influencer_name"], draft["influencer_niche"],
+                                   draft["sentiment"], draft["key_points"]))
+    return emails
+
+def _draft_prompt(influencer_name: str, influencer_niche: str, sentiment: str, key_points: List[str]) -> str:
+    """Prompt asking Gemini for a response email as JSON."""
+    return """
     Draft a professional response email to an influencer with the following details:
     - Influencer name: {name}
     - Influencer niche: {niche}
@@ -315,12 +513,13 @@ def draft_response_email(influencer_name: str, influencer_niche: str, sentiment:
         sentiment=sentiment,
         key_points=', '.join(key_points)
     )
-    
-    response = model.generate_content(prompt)
-    
+
+def _parse_draft(response_text: str, influencer_name: str, influencer_niche: str, sentiment: str,
+                 key_points: List[str]) -> Dict[str, str]:
+    """Parse a drafted email, falling back to a template when the answer is not JSON."""
     try:
         # Try to parse the response as JSON
-        email_content = json.loads(response.text)
+        email_content = json.loads(response_text)
     except json.JSONDecodeError:
         # If parsing fails, create a basic template response
         subject = "RE: Partnership Discussion - ElevenLabs TTS Engine"
@@ -348,7 +547,7 @@ def draft_response_email(influencer_name: str, influencer_niche: str, sentiment:
         
         email_content = {"subject": subject, "body": body}
     
-    return json.dumps(email_content)
+    return email_content
 
 class GeminiInfluencerAgent:
     """
@@ -362,7 +561,8 @@ class GeminiInfluencerAgent:
         database_query_function: Callable = mock_query_database,
         email_check_function: Callable = mock_check_emails,
         email_send_function: Callable = send_email, 
-        api_key: Optional[str] = None
+        api_key: Optional[str] = None,
+        dispatcher: Optional[OutreachDispatcher] = None
     ):
         """
         Initialize the agent with the client company ID and necessary functions.
@@ -373,11 +573,16 @@ class GeminiInfluencerAgent:
             database_query_function: Function to query the database
             email_check_function: Function to check emails
             email_send_function: Function to send emails
+            dispatcher: Rate-limited concurrent sender for bulk outreach (built from email_send_function by default)
         """
         self.client_company_id = client_company_id
         self.db_query = database_query_function
         self.check_emails = email_check_function
         self.send_email = email_send_function
+        self.dispatcher = dispatcher or OutreachDispatcher(
+            email_send_function,
+            provider="mock" if email_send_function is mock_send_email else "mailgun"
+        )
         
         # Load client company data
         self.client_company = self._get_client_company()
@@ -385,18 +590,11 @@ class GeminiInfluencerAgent:
         # Store processed influencers to avoid duplicate outreach
         self.contacted_influencers = set()
         
-        # Initialize Gemini API
-        if api_key:
-            genai.configure(api_key=api_key)
-        else:
-            # Use API key from environment variable
-            api_key = os.getenv("GEMINI_API_KEY")
-            if not api_key:
-                raise ValueError("No Gemini API key provided. Set GEMINI_API_KEY in .env file or pass as parameter.")
-            genai.configure(api_key=api_key)
+        # Initialize Gemini API (falls back to GEMINI_API_KEY from the environment)
+        configure(api_key)
             
-        # Initialize the model with tools
-        self.model = genai.GenerativeModel(
+        # Initialize the model with tools; it is bound to this agent, so the agent owns it
+        self.model = get_model(
             MODEL_NAME,
             tools=[
                 find_influencers,
@@ -450,7 +648,7 @@ class GeminiInfluencerAgent:
         })
         
         # Call the model with the prompt and tool config
-        response = self.chat.send_message(prompt, tool_config=tool_config)
+        response = call_gemini(self.chat.send_message, prompt, tool_config=tool_config)
         
         # Extract the function call from the response
         if hasattr(response, 'parts') and len(response.parts) > 0:
@@ -553,6 +751,21 @@ class GeminiInfluencerAgent:
         # Call the function and parse results
         return self._call_gemini_function(prompt, "analyze_email_response", function_args)
     
+    def analyze_influencer_responses(self, emails: List[Dict[str, Any]], batch_size: int = 20,
+                                     token_budget: int = 8000) -> Dict[str, Dict[str, Any]]:
+        """
+        Analyze a whole inbox of influencer responses in batched Gemini requests.
+        
+        Args:
+            emails: Email dictionaries as returned by check_emails
+            batch_size: Maximum emails per request
+            token_budget: Maximum estimated prompt tokens per request
+            
+        Returns:
+            Dictionary mapping each email id to its analysis
+        """
+        return analyze_email_responses(emails, batch_size=batch_size, token_budget=token_budget)
+    
     def generate_response_email(self, influencer: Dict[str, Any], analysis: Dict[str, Any]) -> Dict[str, str]:
         """
         Use Gemini to generate a response email to an influencer.
@@ -669,15 +882,7 @@ The Partnership Team at {self.client_company['name']}
             self.contacted_influencers.add(influencer_name)
             
             # Prepare result for tracking
-            email_tracking = {
-                "influencer_id": influencer_data.get("id"),
-                "influencer_name": influencer_name,
-                "email": to_email,
-                "subject": email_content["subject"],
-                "type": email_type,
-                "status": email_result.get("status", "unknown"),
-                "timestamp": email_result.get("timestamp")
-            }
+            email_tracking = self._outreach_tracking(influencer_data, email_content, email_result)
             
             logging.info(f"📧 Sent outreach email to {influencer_name} ({to_email})")
             
@@ -728,6 +933,56 @@ The Partnership Team at {self.client_company['name']}
         
         return {"result": email_result, "tracking": email_tracking}
 
+    def _outreach_tracking(self, influencer_data: Dict[str, Any], email_content: Dict[str, str],
+                           email_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Tracking record of one initial outreach email."""
+        return {
+            "influencer_id": influencer_data.get("id"),
+            "influencer_name": influencer_data["name"],
+            "email": influencer_data["email"],
+            "subject": email_content["subject"],
+            "type": "initial_outreach",
+            "status": email_result.get("status", "unknown"),
+            "timestamp": email_result.get("timestamp")
+        }
+
+    def send_outreach_emails(self, influencers: List[Dict[str, Any]], brief: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Send initial outreach emails to many influencers concurrently.
+        
+        Sends go through the agent's dispatcher, which bounds concurrency and
+        applies the per-provider and per-domain rate limits. Influencers that
+        were already contacted are skipped.
+        
+        Args:
+            influencers: List of influencer dictionaries (name, email, ...)
+            brief: Dictionary with campaign requirements
+            
+        Returns:
+            List of dictionaries with email send status and tracking info, one per email sent
+        """
+        pending = []
+        for influencer in influencers:
+            if influencer["name"] in self.contacted_influencers:
+                continue
+            # Claim the influencer up front so a repeat in the same batch is not emailed twice
+            self.contacted_influencers.add(influencer["name"])
+            pending.append((influencer, self._create_initial_outreach_email(influencer, brief)))
+        
+        email_results = self.dispatcher.dispatch([
+            {"to": influencer["email"], "subject": content["subject"], "body": content["body"]}
+            for influencer, content in pending
+        ])
+        
+        operations = []
+        for (influencer, content), email_result in zip(pending, email_results):
+            logging.info(f"📧 Sent outreach email to {influencer['name']} ({influencer['email']}): {email_result.get('status')}")
+            operations.append({
+                "result": email_result,
+                "tracking": self._outreach_tracking(influencer, content, email_result)
+            })
+        return operations
+
     def send_email_tool(self, influencer_name: str, email: str, subject: str, body: str, email_type: str = "follow_up") -> str:
         """
         Send an email to an influencer and track the result.
@@ -817,7 +1072,7 @@ The Partnership Team at {self.client_company['name']}
             current_prompt = prompt if turn == 0 else "What should we do next?"
             logging.info(f"Prompt: {current_prompt}")
             
-            response = chat.send_message(current_prompt, tool_config=tool_config)
+            response = call_gemini(chat.send_message, current_prompt, tool_config=tool_config)
             logging.info(f"✅ Received response from agent")
             logging.info(f"Response: {response}")
             
@@ -852,19 +1107,8 @@ The Partnership Team at {self.client_company['name']}
                         # Automatically send initial outreach emails to found influencers
                         if len(result_data) > 0 and turn < 2:  # Only do this in early turns
                             logging.info(f"✉️ Automatically sending outreach emails to {len(result_data)} influencers")
-                            for influencer in result_data:
-                                # Skip if already contacted
-                                if influencer['name'] in self.contacted_influencers:
-                                    continue
-                                    
-                                # Send the email and track results
-                                email_operation = self.send_influencer_email(
-                                    influencer_data=influencer,
-                                    email_type="initial_outreach",
-                                    brief=brief
-                                )
-                                
-                                # Add to results tracking
+                            # Send concurrently within the provider and domain rate limits
+                            for email_operation in self.send_outreach_emails(result_data, brief):
                                 results["emails_sent"].append(email_operation["tracking"])
                                 
                     elif function_name == "analyze_email_response":
@@ -953,7 +1197,7 @@ The Partnership Team at {self.client_company['name']}
                     
                     # Send the function result back to the agent
                     logging.info(f"🔄 Sending result back to agent")
-                    chat.send_message(f"Function {function_name} executed. Results: {results['actions_taken'][-1]['result_summary']}")
+                    call_gemini(chat.send_message, f"Function {function_name} executed. Results: {results['actions_taken'][-1]['result_summary']}")
                 else:
                     # Agent is done or needs more information
                     logging.info(f"\n⚠️ No function call detected in response - agent may be done or needs more information")
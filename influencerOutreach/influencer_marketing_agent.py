@@ -7,9 +7,16 @@ with a client company.
 """
 
 import json
+import os
+import sys
 import time
 from typing import Dict, List, Optional, Any, Callable
 
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from influencerOutreach.outreach_dispatcher import OutreachDispatcher
+
 # Mock functions for database and email operations
 def mock_query_database(query: str) -> List[Dict[str, Any]]:
     """
@@ -130,7 +137,8 @@ class InfluencerMarketingAgent:
         client_company_id: int,
         database_query_function: Callable = mock_query_database,
         email_check_function: Callable = mock_check_emails,
-        email_send_function: Callable = mock_send_email
+        email_send_function: Callable = mock_send_email,
+        dispatcher: Optional[OutreachDispatcher] = None
     ):
         """
         Initialize the agent with the client company ID and necessary functions.
@@ -140,11 +148,16 @@ class InfluencerMarketingAgent:
             database_query_function: Function to query the database
             email_check_function: Function to check emails
             email_send_function: Function to send emails
+            dispatcher: Rate-limited concurrent sender for campaigns (built from email_send_function by default)
         """
         self.client_company_id = client_company_id
         self.db_query = database_query_function
         self.check_emails = email_check_function
         self.send_email = email_send_function
+        self.dispatcher = dispatcher or OutreachDispatcher(
+            email_send_function,
+            provider="mock" if email_send_function is mock_send_email else "mailgun"
+        )
         
         # Load client company data
         self.client_company = self._get_client_company()
@@ -285,20 +298,33 @@ Partnerships Team
         
         print(f"Found {len(influencers)} potential influencers matching criteria")
         
-        # Send emails to each influencer
-        results = []
+        # Generate emails for influencers not contacted yet
+        email_results = {}
+        pending = []
         for influencer in influencers:
-            result = self.send_outreach_email(influencer)
-            results.append({
+            if influencer["id"] in self.contacted_influencers:
+                print(f"Influencer {influencer['name']} already contacted. Skipping.")
+                email_results[influencer["id"]] = {"status": "skipped", "reason": "already_contacted"}
+                continue
+            self.contacted_influencers.add(influencer["id"])
+            pending.append(influencer)
+        
+        # Send them concurrently; the dispatcher paces sends per provider and recipient domain
+        sent = self.dispatcher.dispatch([
+            {"to": influencer["email"], **self.generate_outreach_email(influencer)}
+            for influencer in pending
+        ])
+        for influencer, result in zip(pending, sent):
+            email_results[influencer["id"]] = result
+        
+        return [
+            {
                 "influencer_id": influencer["id"],
                 "influencer_name": influencer["name"],
-                "email_result": result
-            })
-            
-            # Add a small delay between emails
-            time.sleep(1)
-            
-        return results
+                "email_result": email_results[influencer["id"]]
+            }
+            for influencer in influencers
+        ]
     
     def process_responses(self) -> List[Dict[str, Any]]:
         """
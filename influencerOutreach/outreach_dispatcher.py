@@ -0,0 +1,305 @@
+"""
+Concurrent outreach dispatcher.
+
+Sends run on a bounded worker pool instead of one at a time with a fixed
+sleep. Throughput is capped by token buckets per email provider and per
+recipient domain. Messages wait in per-domain queues and are handed to a
+worker only once both buckets allow the send, so a throttled domain never
+holds a worker while other domains have capacity. Sends rejected with 429 or
+a 5xx status, or that hit a transport error, are re-queued after a jittered
+exponential backoff (or the provider's Retry-After).
+"""
+
+import heapq
+import os
+import random
+import threading
+import time
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Sends per minute allowed by each provider; override with OUTREACH_PROVIDER_RPM
+PROVIDER_RATE_LIMITS = {
+    "mailgun": 300,
+    "mock": 6000,
+}
+# Sends per minute to one recipient domain; override with OUTREACH_DOMAIN_RPM
+DEFAULT_DOMAIN_RATE_LIMIT = 600
+
+
+class RateLimiter:
+    """Thread-safe, non-blocking token bucket."""
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        """
+        Create a full bucket.
+
+        Args:
+            per_minute: Sends allowed per minute
+            burst: Largest burst; defaults to a tenth of a minute's allowance (at least 1)
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = burst or max(1.0, per_minute / 10.0)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_take(self) -> float:
+        """
+        Take one send from the bucket if one is available.
+
+        Returns:
+            0 if the send was taken, otherwise the seconds until one is available
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.level >= 1:
+                self.level -= 1
+                return 0.0
+            return (1 - self.level) / self.rate
+
+    def refund(self) -> None:
+        """Return a send taken by try_take() that was not used."""
+        with self._lock:
+            self.level = min(self.capacity, self.level + 1)
+
+
+def recipient_domain(address: str) -> str:
+    """Domain part of an address such as 'Name <user@example.com>'."""
+    address = address.strip().rstrip(">")
+    return address.rsplit("@", 1)[-1].lower() if "@" in address else ""
+
+
+def retry_after_seconds(value: Any) -> Optional[float]:
+    """
+    Parse a Retry-After value given in seconds or as an HTTP date.
+
+    Args:
+        value: Header value, e.g. "120" or "Wed, 21 Oct 2026 07:28:00 GMT"
+
+    Returns:
+        Seconds to wait (never negative), or None if the value is missing or unreadable
+    """
+    if value is None or value == "":
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        when = parsedate_to_datetime(str(value))
+    except (TypeError, ValueError, IndexError):
+        return None
+    if when is None:
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def is_retryable(result: Dict[str, Any]) -> bool:
+    """True when a send result reports throttling, a server error, or a transport error."""
+    if result.get("status") == "sent":
+        return False
+    if result.get("transport_error"):
+        return True
+    code = result.get("response_code")
+    return code is not None and (code == 429 or code >= 500)
+
+
+class OutreachDispatcher:
+    """Bounded-concurrency, rate-limited sender of outreach emails."""
+
+    def __init__(
+        self,
+        send_function: Callable[..., Dict[str, Any]],
+        provider: str = "mailgun",
+        max_workers: int = 8,
+        provider_rate_limit: Optional[float] = None,
+        domain_rate_limit: Optional[float] = None,
+        domain_rate_limits: Optional[Dict[str, float]] = None,
+        max_retries: int = 4,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0
+    ):
+        """
+        Configure the dispatcher.
+
+        Args:
+            send_function: Callable(to, subject, body) returning a dict with status and
+                optionally response_code, retry_after and transport_error (set when the
+                request never got a response; e.g. send_email or mock_send_email)
+            provider: Provider name, used to pick the default provider rate limit
+            max_workers: Sends in flight at once
+            provider_rate_limit: Sends per minute across all recipients
+            domain_rate_limit: Sends per minute to any single recipient domain
+            domain_rate_limits: Per-domain overrides, e.g. {"gmail.com": 1200}
+            max_retries: Retries of a throttled or failed send
+            backoff_base: First backoff in seconds; doubles on every retry
+            backoff_max: Upper bound of a single backoff
+        """
+        self.send_function = send_function
+        self.provider = provider
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.domain_rate_limit = domain_rate_limit or float(
+            os.getenv("OUTREACH_DOMAIN_RPM", DEFAULT_DOMAIN_RATE_LIMIT)
+        )
+        self.domain_rate_limits = domain_rate_limits or {}
+        self._provider_limiter = RateLimiter(provider_rate_limit or float(
+            os.getenv("OUTREACH_PROVIDER_RPM", PROVIDER_RATE_LIMITS.get(provider, 60))
+        ))
+        self._domain_limiters = {}
+        self._lock = threading.Lock()
+        self._stats = {"sent": 0, "failed": 0, "retries": 0, "backoff_seconds": 0.0}
+
+    def _domain_limiter(self, domain: str) -> RateLimiter:
+        with self._lock:
+            limiter = self._domain_limiters.get(domain)
+            if limiter is None:
+                limiter = RateLimiter(self.domain_rate_limits.get(domain, self.domain_rate_limit))
+                self._domain_limiters[domain] = limiter
+            return limiter
+
+    def _count(self, key: str, amount: float = 1) -> None:
+        with self._lock:
+            self._stats[key] += amount
+
+    def _backoff(self, attempt: int, result: Dict[str, Any]) -> float:
+        retry_after = retry_after_seconds(result.get("retry_after"))
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # Full jitter keeps workers that failed together from retrying together
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _attempt(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            result = self.send_function(to=message["to"], subject=message["subject"], body=message["body"])
+        except OSError as e:
+            # Connection failures and timeouts (requests' exceptions are OSErrors) may succeed later
+            return {"status": "failed", "reason": str(e), "recipient": message["to"], "transport_error": True}
+        except Exception as e:
+            return {"status": "failed", "reason": str(e), "recipient": message["to"]}
+        return dict(result or {"status": "failed", "recipient": message["to"]})
+
+    def _take_slot(self, domain: str) -> float:
+        """Take a send from the domain and provider buckets; returns 0, or the wait if either is empty."""
+        domain_limiter = self._domain_limiter(domain)
+        domain_wait = domain_limiter.try_take()
+        if domain_wait > 0:
+            return domain_wait
+        provider_wait = self._provider_limiter.try_take()
+        if provider_wait > 0:
+            domain_limiter.refund()
+        return provider_wait
+
+    def send(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Send one message within the rate limits, retrying throttled attempts.
+
+        Args:
+            message: Dictionary with to, subject and body
+
+        Returns:
+            The send function's result plus the number of attempts made
+        """
+        return self.dispatch([message])[0]
+
+    def dispatch(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Send many messages concurrently.
+
+        Domains are served round-robin, and a message is only handed to a worker
+        once its domain and the provider both have capacity; retries wait out
+        their backoff in a queue rather than on a worker.
+
+        Args:
+            messages: Dictionaries with to, subject and body
+
+        Returns:
+            One result per message, in input order
+        """
+        results = [None] * len(messages)
+        if not messages:
+            return results
+        started = time.monotonic()
+        domains = [recipient_domain(message["to"]) for message in messages]
+        queues = OrderedDict()     # domain -> deque of (index, attempts so far)
+        for index, domain in enumerate(domains):
+            queues.setdefault(domain, deque()).append((index, 0))
+        delayed = []               # heap of (ready_at, index, attempts so far)
+        in_flight = {}             # future -> (index, attempts so far)
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(messages)),
+                                thread_name_prefix="outreach") as executor:
+            while queues or delayed or in_flight:
+                now = time.monotonic()
+                while delayed and delayed[0][0] <= now:
+                    _, index, attempts = heapq.heappop(delayed)
+                    queues.setdefault(domains[index], deque()).append((index, attempts))
+
+                # One message per ready domain per pass, until the workers are busy
+                next_ready = delayed[0][0] - now if delayed else None
+                submitted = False
+                for domain in list(queues):
+                    if len(in_flight) >= self.max_workers:
+                        break
+                    wait_for = self._take_slot(domain)
+                    if wait_for > 0:
+                        next_ready = wait_for if next_ready is None else min(next_ready, wait_for)
+                        continue
+                    index, attempts = queues[domain].popleft()
+                    if not queues[domain]:
+                        del queues[domain]
+                    in_flight[executor.submit(self._attempt, messages[index])] = (index, attempts)
+                    submitted = True
+                if submitted and len(in_flight) < self.max_workers and queues:
+                    continue
+
+                if in_flight:
+                    done, _ = wait(list(in_flight), timeout=next_ready, return_when=FIRST_COMPLETED)
+                elif next_ready is not None:
+                    time.sleep(next_ready)
+                    done = ()
+                else:
+                    done = ()
+
+                for future in done:
+                    index, attempts = in_flight.pop(future)
+                    result = future.result()
+                    attempts += 1
+                    if attempts <= self.max_retries and is_retryable(result):
+                        delay = self._backoff(attempts - 1, result)
+                        logger.warning(f"Send to {messages[index]['to']} failed "
+                                       f"({result.get('response_code')}), retrying in {delay:.1f}s")
+                        self._count("retries")
+                        self._count("backoff_seconds", delay)
+                        heapq.heappush(delayed, (time.monotonic() + delay, index, attempts))
+                        continue
+                    self._count("sent" if result.get("status") == "sent" else "failed")
+                    result["attempts"] = attempts
+                    results[index] = result
+
+        elapsed = time.monotonic() - started
+        logger.info(f"Dispatched {len(messages)} emails via {self.provider} in {elapsed:.1f}s")
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Dispatcher counters.
+
+        Returns:
+            Dictionary with sent/failed/retry counts and time spent backing off
+        """
+        with self._lock:
+            return {**self._stats, "provider": self.provider, "domains": len(self._domain_limiters)}
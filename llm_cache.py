@@ -0,0 +1,231 @@
+"""
+Content-addressed cache of Gemini responses.
+
+Responses are keyed on everything that determines them (model, prompt,
+generation config and tool schema), held in an in-process LRU and, behind it,
+in the same SQLite TTL/LRU store used for scraper results, so repeats are
+served across restarts and processes. Only deterministic call sites should
+opt in; each one is named so hit rates and the latency saved can be read per
+site, and any site can be switched off with LLM_CACHE_DISABLE.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from dotenv import load_dotenv
+
+from scrape_cache import ScrapeCache
+
+load_dotenv()
+
+
+class CachedResponse:
+    """Minimal stand-in for an SDK response: the generated text."""
+
+    def __init__(self, text: str, cached: bool = False):
+        self.text = text
+        self.cached = cached
+
+    def __repr__(self):
+        return f"CachedResponse(text={self.text!r}, cached={self.cached})"
+
+
+def _tool_name(tool: Any) -> str:
+    return getattr(tool, "__qualname__", None) or getattr(tool, "__name__", None) or repr(tool)
+
+
+def make_llm_key(model: str, contents: Any, config: Optional[Dict[str, Any]] = None,
+                 tools: Optional[Sequence[Any]] = None) -> str:
+    """
+    Build a stable key for one LLM request
+    Args:
+        model: Model name
+        contents: Prompt text or list of prompt parts
+        config: Generation config (temperature, schema, ...)
+        tools: Functions or declarations exposed to the model
+    Returns:
+        Hex digest identifying the request
+    """
+    payload = json.dumps({
+        "model": model,
+        "contents": contents,
+        "config": config or {},
+        "tools": [_tool_name(tool) for tool in tools or ()],
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Two-tier (memory LRU, then disk) cache of generated text."""
+
+    def __init__(self, disk: Optional[ScrapeCache] = None, ttl: float = 24 * 3600,
+                 max_entries: int = 1024, disabled_sites: Sequence[str] = ()):
+        """
+        Create the cache
+        Args:
+            disk: Persistent tier; None keeps the cache in memory only
+            ttl: Seconds an entry stays fresh in the memory tier (the disk tier has its own)
+            max_entries: Responses kept in the memory tier
+            disabled_sites: Call sites that always bypass the cache ("all" disables every site)
+        """
+        self.disk = disk
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.disabled_sites = set(disabled_sites)
+        self._memory = OrderedDict()    # key -> (text, created_at, latency)
+        self._lock = threading.Lock()
+        self._sites = {}
+
+    def enabled(self, call_site: str) -> bool:
+        return "all" not in self.disabled_sites and call_site not in self.disabled_sites
+
+    def _site(self, call_site: str) -> Dict[str, Any]:
+        return self._sites.setdefault(call_site, {
+            "memory_hits": 0, "disk_hits": 0, "misses": 0, "bypasses": 0,
+            "latency_saved_seconds": 0.0, "llm_seconds": 0.0,
+        })
+
+    def _remember(self, key: str, text: str, created_at: float, latency: float) -> None:
+        self._memory[key] = (text, created_at, latency)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str, call_site: str = "default") -> Optional[str]:
+        """
+        Look up a response
+        Args:
+            key: Key from make_llm_key
+            call_site: Name the lookup is accounted under
+        Returns:
+            Cached text, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            site = self._site(call_site)
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] <= self.ttl:
+                self._memory.move_to_end(key)
+                site["memory_hits"] += 1
+                site["latency_saved_seconds"] += entry[2]
+                return entry[0]
+            if entry is not None:
+                del self._memory[key]
+
+        stored = self.disk.get(key) if self.disk is not None else None
+        with self._lock:
+            site = self._site(call_site)
+            if stored is None:
+                site["misses"] += 1
+                return None
+            site["disk_hits"] += 1
+            site["latency_saved_seconds"] += stored["latency"]
+            # Keep the original age so a promoted entry expires when it would have on disk
+            self._remember(key, stored["text"], stored.get("created_at", now), stored["latency"])
+        return stored["text"]
+
+    def set(self, key: str, text: str, latency: float = 0.0) -> None:
+        """
+        Store a response in both tiers
+        Args:
+            key: Key from make_llm_key
+            text: Generated text
+            latency: Seconds the original call took (reported as saved on every hit)
+        """
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, text, created_at, latency)
+        if self.disk is not None:
+            self.disk.set(key, {"text": text, "latency": latency, "created_at": created_at})
+
+    def get_or_generate(self, call_site: str, key: str, generate: Callable[[], str],
+                        enabled: bool = True) -> CachedResponse:
+        """
+        Read-through access for one call site
+        Args:
+            call_site: Name of the caller, e.g. "product_to_query"
+            key: Key from make_llm_key
+            generate: Zero-argument callable making the LLM call and returning its text
+            enabled: Per-call opt-out, e.g. for non-zero temperatures
+        Returns:
+            CachedResponse with the text and whether it came from the cache
+        """
+        if not enabled or not self.enabled(call_site):
+            with self._lock:
+                self._site(call_site)["bypasses"] += 1
+            return CachedResponse(generate())
+
+        text = self.get(key, call_site)
+        if text is not None:
+            return CachedResponse(text, cached=True)
+
+        started = time.perf_counter()
+        text = generate()
+        latency = time.perf_counter() - started
+        with self._lock:
+            self._site(call_site)["llm_seconds"] += latency
+        self.set(key, text, latency)
+        return CachedResponse(text)
+
+    def clear(self) -> None:
+        """Drop every cached response from both tiers."""
+        with self._lock:
+            self._memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Per-call-site counters plus memory tier size
+        Returns:
+            Dictionary with hit/miss counts, hit rate and latency saved per call site
+        """
+        with self._lock:
+            sites = {}
+            for name, counters in self._sites.items():
+                hits = counters["memory_hits"] + counters["disk_hits"]
+                lookups = hits + counters["misses"]
+                sites[name] = {**counters, "hit_rate": hits / lookups if lookups else 0.0}
+            return {
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "disabled_sites": sorted(self.disabled_sites),
+                "sites": sites,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """
+    Return the process-wide LLM response cache, configured from LLM_CACHE_PATH
+    (empty for memory only), LLM_CACHE_TTL (seconds), LLM_CACHE_MAX_MB,
+    LLM_CACHE_MEMORY_ENTRIES and LLM_CACHE_DISABLE (comma-separated call sites, or "all").
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                ttl = float(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+                path = os.getenv("LLM_CACHE_PATH", ".cache/llm_responses.sqlite3")
+                disk = ScrapeCache(
+                    path,
+                    ttl=ttl,
+                    max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "64")) * 1024 * 1024),
+                ) if path else None
+                disabled = [site.strip() for site in os.getenv("LLM_CACHE_DISABLE", "").split(",") if site.strip()]
+                _cache = LLMResponseCache(
+                    disk,
+                    ttl=ttl,
+                    max_entries=int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1024")),
+                    disabled_sites=disabled,
+                )
+    return _cache
@@ -0,0 +1,300 @@
+"""
+Time-series history of contract video metrics.
+
+Every refresh appends a row per video to video_metric_snapshots, a table
+range-partitioned by month on captured_at. Hourly and daily rollup tables are
+updated incrementally in the same statement that appends the snapshots, so
+trend queries read a handful of pre-aggregated rows instead of scanning the
+raw history.
+"""
+
+from datetime import datetime, timezone
+
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+SNAPSHOT_TABLE = 'video_metric_snapshots'
+ROLLUP_TABLES = {
+    'hourly': ('video_metrics_hourly', 'hour'),
+    'daily': ('video_metrics_daily', 'day'),
+}
+METRICS = ('plays', 'shares', 'comments')
+
+_schema_ready = False
+_ensured_partitions = set()
+
+
+def _month_start(moment):
+    return datetime(moment.year, moment.month, 1)
+
+
+def _next_month(month_start):
+    if month_start.month == 12:
+        return datetime(month_start.year + 1, 1, 1)
+    return datetime(month_start.year, month_start.month + 1, 1)
+
+
+def ensure_history_schema(connection):
+    """
+    Creates the partitioned snapshot table, its default partition and the rollup tables.
+
+    Parameters:
+    - connection: psycopg2 connection object to the database.
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+    statements = [
+        sql.SQL(
+            "CREATE TABLE IF NOT EXISTS {table} ("
+            " contract_vid VARCHAR(255) NOT NULL,"
+            " captured_at TIMESTAMP NOT NULL,"
+            " plays BIGINT NULL,"
+            " shares BIGINT NULL,"
+            " comments BIGINT NULL"
+            ") PARTITION BY RANGE (captured_at)"
+        ).format(table=sql.Identifier(SNAPSHOT_TABLE)),
+        # Catches rows for months whose partition has not been created yet
+        sql.SQL("CREATE TABLE IF NOT EXISTS {default} PARTITION OF {table} DEFAULT").format(
+            default=sql.Identifier(f"{SNAPSHOT_TABLE}_default"),
+            table=sql.Identifier(SNAPSHOT_TABLE)
+        ),
+        sql.SQL("CREATE INDEX IF NOT EXISTS {name} ON {table} (contract_vid, captured_at)").format(
+            name=sql.Identifier(f"idx_{SNAPSHOT_TABLE}_vid_captured"),
+            table=sql.Identifier(SNAPSHOT_TABLE)
+        ),
+    ]
+    for rollup_table, _ in ROLLUP_TABLES.values():
+        statements.append(sql.SQL(
+            "CREATE TABLE IF NOT EXISTS {table} ("
+            " contract_vid VARCHAR(255) NOT NULL,"
+            " bucket TIMESTAMP NOT NULL,"
+            " samples INTEGER NOT NULL,"
+            " last_captured_at TIMESTAMP NOT NULL,"
+            " plays_min BIGINT NULL, plays_max BIGINT NULL, plays_last BIGINT NULL,"
+            " shares_min BIGINT NULL, shares_max BIGINT NULL, shares_last BIGINT NULL,"
+            " comments_min BIGINT NULL, comments_max BIGINT NULL, comments_last BIGINT NULL,"
+            " PRIMARY KEY (contract_vid, bucket)"
+            ")"
+        ).format(table=sql.Identifier(rollup_table)))
+        statements.append(sql.SQL("CREATE INDEX IF NOT EXISTS {name} ON {table} (bucket)").format(
+            name=sql.Identifier(f"idx_{rollup_table}_bucket"),
+            table=sql.Identifier(rollup_table)
+        ))
+
+    try:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+            connection.commit()
+        _schema_ready = True
+    except Exception as error:
+        print(f"Error creating metrics history schema: {error}")
+        connection.rollback()
+
+
+def ensure_partition(connection, moment):
+    """
+    Creates the monthly snapshot partition covering `moment` if it is missing.
+
+    Rows for that month that already landed in the default partition (e.g. because
+    an earlier attempt failed) would make the CREATE fail forever, so they are moved
+    into the new partition in the same transaction: detach the default partition,
+    create the month, move its rows across and attach the default again.
+
+    Parameters:
+    - connection: psycopg2 connection object to the database.
+    - moment (datetime): Any timestamp inside the wanted month.
+    """
+    start = _month_start(moment)
+    if start in _ensured_partitions:
+        return
+    end = _next_month(start)
+    partition = f"{SNAPSHOT_TABLE}_y{start.year}m{start.month:02d}"
+    default = f"{SNAPSHOT_TABLE}_default"
+    identifiers = {
+        'partition': sql.Identifier(partition),
+        'default': sql.Identifier(default),
+        'table': sql.Identifier(SNAPSHOT_TABLE),
+    }
+    create_query = sql.SQL(
+        "CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)"
+    ).format(**identifiers)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (partition,))
+            exists = cursor.fetchone()[0]
+            stranded = False
+            if not exists:
+                cursor.execute(sql.SQL(
+                    "SELECT EXISTS (SELECT 1 FROM {default} WHERE captured_at >= %s AND captured_at < %s)"
+                ).format(**identifiers), (start, end))
+                stranded = cursor.fetchone()[0]
+            if stranded:
+                print(f"Moving {start:%Y-%m} snapshots from {default} into {partition}")
+                cursor.execute(sql.SQL("ALTER TABLE {table} DETACH PARTITION {default}").format(**identifiers))
+                cursor.execute(create_query, (start, end))
+                cursor.execute(sql.SQL(
+                    "WITH moved AS (DELETE FROM {default} WHERE captured_at >= %s AND captured_at < %s RETURNING *) "
+                    "INSERT INTO {partition} SELECT * FROM moved"
+                ).format(**identifiers), (start, end))
+                cursor.execute(sql.SQL("ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT").format(**identifiers))
+            elif not exists:
+                cursor.execute(create_query, (start, end))
+            connection.commit()
+        _ensured_partitions.add(start)
+    except Exception as error:
+        print(f"Error creating partition {partition}: {error}")
+        connection.rollback()
+
+
+def _rollup_cte(name, rollup_table, unit):
+    """INSERT ... ON CONFLICT merging the batch into one rollup table."""
+    aggregates = []
+    merges = []
+    for metric in METRICS:
+        aggregates.append(sql.SQL(
+            "MIN({m}), MAX({m}), (ARRAY_AGG({m} ORDER BY captured_at DESC))[1]"
+        ).format(m=sql.Identifier(metric)))
+        merges.append(sql.SQL(
+            "{mn} = LEAST(r.{mn}, EXCLUDED.{mn}), "
+            "{mx} = GREATEST(r.{mx}, EXCLUDED.{mx}), "
+            "{last} = CASE WHEN EXCLUDED.last_captured_at >= r.last_captured_at "
+            "THEN EXCLUDED.{last} ELSE r.{last} END"
+        ).format(
+            mn=sql.Identifier(f"{metric}_min"),
+            mx=sql.Identifier(f"{metric}_max"),
+            last=sql.Identifier(f"{metric}_last")
+        ))
+    columns = [f"{metric}_{suffix}" for metric in METRICS for suffix in ('min', 'max', 'last')]
+
+    return sql.SQL(
+        "{name} AS ("
+        "INSERT INTO {table} AS r (contract_vid, bucket, samples, last_captured_at, {columns}) "
+        "SELECT contract_vid, date_trunc({unit}, captured_at), COUNT(*), MAX(captured_at), {aggregates} "
+        "FROM batch GROUP BY 1, 2 "
+        "ON CONFLICT (contract_vid, bucket) DO UPDATE SET "
+        "samples = r.samples + EXCLUDED.samples, "
+        "last_captured_at = GREATEST(r.last_captured_at, EXCLUDED.last_captured_at), "
+        "{merges} RETURNING 1)"
+    ).format(
+        name=sql.Identifier(name),
+        table=sql.Identifier(rollup_table),
+        columns=sql.SQL(', ').join(map(sql.Identifier, columns)),
+        unit=sql.Literal(unit),
+        aggregates=sql.SQL(', ').join(aggregates),
+        merges=sql.SQL(', ').join(merges)
+    )
+
+
+def record_snapshots(connection, snapshots, captured_at=None):
+    """
+    Appends metric snapshots and folds them into the hourly and daily rollups,
+    all in one statement and transaction.
+
+    Parameters:
+    - connection: psycopg2 connection object to the database.
+    - snapshots (list): Dicts with contract_vid and any of plays, shares, comments;
+      an optional captured_at overrides the batch timestamp.
+    - captured_at (datetime): Naive UTC capture time; defaults to now.
+
+    Returns:
+    - Number of snapshots recorded.
+
+    Example:
+    record_snapshots(conn, [{'contract_vid': url, 'plays': 1200, 'shares': 4, 'comments': 9}])
+    """
+    if not snapshots:
+        return 0
+    captured_at = captured_at or datetime.now(timezone.utc).replace(tzinfo=None)
+    values = [
+        (s['contract_vid'], s.get('captured_at') or captured_at,
+         s.get('plays'), s.get('shares'), s.get('comments'))
+        for s in snapshots
+    ]
+    for month in {_month_start(row[1]) for row in values}:
+        ensure_partition(connection, month)
+
+    ctes = [_rollup_cte(f"rollup_{name}", table, unit) for name, (table, unit) in ROLLUP_TABLES.items()]
+    record_query = sql.SQL(
+        "WITH batch (contract_vid, captured_at, plays, shares, comments) AS ("
+        "SELECT v.contract_vid::varchar, v.captured_at::timestamp, "
+        "v.plays::bigint, v.shares::bigint, v.comments::bigint FROM (VALUES %s) "
+        "AS v (contract_vid, captured_at, plays, shares, comments)), "
+        "{ctes} "
+        "INSERT INTO {table} (contract_vid, captured_at, plays, shares, comments) "
+        "SELECT contract_vid, captured_at, plays, shares, comments FROM batch"
+    ).format(ctes=sql.SQL(', ').join(ctes), table=sql.Identifier(SNAPSHOT_TABLE))
+
+    try:
+        with connection.cursor() as cursor:
+            execute_values(cursor, record_query.as_string(connection), values, page_size=len(values))
+            connection.commit()
+        return len(values)
+    except Exception as error:
+        print(f"Error recording metric snapshots: {error}")
+        connection.rollback()
+        return 0
+
+
+def metric_trend(connection, granularity='daily', contract_vids=None, since=None, group_by_profile=False,
+                 profile_names=None):
+    """
+    Reads a metric time series from the rollups.
+
+    Parameters:
+    - connection: psycopg2 connection object to the database.
+    - granularity (str): 'hourly' or 'daily'.
+    - contract_vids (list): Restrict to these videos; default is all.
+    - since (datetime): Only buckets at or after this naive UTC time.
+    - group_by_profile (bool): Sum the latest values of each profile's videos per bucket.
+    - profile_names (list): Restrict to the contract videos of these profiles.
+
+    Returns:
+    - List of dicts, one per (video or profile, bucket), oldest bucket first.
+    """
+    if granularity not in ROLLUP_TABLES:
+        raise ValueError(f"Unknown granularity: {granularity}")
+    rollup_table = sql.Identifier(ROLLUP_TABLES[granularity][0])
+
+    conditions = []
+    params = []
+    if contract_vids:
+        conditions.append(sql.SQL("r.contract_vid = ANY(%s)"))
+        params.append(list(contract_vids))
+    if profile_names:
+        conditions.append(sql.SQL(
+            "r.contract_vid IN (SELECT contract_vid FROM leads WHERE profile_name = ANY(%s))"
+        ))
+        params.append(list(profile_names))
+    if since:
+        conditions.append(sql.SQL("r.bucket >= %s"))
+        params.append(since)
+    where = sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL("")
+
+    if group_by_profile:
+        trend_query = sql.SQL(
+            "SELECT l.profile_name, r.bucket, SUM(r.plays_last)::bigint AS plays, "
+            "SUM(r.shares_last)::bigint AS shares, SUM(r.comments_last)::bigint AS comments "
+            "FROM {rollup} r JOIN (SELECT DISTINCT contract_vid, profile_name FROM leads) l "
+            "ON l.contract_vid = r.contract_vid{where} "
+            "GROUP BY l.profile_name, r.bucket ORDER BY r.bucket, l.profile_name"
+        ).format(rollup=rollup_table, where=where)
+    else:
+        trend_query = sql.SQL(
+            "SELECT r.contract_vid, r.bucket, r.plays_last AS plays, r.shares_last AS shares, "
+            "r.comments_last AS comments, r.samples FROM {rollup} r{where} "
+            "ORDER BY r.bucket, r.contract_vid"
+        ).format(rollup=rollup_table, where=where)
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(trend_query, params)
+            names = [desc[0] for desc in cursor.description]
+            rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+        connection.rollback()
+        return rows
+    except Exception as error:
+        print(f"Error reading metric trend: {error}")
+        connection.rollback()
+        return []
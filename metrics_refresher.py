@@ -0,0 +1,241 @@
+"""
+Background refresher for contract video metrics.
+
+Keeps leads.contract_* current without anyone calling scrap_performance by
+hand. Each cycle picks the leads whose metrics are stalest, weighting videos
+that were posted recently more heavily (their numbers move fastest), and
+refreshes them in batched actor runs within an hourly scraper budget.
+
+Run with: python metrics_refresher.py
+"""
+
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+
+from db_pool import pooled_connection
+from metrics_history import ensure_history_schema
+from scrap_performace_metrics import ensure_refresh_columns, refresh_contract_metrics
+
+load_dotenv()
+
+# Staleness in seconds since the last attempt, successful or not (never attempted counts
+# as 30 days), boosted for young videos and damped for videos that keep returning nothing:
+# priority = staleness * (1 + recency_boost * exp(-video_age_days / recency_half_life_days)) / (1 + failures)
+# A video that failed n times in a row waits min_staleness * 2^n before it is retried.
+PRIORITY_QUERY = """
+WITH candidates AS (
+    SELECT
+        contract_vid,
+        EXTRACT(EPOCH FROM (now() AT TIME ZONE 'UTC')
+                - GREATEST(contract_metrics_updated_at, contract_metrics_attempted_at)) AS staleness,
+        COALESCE(contract_metrics_failures, 0) AS failures,
+        EXTRACT(EPOCH FROM (now() AT TIME ZONE 'UTC') - COALESCE(contract_posted_at, created_at)) / 86400.0 AS age_days
+    FROM leads
+    WHERE contract_vid IS NOT NULL AND contract_vid <> ''
+)
+SELECT contract_vid
+FROM candidates
+WHERE staleness IS NULL
+   OR staleness >= %(min_staleness)s * POWER(2, LEAST(failures, %(max_backoff_doublings)s))
+GROUP BY contract_vid
+ORDER BY MAX(
+    COALESCE(staleness, 30 * 86400)
+    * (1 + %(recency_boost)s * EXP(-LEAST(COALESCE(age_days, 365), 3650) / %(half_life)s))
+    / (1 + failures)
+) DESC
+LIMIT %(limit)s
+"""
+
+FRESHNESS_QUERY = """
+SELECT
+    COUNT(*) FILTER (WHERE contract_metrics_updated_at IS NULL
+                     OR contract_metrics_updated_at < (now() AT TIME ZONE 'UTC') - %(max_age)s * INTERVAL '1 second'),
+    COUNT(*),
+    MAX(EXTRACT(EPOCH FROM (now() AT TIME ZONE 'UTC') - contract_metrics_updated_at)),
+    AVG(EXTRACT(EPOCH FROM (now() AT TIME ZONE 'UTC') - contract_metrics_updated_at)),
+    COUNT(*) FILTER (WHERE contract_metrics_updated_at IS NULL),
+    COUNT(*) FILTER (WHERE contract_metrics_failures > 0)
+FROM leads
+WHERE contract_vid IS NOT NULL AND contract_vid <> ''
+"""
+
+
+def freshness_report(connection, max_age=3600):
+    """
+    Measures how current the contract metrics are.
+
+    Parameters:
+    - connection: psycopg2 connection object to the database.
+    - max_age (float): Seconds after which a lead's metrics count as stale.
+
+    Returns:
+    - Dictionary with queue_depth (stale or never refreshed leads), tracked leads,
+      never_refreshed, failing (last scrape returned nothing), and max/avg refresh
+      lag in seconds.
+    """
+    ensure_refresh_columns(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(FRESHNESS_QUERY, {"max_age": max_age})
+        stale, total, max_lag, avg_lag, never, failing = cursor.fetchone()
+    connection.rollback()
+    return {
+        "queue_depth": stale,
+        "tracked_leads": total,
+        "never_refreshed": never,
+        "failing": failing,
+        "max_refresh_lag_seconds": float(max_lag) if max_lag is not None else None,
+        "avg_refresh_lag_seconds": float(avg_lag) if avg_lag is not None else None,
+        "max_age_seconds": max_age,
+    }
+
+
+class MetricsRefresher:
+    """Long-running, budgeted refresher of leads.contract_* metrics."""
+
+    def __init__(self,
+                 runs_per_hour: int = 30,
+                 urls_per_run: int = 50,
+                 max_parallel_runs: int = 3,
+                 min_staleness: float = 900,
+                 max_age: float = 3600,
+                 recency_boost: float = 4.0,
+                 recency_half_life_days: float = 3.0,
+                 max_backoff_doublings: int = 8,
+                 poll_interval: float = 60):
+        """
+        Configure the refresher
+        Args:
+            runs_per_hour: Scraper budget; actor runs allowed in any rolling hour
+            urls_per_run: Videos packed into one actor run
+            max_parallel_runs: Actor runs executing concurrently
+            min_staleness: Leads refreshed more recently than this (seconds) are skipped
+            max_age: Freshness target used for queue depth reporting (seconds)
+            recency_boost: Extra priority weight for a video posted just now
+            recency_half_life_days: How fast that boost decays with video age
+            max_backoff_doublings: Cap on the retry backoff of videos that keep returning
+                nothing (min_staleness * 2^n; 8 doublings is about 2.7 days at 900s)
+            poll_interval: Seconds to sleep when idle or out of budget
+        """
+        self.runs_per_hour = runs_per_hour
+        self.urls_per_run = urls_per_run
+        self.max_parallel_runs = max_parallel_runs
+        self.min_staleness = min_staleness
+        self.max_age = max_age
+        self.recency_boost = recency_boost
+        self.recency_half_life_days = recency_half_life_days
+        self.max_backoff_doublings = max_backoff_doublings
+        self.poll_interval = poll_interval
+
+        self._run_times = deque()
+        self._stats = {
+            "cycles": 0,
+            "videos_refreshed": 0,
+            "videos_missing": 0,
+            "leads_updated": 0,
+            "actor_runs": 0,
+            "errors": 0,
+            "last_cycle_at": None,
+        }
+
+    def _remaining_budget(self, now: float) -> int:
+        while self._run_times and now - self._run_times[0] >= 3600:
+            self._run_times.popleft()
+        return self.runs_per_hour - len(self._run_times)
+
+    def pick_stalest(self, limit: int) -> List[str]:
+        """
+        Choose the contract videos most in need of a refresh
+        Args:
+            limit: Maximum number of videos
+        Returns:
+            Contract video URLs, highest priority first
+        """
+        with pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(PRIORITY_QUERY, {
+                    "min_staleness": self.min_staleness,
+                    "recency_boost": self.recency_boost,
+                    "half_life": self.recency_half_life_days,
+                    "max_backoff_doublings": self.max_backoff_doublings,
+                    "limit": limit,
+                })
+                urls = [row[0] for row in cursor.fetchall()]
+            conn.rollback()
+        return urls
+
+    def run_once(self) -> int:
+        """
+        Refresh one budget-sized batch of the stalest videos
+        Returns:
+            Number of videos sent to the scraper
+        """
+        budget = min(self._remaining_budget(time.monotonic()), self.max_parallel_runs)
+        if budget <= 0:
+            return 0
+
+        urls = self.pick_stalest(budget * self.urls_per_run)
+        if not urls:
+            return 0
+
+        runs = math.ceil(len(urls) / self.urls_per_run)
+        now = time.monotonic()
+        self._run_times.extend([now] * runs)
+        self._stats["actor_runs"] += runs
+
+        metrics, updated = refresh_contract_metrics(
+            urls, urls_per_run=self.urls_per_run, max_parallel_runs=self.max_parallel_runs
+        )
+        found = sum(1 for m in metrics.values() if m is not None)
+        self._stats["videos_refreshed"] += found
+        self._stats["videos_missing"] += len(urls) - found
+        self._stats["leads_updated"] += updated
+        return len(urls)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Refresher counters plus current queue depth and refresh lag
+        Returns:
+            Dictionary of counters and freshness measurements
+        """
+        with pooled_connection() as conn:
+            freshness = freshness_report(conn, self.max_age)
+        return {
+            **self._stats,
+            "budget_remaining": self._remaining_budget(time.monotonic()),
+            "runs_per_hour": self.runs_per_hour,
+            **freshness,
+        }
+
+    def run_forever(self) -> None:
+        """Refresh continuously, sleeping when there is nothing to do or no budget left."""
+        with pooled_connection() as conn:
+            ensure_refresh_columns(conn)
+            ensure_history_schema(conn)
+
+        while True:
+            self._stats["cycles"] += 1
+            self._stats["last_cycle_at"] = time.time()
+            try:
+                refreshed = self.run_once()
+                print(f"Refresher cycle: {refreshed} video(s) refreshed; {self.stats()}")
+            except Exception as e:
+                self._stats["errors"] += 1
+                refreshed = 0
+                print(f"Refresher cycle failed: {e}")
+            if refreshed == 0:
+                time.sleep(self.poll_interval)
+
+
+if __name__ == "__main__":
+    refresher = MetricsRefresher(
+        runs_per_hour=int(os.getenv("REFRESHER_RUNS_PER_HOUR", "30")),
+        urls_per_run=int(os.getenv("REFRESHER_URLS_PER_RUN", "50")),
+        max_parallel_runs=int(os.getenv("REFRESHER_PARALLEL_RUNS", "3")),
+        max_age=float(os.getenv("REFRESHER_MAX_AGE", "3600")),
+    )
+    refresher.run_forever()
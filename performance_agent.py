@@ -4,13 +4,131 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import dash
 from dash import dcc, html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Any, Dict
 import os
-from database import execute_query_to_json
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from db_pool import pooled_connection
+from metrics_history import metric_trend
+from render_db import add_updated_at
+from chart_data import (CHART_METRICS, GROUP_COLUMNS, OTHERS_LABEL, top_n_with_others,
+                        group_summary, percentile_bands, drill_down)
 from gemini_helper import GeminiHelper
 
+PENDING_INSIGHTS = {"status": "Generating insights..."}
+METRIC_COLUMNS = ['profile_name', 'contract_shares', 'contract_plays', 'contract_comments']
+DEFAULT_TOP_N = 20
+MAX_TOP_N = 100
+SCHEMA_SIGNATURE_QUERY = """
+SELECT md5(string_agg(column_name || ':' || data_type, ',' ORDER BY ordinal_position)),
+       array_agg(column_name::text)
+FROM information_schema.columns
+WHERE table_name = %s
+"""
+INSIGHT_METRICS = ('contract_shares', 'contract_plays', 'contract_comments')
+
+def metrics_fingerprint(raw_data):
+    """Content hash of a metrics set, independent of row order"""
+    canonical = json.dumps(
+        sorted(raw_data, key=lambda row: str(row.get('profile_name'))),
+        sort_keys=True, default=str
+    )
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+def metrics_totals(raw_data):
+    """Per-profile metric totals used to measure how much the data moved"""
+    totals = {}
+    for row in raw_data:
+        profile = totals.setdefault(row.get('profile_name'), [0.0] * len(INSIGHT_METRICS))
+        for i, column in enumerate(INSIGHT_METRICS):
+            profile[i] += float(row.get(column) or 0)
+    return totals
+
+def relative_change(old_totals, new_totals):
+    """Largest relative change of any profile metric; 1.0 when the profile set changed"""
+    if old_totals.keys() != new_totals.keys():
+        return 1.0
+    change = 0.0
+    for profile, new_values in new_totals.items():
+        for old, new in zip(old_totals[profile], new_values):
+            change = max(change, abs(new - old) / max(abs(old), 1.0))
+    return change
+
+class InsightsCache:
+    """
+    Last good LLM insights, keyed by the version of the metrics they describe.
+
+    Insights are only recomputed when the metrics changed by more than
+    `change_threshold`, and the recompute runs on a background thread so
+    readers always get the previous insights immediately.
+    """
+
+    def __init__(self, compute, change_threshold: float = 0.05):
+        """
+        Create the cache
+        Args:
+            compute: Callable (raw_data, trends) -> insights dictionary
+            change_threshold: Relative change of any profile metric that triggers a recompute
+        """
+        self.compute = compute
+        self.change_threshold = change_threshold
+        self.insights = None
+        self.version = None
+        self._totals = None
+        self._pending_version = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="insights")
+        self._stats = {"hits": 0, "recomputes": 0, "failures": 0, "skipped_below_threshold": 0}
+
+    def get(self, raw_data, trends=None):
+        """
+        Return the last good insights, scheduling a recompute if the data moved materially
+        Args:
+            raw_data: Current metrics rows
+            trends: Optional trend points passed through to compute
+        Returns:
+            Insights dictionary (PENDING_INSIGHTS until the first computation finishes)
+        """
+        version = metrics_fingerprint(raw_data)
+        totals = metrics_totals(raw_data)
+        with self._lock:
+            if version == self.version or version == self._pending_version:
+                self._stats["hits"] += 1
+            elif self._totals is not None and relative_change(self._totals, totals) < self.change_threshold:
+                self._stats["skipped_below_threshold"] += 1
+            elif self._pending_version is None:
+                self._pending_version = version
+                self._executor.submit(self._recompute, version, totals, raw_data, trends)
+            return self.insights if self.insights is not None else PENDING_INSIGHTS
+
+    def _recompute(self, version, totals, raw_data, trends):
+        try:
+            insights = self.compute(raw_data, trends)
+            failed = not isinstance(insights, dict) or "error" in insights
+        except Exception as e:
+            print(f"Error computing insights: {str(e)}")
+            failed = True
+        with self._lock:
+            self._pending_version = None
+            if failed:
+                # Keep serving the previous insights; the next tick retries
+                self._stats["failures"] += 1
+                return
+            self.insights = insights
+            self.version = version
+            self._totals = totals
+            self._stats["recomputes"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache counters and the metrics version the current insights describe"""
+        with self._lock:
+            return {**self._stats, "version": self.version, "computing": self._pending_version is not None}
+
 class PerformanceAnalysisAgent:
     def __init__(self):
         """Initialize the Performance Analysis Agent"""
@@ -21,25 +139,198 @@ class PerformanceAnalysisAgent:
         if not api_key:
             raise ValueError("GEMINI_API_KEY environment variable not found")
         self.gemini = GeminiHelper(api_key)
+        self.insights_cache = InsightsCache(
+            self.process_metrics_with_llm,
+            change_threshold=float(os.getenv("INSIGHTS_CHANGE_THRESHOLD", "0.05"))
+        )
+        # Incremental fetch state: rows are re-read only when their updated_at moves
+        self.watermark = None
+        self.watermark_overlap = 5
+        self.resync_interval = float(os.getenv("METRICS_RESYNC_INTERVAL", "900"))
+        self._schema_signature = None
+        self.group_columns = []
+        self._last_full_sync = 0.0
+        self._stats = {"full_reloads": 0, "delta_fetches": 0, "rows_fetched": 0}
+        self._sync_lock = threading.Lock()
         
-    def fetch_metrics(self):
-        """Fetch metrics from the database"""
-        query = """
+    def fetch_metrics(self, since=None):
+        """
+        Fetch metrics from the database
+        Args:
+            since: Only return rows modified at or after this updated_at watermark
+        Returns:
+            List of metric rows including their updated_at
+        """
+        query = f"""
         SELECT 
-            profile_name,
-            contract_shares,
-            contract_plays,
-            contract_comments
+            {', '.join(METRIC_COLUMNS + self.group_columns)},
+            updated_at
         FROM 
             influencer_metrics
+        {"WHERE updated_at >= %s" if since is not None else ""}
         ORDER BY 
             profile_name;
         """
         
-        results = execute_query_to_json(query)
+        with pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query, (since,) if since is not None else None)
+                columns = [desc[0] for desc in cursor.description]
+                results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            conn.rollback()
         return results
 
-    def process_metrics_with_llm(self, raw_data):
+    def schema_signature(self):
+        """Hash and column names of the influencer_metrics table"""
+        with pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(SCHEMA_SIGNATURE_QUERY, ('influencer_metrics',))
+                signature, columns = cursor.fetchone()
+            conn.rollback()
+        return signature, columns or []
+
+    def sync_metrics(self):
+        """
+        Bring self.data up to date, reading only rows changed since the last watermark
+        (thread-safe; concurrent callers sync one at a time)
+        Returns:
+            Number of rows read from the database
+        """
+        # Dash serves callbacks from several threads; the watermark read, fetch, merge and
+        # watermark advance must run as one step or concurrent syncs interleave
+        with self._sync_lock:
+            signature, columns = self.schema_signature()
+            full_reload = (
+                self.watermark is None
+                or signature != self._schema_signature
+                or time.monotonic() - self._last_full_sync >= self.resync_interval
+            )
+            if full_reload:
+                # Optional grouping columns are only selected when the table has them
+                self.group_columns = [column for column in GROUP_COLUMNS if column in columns]
+            # Re-read a short overlap so rows committed late with an older timestamp are not missed
+            since = None if full_reload else self.watermark - timedelta(seconds=self.watermark_overlap)
+            rows = self.fetch_metrics(since)
+
+            if full_reload:
+                frame = pd.DataFrame(rows, columns=METRIC_COLUMNS + self.group_columns + ['updated_at'])
+                self.data = frame.drop_duplicates('profile_name', keep='last').set_index('profile_name').sort_index()
+                self._schema_signature = signature
+                self._last_full_sync = time.monotonic()
+                self._stats["full_reloads"] += 1
+            elif rows:
+                delta = pd.DataFrame(rows).drop_duplicates('profile_name', keep='last').set_index('profile_name')
+                unchanged = self.data[~self.data.index.isin(delta.index)]
+                self.data = pd.concat([unchanged, delta[self.data.columns]]).sort_index()
+                self._stats["delta_fetches"] += 1
+            self._stats["rows_fetched"] += len(rows)
+
+            if not self.data.empty:
+                self.watermark = self.data['updated_at'].max()
+            elif full_reload:
+                self.watermark = datetime(1970, 1, 1)
+            return len(rows)
+
+    def metrics_records(self):
+        """Current metrics as a list of dictionaries, one per profile"""
+        return self.data.drop(columns=['updated_at']).reset_index().to_dict('records')
+
+    def build_figure(self, view='top', metric='contract_plays', top_n=20):
+        """
+        Build a bounded-size figure from aggregated metrics
+        Args:
+            view: 'top' for the top-N profiles plus an others bucket, or a group column
+            metric: Metric used for ranking and percentile bands
+            top_n: Profiles (or groups) plotted individually
+        Returns:
+            Plotly figure with at most top_n + 1 marks per trace
+        """
+        titles = {'contract_shares': 'Shares', 'contract_plays': 'Plays', 'contract_comments': 'Comments'}
+        if view == 'top':
+            top = top_n_with_others(self.data, metric, top_n)
+            bands = percentile_bands(self.data)
+            fig = make_subplots(rows=3, cols=1,
+                              subplot_titles=tuple(titles[m] for m in CHART_METRICS),
+                              vertical_spacing=0.1)
+            for row, column in enumerate(CHART_METRICS, start=1):
+                fig.add_trace(
+                    go.Bar(x=top.index, y=top[column], name=titles[column],
+                           customdata=top['profiles'],
+                           hovertemplate='%{x}: %{y} (%{customdata} profiles)<extra></extra>'),
+                    row=row, col=1
+                )
+                # Median across every tracked profile, for reference
+                fig.add_hline(y=bands.loc[column, 'p50'], line_dash='dot', row=row, col=1)
+            fig.update_layout(height=900, showlegend=False,
+                              title_text=f"Top {top_n} Influencers by {titles[metric]}")
+            return fig
+
+        summary = group_summary(self.data, view, metric, max_groups=top_n)
+        fig = make_subplots(rows=2, cols=1,
+                          subplot_titles=(f"Total {titles[metric]} per {view}",
+                                          f"{titles[metric]} per profile (p10-p90, median)"),
+                          vertical_spacing=0.15)
+        fig.add_trace(
+            go.Bar(x=summary.index, y=summary['total'], name='Total',
+                   customdata=summary['profiles'],
+                   hovertemplate='%{x}: %{y} (%{customdata} profiles)<extra></extra>'),
+            row=1, col=1
+        )
+        fig.add_trace(
+            go.Scatter(x=summary.index, y=summary['p50'], mode='markers', name='Median',
+                       error_y=dict(type='data', symmetric=False,
+                                    array=summary['p90'] - summary['p50'],
+                                    arrayminus=summary['p50'] - summary['p10'])),
+            row=2, col=1
+        )
+        fig.update_layout(height=900, showlegend=False,
+                          title_text=f"Influencer Performance by {view.title()}")
+        return fig
+
+    def drill_down_detail(self, label, view='top', metric='contract_plays', top_n=20):
+        """
+        Detail for one clicked bar, fetched only on request
+        Args:
+            label: Clicked bar label
+            view: View the bar belongs to
+            metric: Metric the chart was ranked by
+            top_n: top_n the chart was built with
+        Returns:
+            Dash components listing the profiles behind the bar
+        """
+        group_by = None if view == 'top' else view
+        detail = drill_down(self.data, label, metric, group_by, top_n)
+        columns = ['profile_name'] + CHART_METRICS
+        table = html.Table(
+            [html.Tr([html.Th(column) for column in columns])]
+            + [html.Tr([html.Td(profile)] + [html.Td(row[column]) for column in CHART_METRICS])
+               for profile, row in detail.iterrows()]
+        )
+        components = [html.H3(f"Details: {label}"), table]
+
+        # A single profile also gets its history from the rollups
+        if group_by is None and label != OTHERS_LABEL:
+            since = datetime.utcnow() - timedelta(days=30)
+            with pooled_connection() as conn:
+                points = metric_trend(conn, 'daily', since=since, group_by_profile=True, profile_names=[label])
+            if points:
+                trend = go.Figure(go.Scatter(x=[p['bucket'] for p in points], y=[p['plays'] for p in points],
+                                             mode='lines+markers', name='Plays'))
+                trend.update_layout(height=300, title_text=f"{label}: daily plays")
+                components.append(dcc.Graph(figure=trend))
+        return components
+
+    def fetch_trends(self, days=7):
+        """Fetch per-profile daily metric trends from the pre-computed rollups"""
+        since = datetime.utcnow() - timedelta(days=days)
+        with pooled_connection() as conn:
+            points = metric_trend(conn, 'daily', since=since, group_by_profile=True)
+        return [
+            {**point, 'bucket': point['bucket'].strftime('%Y-%m-%d')}
+            for point in points
+        ]
+
+    def process_metrics_with_llm(self, raw_data, trends=None):
         """
         Process metrics using Gemini LLM to get structured insights
         """
@@ -47,6 +338,9 @@ class PerformanceAnalysisAgent:
         prompt = f"""
         Analyze the following influencer metrics and provide insights in a structured format:
         {raw_data}
+
+        Daily totals per profile over the last days (use these for growth and decline):
+        {trends or "No history recorded yet"}
         
         Focus on:
         1. Top performing profiles
@@ -70,18 +364,35 @@ class PerformanceAnalysisAgent:
         }
         
         # Get structured analysis from Gemini
-        analysis = self.gemini.structured_analysis(prompt, analysis_structure)
+        analysis = self.gemini.structured_analysis(prompt, analysis_structure, call_site="performance_insights")
         return analysis
 
     def create_dashboard(self):
         """Create and run the dashboard"""
+        with pooled_connection() as conn:
+            add_updated_at(conn, 'influencer_metrics')
+
         app = dash.Dash(__name__)
         
+        # Load once up front so the view selector knows which group columns exist
+        self.sync_metrics()
+        views = [{'label': 'Top influencers', 'value': 'top'}] + [
+            {'label': f"By {column}", 'value': column} for column in self.group_columns
+        ]
+
         app.layout = html.Div([
             html.H1("Influencer Performance Dashboard", style={'textAlign': 'center'}),
             html.Div(id='last-update', style={'textAlign': 'center'}),
+            html.Div([
+                dcc.RadioItems(id='chart-view', options=views, value='top', inline=True),
+                dcc.Dropdown(id='chart-metric', value='contract_plays', clearable=False,
+                             options=[{'label': m.replace('contract_', '').title(), 'value': m}
+                                      for m in CHART_METRICS]),
+                dcc.Input(id='chart-top-n', type='number', min=1, max=MAX_TOP_N, value=DEFAULT_TOP_N),
+            ], style={'margin': '20px'}),
             html.Div([
                 dcc.Graph(id='metrics-graph'),
+                html.Div(id='drill-down', style={'margin': '20px'}),
                 html.Div(id='ai-insights', style={'margin': '20px', 'padding': '20px', 'border': '1px solid #ddd'})
             ]),
             dcc.Interval(
@@ -95,55 +406,33 @@ class PerformanceAnalysisAgent:
             [Output('metrics-graph', 'figure'),
              Output('last-update', 'children'),
              Output('ai-insights', 'children')],
-            [Input('interval-component', 'n_intervals')]
+            [Input('interval-component', 'n_intervals'),
+             Input('chart-view', 'value'),
+             Input('chart-metric', 'value'),
+             Input('chart-top-n', 'value')]
         )
-        def update_dashboard(n):
-            # Fetch new data
-            raw_data = self.fetch_metrics()
+        def update_dashboard(n, view, metric, top_n):
+            # Fetch only what changed since the last tick
+            self.sync_metrics()
             
-            if not raw_data:
+            if self.data.empty:
                 return {}, "No data available", "No insights available"
             
-            # Convert to DataFrame for plotting
-            self.data = pd.DataFrame(raw_data)
+            raw_data = self.metrics_records()
             self.last_update = datetime.now()
             
-            # Get AI insights
-            insights = self.process_metrics_with_llm(raw_data)
-            
-            # Create subplots for metrics
-            fig = make_subplots(rows=3, cols=1,
-                              subplot_titles=('Shares', 'Plays', 'Comments'),
-                              vertical_spacing=0.1)
-            
-            # Add traces for each metric
-            fig.add_trace(
-                go.Bar(x=self.data['profile_name'], y=self.data['contract_shares'], name='Shares'),
-                row=1, col=1
-            )
-            
-            fig.add_trace(
-                go.Bar(x=self.data['profile_name'], y=self.data['contract_plays'], name='Plays'),
-                row=2, col=1
-            )
-            
-            fig.add_trace(
-                go.Bar(x=self.data['profile_name'], y=self.data['contract_comments'], name='Comments'),
-                row=3, col=1
-            )
+            # Get AI insights (cached; recomputed in the background when the data moves)
+            insights = self.insights_cache.get(raw_data, self.fetch_trends())
             
-            # Update layout
-            fig.update_layout(
-                height=900,
-                showlegend=False,
-                title_text="Influencer Performance Metrics"
-            )
+            # Aggregate before plotting so the figure size does not grow with the profile count
+            fig = self.build_figure(view, metric, min(int(top_n or DEFAULT_TOP_N), MAX_TOP_N))
             
             last_update_text = f"Last Updated: {self.last_update.strftime('%Y-%m-%d %H:%M:%S')}"
             
             # Format insights for display
             insights_html = [
                 html.H3("AI-Generated Insights"),
+                html.P(insights.get('status', '')),
                 html.H4("Top Performers"),
                 html.Ul([html.Li(performer) for performer in insights.get('top_performers', [])]),
                 
@@ -165,6 +454,19 @@ class PerformanceAnalysisAgent:
             
             return fig, last_update_text, insights_html
         
+        @app.callback(
+            Output('drill-down', 'children'),
+            [Input('metrics-graph', 'clickData')],
+            [State('chart-view', 'value'),
+             State('chart-metric', 'value'),
+             State('chart-top-n', 'value')]
+        )
+        def show_drill_down(click_data, view, metric, top_n):
+            if not click_data or self.data.empty:
+                return []
+            label = click_data['points'][0]['x']
+            return self.drill_down_detail(label, view, metric, min(int(top_n or DEFAULT_TOP_N), MAX_TOP_N))
+        
         return app
 
 def run_agent():
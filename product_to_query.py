@@ -1,13 +1,15 @@
-from google import genai
 from google.genai import types
 from dotenv import load_dotenv
-import os
+from gemini_registry import get_client
+from llm_cache import get_llm_cache, make_llm_key
+from gemini_limiter import call_gemini, estimate_tokens
 
 load_dotenv()
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+MODEL_NAME = "gemini-2.0-flash"
+QUERY_CONFIG = {"temperature": 0}
 
-def product_description_to_query(product_description):
+def product_description_to_query(product_description, use_cache=True):
     prompt = f"""
             You are a world-class marketer. Given the following product description, 
             generate a single search query that we can look for influencers on social media.
@@ -17,18 +19,23 @@ def product_description_to_query(product_description):
             Just output a short search query in text, it should be simple keywords.
             Product description: {product_description}"""
     
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=[prompt],
-        config=types.GenerateContentConfig(
-            temperature=0
-        ),
-    )
+    def generate():
+        response = call_gemini(
+            get_client().models.generate_content,
+            model=MODEL_NAME,
+            contents=[prompt],
+            config=types.GenerateContentConfig(**QUERY_CONFIG),
+            tokens=estimate_tokens(prompt, output_tokens=32),
+        )
+        return response.text
 
-    return response
+    # Deterministic (temperature 0), so identical briefs are answered from the cache
+    cache_key = make_llm_key(MODEL_NAME, [prompt], QUERY_CONFIG)
+    return get_llm_cache().get_or_generate("product_to_query", cache_key, generate, enabled=use_cache)
     
 
 if __name__ == "__main__":
     product_description = "ElevenLabs is an AI audio research and deployment company. Our mission is to make content universally accessible in any language and in any voice. Our research team develops AI audio models that generate realistic, versatile and contextually-aware speech, voices, and sound effects across 32 languages."
     response = product_description_to_query(product_description)
     print(response.text)
+    print(get_llm_cache().stats())
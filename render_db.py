@@ -1,8 +1,13 @@
 import psycopg2
 from psycopg2 import sql
-import os
+from psycopg2.extras import execute_values
+import time
+import uuid
+import struct
+import datetime
 from dotenv import load_dotenv
-from urllib.parse import urlparse
+from db_pool import pooled_connection, pool_stats
+from statement_cache import statement_cache
 
 load_dotenv()
 
@@ -15,30 +20,398 @@ def insert_data(connection, table_name, data):
     - table_name (str): Name of the table to insert data into.
     - data (dict): A dictionary where keys are column names and values are the data to insert.
 
+    Returns:
+    - True if the row was written, False if the insert failed.
+
     Example:
     insert_data(conn, 'employees', {'name': 'John Doe', 'age': 30, 'department': 'HR'})
     """
-    columns = data.keys()
+    columns = tuple(data.keys())
     values = [data[column] for column in columns]
 
-    insert_query = sql.SQL(
-        "INSERT INTO {table} ({fields}) VALUES ({placeholders})"
+    def build_query():
+        return sql.SQL(
+            "INSERT INTO {table} ({fields}) VALUES ({placeholders})"
+        ).format(
+            table=sql.Identifier(table_name),
+            fields=sql.SQL(', ').join(map(sql.Identifier, columns)),
+            placeholders=sql.SQL(', ').join(sql.Placeholder() * len(columns))
+        )
+
+    try:
+        with connection.cursor() as cursor:
+            statement_cache.execute(cursor, ('insert', table_name, columns), build_query, values)
+            connection.commit()
+            print(f"Data inserted successfully into {table_name} table.")
+            return True
+    except Exception as error:
+        print(f"Error inserting data into {table_name}: {error}")
+        connection.rollback()
+        statement_cache.invalidate(connection)
+        return False
+
+def upsert_data(connection, table_name, rows, conflict_columns, update_columns=None, raise_errors=False):
+    """
+    Inserts or updates many rows in a single statement and transaction.
+
+    Uses a multi-row VALUES list with INSERT ... ON CONFLICT DO UPDATE, so the whole
+    batch costs one round trip. Rows sharing a conflict key are collapsed first
+    (last one wins), since PostgreSQL refuses to update the same row twice.
+    The conflict columns must be covered by a unique index.
+
+    Parameters:
+    - connection: psycopg2 connection object to the database.
+    - table_name (str): Name of the table to write to.
+    - rows (list): List of dictionaries with identical keys (column names).
+    - conflict_columns (list): Columns identifying an existing row.
+    - update_columns (list): Columns refreshed on conflict; default is every non-key column.
+      Pass an empty list to leave existing rows untouched.
+    - raise_errors (bool): Re-raise database errors (after rolling back) instead of returning 0.
+
+    Returns:
+    - Number of rows inserted or updated.
+
+    Example:
+    upsert_data(conn, 'leads', [{'platform': 'tiktok', 'profile_name': 'a', 'fans': 10}],
+                ['platform', 'profile_name'], ['fans'])
+    """
+    if not rows:
+        return 0
+
+    columns = list(rows[0].keys())
+    if update_columns is None:
+        update_columns = [column for column in columns if column not in conflict_columns]
+
+    unique_rows = {}
+    for row in rows:
+        unique_rows[tuple(row[column] for column in conflict_columns)] = row
+    values = [tuple(row[column] for column in columns) for row in unique_rows.values()]
+
+    if update_columns:
+        conflict_action = sql.SQL("DO UPDATE SET {}").format(sql.SQL(', ').join(
+            sql.SQL("{col} = EXCLUDED.{col}").format(col=sql.Identifier(column))
+            for column in update_columns
+        ))
+    else:
+        conflict_action = sql.SQL("DO NOTHING")
+
+    upsert_query = sql.SQL(
+        "INSERT INTO {table} ({fields}) VALUES %s ON CONFLICT ({keys}) {action}"
     ).format(
         table=sql.Identifier(table_name),
         fields=sql.SQL(', ').join(map(sql.Identifier, columns)),
-        placeholders=sql.SQL(', ').join(sql.Placeholder() * len(columns))
+        keys=sql.SQL(', ').join(map(sql.Identifier, conflict_columns)),
+        action=conflict_action
     )
 
     try:
         with connection.cursor() as cursor:
-            cursor.execute(insert_query, values)
+            # page_size covers the whole batch so it is sent as one statement
+            execute_values(cursor, upsert_query.as_string(connection), values, page_size=len(values))
+            row_count = cursor.rowcount
             connection.commit()
-            print(f"Data inserted successfully into {table_name} table.")
+            print(f"Upserted {row_count} row(s) into {table_name} table.")
+            return row_count
     except Exception as error:
-        print(f"Error inserting data into {table_name}: {error}")
+        print(f"Error upserting data into {table_name}: {error}")
         connection.rollback()
+        if raise_errors:
+            raise
+        return 0
 
-def fetch_data(connection, table_name, columns='*', condition=None):
+def bulk_update_data(connection, table_name, rows, key_columns):
+    """
+    Updates many rows with different values in one set-based statement.
+
+    Builds UPDATE ... FROM (VALUES ...) so every row is matched and updated
+    by a single join instead of one UPDATE per row. Values are cast to the
+    target column types, so a column that is NULL in every row is not typed
+    as text.
+
+    Parameters:
+    - connection: psycopg2 connection object to the database.
+    - table_name (str): Name of the table to update.
+    - rows (list): List of dictionaries with identical keys; key_columns identify the
+      target row(s), every other key is a column to set.
+    - key_columns (list): Columns used to match rows.
+
+    Returns:
+    - Number of table rows updated.
+
+    Example:
+    bulk_update_data(conn, 'leads', [{'contract_vid': url, 'contract_plays': 1000}], ['contract_vid'])
+    """
+    if not rows:
+        return 0
+
+    columns = list(rows[0].keys())
+    set_columns = [column for column in columns if column not in key_columns]
+    values = [tuple(row[column] for column in columns) for row in rows]
+
+    update_query = sql.SQL(
+        "UPDATE {table} AS t SET {set_items} FROM (VALUES %s) AS v ({fields}) WHERE {match}"
+    ).format(
+        table=sql.Identifier(table_name),
+        set_items=sql.SQL(', ').join(
+            sql.SQL("{col} = v.{col}").format(col=sql.Identifier(column)) for column in set_columns
+        ),
+        fields=sql.SQL(', ').join(map(sql.Identifier, columns)),
+        match=sql.SQL(' AND ').join(
+            sql.SQL("t.{col} = v.{col}").format(col=sql.Identifier(column)) for column in key_columns
+        )
+    )
+
+    try:
+        column_types = _column_types(connection, table_name, columns)
+        template = sql.SQL("({})").format(sql.SQL(', ').join(
+            sql.SQL("%s::{}").format(sql.Identifier(column_type)) for column_type in column_types
+        ))
+        with connection.cursor() as cursor:
+            execute_values(cursor, update_query.as_string(connection), values,
+                           template=template.as_string(connection), page_size=len(values))
+            row_count = cursor.rowcount
+            connection.commit()
+            print(f"Updated {row_count} row(s) in {table_name} table.")
+            return row_count
+    except Exception as error:
+        print(f"Error bulk updating data in {table_name}: {error}")
+        connection.rollback()
+        return 0
+
+COPY_BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+COPY_BINARY_TRAILER = struct.pack('!h', -1)
+PG_EPOCH = datetime.datetime(2000, 1, 1)
+PG_EPOCH_DATE = PG_EPOCH.date()
+
+def _encode_timestamp(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    delta = value - PG_EPOCH
+    return struct.pack('!q', (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds)
+
+def _encode_text(value):
+    return str(value).encode('utf-8')
+
+# PostgreSQL type name -> encoder for the binary COPY format
+COPY_BINARY_ENCODERS = {
+    'int2': lambda value: struct.pack('!h', value),
+    'int4': lambda value: struct.pack('!i', value),
+    'int8': lambda value: struct.pack('!q', value),
+    'float4': lambda value: struct.pack('!f', value),
+    'float8': lambda value: struct.pack('!d', value),
+    'bool': lambda value: struct.pack('!?', value),
+    'text': _encode_text,
+    'varchar': _encode_text,
+    'bpchar': _encode_text,
+    'name': _encode_text,
+    'json': _encode_text,
+    'jsonb': lambda value: b'\x01' + _encode_text(value),
+    'bytea': bytes,
+    'timestamp': _encode_timestamp,
+    'timestamptz': _encode_timestamp,
+    'date': lambda value: struct.pack('!i', (value - PG_EPOCH_DATE).days),
+}
+
+COPY_TEXT_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+class _CopyStream:
+    """
+    File-like adapter that encodes rows lazily as COPY consumes them.
+
+    Only about one read() worth of encoded data is held at a time, so the
+    source iterable can be arbitrarily large.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buffer = bytearray()
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+def _column_types(connection, table_name, columns):
+    """Look up the PostgreSQL type name of each column."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT a.attname, t.typname FROM pg_attribute a "
+            "JOIN pg_type t ON t.oid = a.atttypid "
+            "WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped",
+            (sql.Identifier(table_name).as_string(connection),)
+        )
+        types = dict(cursor.fetchall())
+    missing = [column for column in columns if column not in types]
+    if missing:
+        raise ValueError(f"Unknown column(s) in {table_name}: {', '.join(missing)}")
+    return [types[column] for column in columns]
+
+def _copy_chunks(rows, columns, copy_format, column_types, counter):
+    """Yield encoded COPY data for each row, counting rows as they are produced."""
+    if copy_format == 'binary':
+        encoders = []
+        for column, type_name in zip(columns, column_types):
+            if type_name not in COPY_BINARY_ENCODERS:
+                raise ValueError(f"Binary COPY does not support column {column} of type {type_name}; "
+                                 f"use copy_format='text'")
+            encoders.append(COPY_BINARY_ENCODERS[type_name])
+        field_count = struct.pack('!h', len(columns))
+        yield COPY_BINARY_HEADER
+
+    for row in rows:
+        values = [row.get(column) for column in columns] if isinstance(row, dict) else row
+        if copy_format == 'binary':
+            parts = [field_count]
+            for encode, value in zip(encoders, values):
+                if value is None:
+                    parts.append(b'\xff\xff\xff\xff')
+                else:
+                    data = encode(value)
+                    parts.append(struct.pack('!i', len(data)))
+                    parts.append(data)
+            yield b''.join(parts)
+        else:
+            yield ('\t'.join(
+                '\\N' if value is None else str(value).translate(COPY_TEXT_ESCAPES)
+                for value in values
+            ) + '\n').encode('utf-8')
+        counter[0] += 1
+
+    if copy_format == 'binary':
+        yield COPY_BINARY_TRAILER
+
+def _copy_into(connection, table_name, rows, columns, copy_format, buffer_size):
+    """Run one COPY FROM STDIN on an open transaction; returns the number of rows sent."""
+    if copy_format not in ('text', 'binary'):
+        raise ValueError(f"Unsupported COPY format: {copy_format}")
+    column_types = _column_types(connection, table_name, columns) if copy_format == 'binary' else None
+
+    copy_query = sql.SQL("COPY {table} ({fields}) FROM STDIN WITH (FORMAT {format})").format(
+        table=sql.Identifier(table_name),
+        fields=sql.SQL(', ').join(map(sql.Identifier, columns)),
+        format=sql.SQL(copy_format)
+    )
+    counter = [0]
+    stream = _CopyStream(_copy_chunks(iter(rows), columns, copy_format, column_types, counter))
+    with connection.cursor() as cursor:
+        cursor.copy_expert(copy_query.as_string(connection), stream, size=buffer_size)
+    return counter[0]
+
+def bulk_load(connection, table_name, rows, columns, copy_format='text', buffer_size=65536):
+    """
+    Loads many rows into a table with COPY FROM STDIN.
+
+    Rows are encoded lazily while PostgreSQL reads them, holding at most about
+    `buffer_size` bytes, so generators of any length can be loaded. Everything
+    is committed as one transaction.
+
+    Parameters:
+    - connection: psycopg2 connection object to the database.
+    - table_name (str): Name of the table to load into.
+    - rows (iterable): Dicts keyed by column name or tuples ordered like `columns`.
+    - columns (list): Target columns.
+    - copy_format (str): 'text' or 'binary'. Binary avoids text parsing on the server but
+      only supports integer, float, boolean, text, json, bytea, date and timestamp columns.
+    - buffer_size (int): Bytes handed to COPY per read.
+
+    Returns:
+    - Dictionary with the number of rows loaded and the elapsed time in seconds.
+
+    Example:
+    bulk_load(conn, 'leads', ({'profile_name': n, 'platform': 'tiktok'} for n in names),
+              ['profile_name', 'platform'])
+    """
+    start = time.perf_counter()
+    try:
+        row_count = _copy_into(connection, table_name, rows, columns, copy_format, buffer_size)
+        connection.commit()
+    except Exception as error:
+        print(f"Error bulk loading data into {table_name}: {error}")
+        connection.rollback()
+        return {"rows": 0, "elapsed": time.perf_counter() - start, "error": str(error)}
+
+    elapsed = time.perf_counter() - start
+    print(f"Loaded {row_count} row(s) into {table_name} table in {elapsed:.2f}s.")
+    return {"rows": row_count, "elapsed": elapsed}
+
+def bulk_upsert(connection, table_name, rows, columns, conflict_columns, update_columns=None,
+                copy_format='text', buffer_size=65536):
+    """
+    Loads many rows with COPY into a temporary staging table, then merges them
+    into the target table with INSERT ... ON CONFLICT, all in one transaction.
+
+    Parameters:
+    - connection: psycopg2 connection object to the database.
+    - table_name (str): Name of the table to merge into.
+    - rows (iterable): Dicts keyed by column name or tuples ordered like `columns`.
+    - columns (list): Columns present in every row.
+    - conflict_columns (list): Columns of a unique index identifying an existing row.
+    - update_columns (list): Columns refreshed on conflict; default is every non-key column.
+    - copy_format (str): 'text' or 'binary', see bulk_load.
+    - buffer_size (int): Bytes handed to COPY per read.
+
+    Returns:
+    - Dictionary with the number of rows staged, rows merged and the elapsed time in seconds.
+
+    Example:
+    bulk_upsert(conn, 'leads', leads, ['platform', 'profile_name', 'fans'],
+                ['platform', 'profile_name'])
+    """
+    if update_columns is None:
+        update_columns = [column for column in columns if column not in conflict_columns]
+    staging_table = f"staging_{table_name}_{uuid.uuid4().hex[:8]}"
+    fields = sql.SQL(', ').join(map(sql.Identifier, columns))
+    keys = sql.SQL(', ').join(map(sql.Identifier, conflict_columns))
+
+    if update_columns:
+        conflict_action = sql.SQL("DO UPDATE SET {}").format(sql.SQL(', ').join(
+            sql.SQL("{col} = EXCLUDED.{col}").format(col=sql.Identifier(column))
+            for column in update_columns
+        ))
+    else:
+        conflict_action = sql.SQL("DO NOTHING")
+
+    start = time.perf_counter()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql.SQL(
+                "CREATE TEMP TABLE {staging} ON COMMIT DROP AS SELECT {fields} FROM {table} WITH NO DATA"
+            ).format(staging=sql.Identifier(staging_table), fields=fields, table=sql.Identifier(table_name)))
+
+        staged = _copy_into(connection, staging_table, rows, columns, copy_format, buffer_size)
+
+        with connection.cursor() as cursor:
+            # Keep the last staged row per key; ON CONFLICT cannot touch a row twice
+            cursor.execute(sql.SQL(
+                "INSERT INTO {table} ({fields}) "
+                "SELECT DISTINCT ON ({keys}) {fields} FROM {staging} ORDER BY {keys}, ctid DESC "
+                "ON CONFLICT ({keys}) {action}"
+            ).format(
+                table=sql.Identifier(table_name),
+                staging=sql.Identifier(staging_table),
+                fields=fields,
+                keys=keys,
+                action=conflict_action
+            ))
+            merged = cursor.rowcount
+        connection.commit()
+    except Exception as error:
+        print(f"Error bulk upserting data into {table_name}: {error}")
+        connection.rollback()
+        return {"rows": 0, "merged": 0, "elapsed": time.perf_counter() - start, "error": str(error)}
+
+    elapsed = time.perf_counter() - start
+    print(f"Merged {merged} of {staged} staged row(s) into {table_name} table in {elapsed:.2f}s.")
+    return {"rows": staged, "merged": merged, "elapsed": elapsed}
+
+def fetch_data(connection, table_name, columns='*', condition=None, params=None):
     """
     Fetches data from the specified PostgreSQL table.
 
@@ -47,35 +420,251 @@ def fetch_data(connection, table_name, columns='*', condition=None):
     - table_name (str): Name of the table to fetch data from.
     - columns (str or list): Columns to retrieve; default is '*' (all columns).
     - condition (str): SQL condition for filtering data; default is None.
+    - params (list): Values for %s placeholders in the condition. Prefer these over
+      inlining values so the statement can be prepared once and reused.
 
     Returns:
     - List of tuples containing the fetched data.
 
     Example:
-    fetch_data(conn, 'employees', ['name', 'age'], "department = 'HR'")
+    fetch_data(conn, 'employees', ['name', 'age'], "department = %s", ['HR'])
     """
     if isinstance(columns, list):
         columns = ', '.join(columns)
 
-    fetch_query = sql.SQL("SELECT {fields} FROM {table}").format(
-        fields=sql.SQL(columns),
-        table=sql.Identifier(table_name)
-    )
-
-    if condition:
-        fetch_query += sql.SQL(" WHERE {condition}").format(
-            condition=sql.SQL(condition)
+    def build_query():
+        fetch_query = sql.SQL("SELECT {fields} FROM {table}").format(
+            fields=sql.SQL(columns),
+            table=sql.Identifier(table_name)
         )
 
+        if condition:
+            fetch_query += sql.SQL(" WHERE {condition}").format(
+                condition=sql.SQL(condition)
+            )
+        return fetch_query
+
     try:
         with connection.cursor() as cursor:
-            cursor.execute(fetch_query)
+            statement_cache.execute(cursor, ('select', table_name, columns, condition), build_query, params)
             results = cursor.fetchall()
             return results
     except Exception as error:
         print(f"Error fetching data from {table_name}: {error}")
+        connection.rollback()
+        statement_cache.invalidate(connection)
         return []
 
+FILTER_OPERATORS = {'=', '!=', '<', '<=', '>', '>='}
+
+def _filter_conditions(filters):
+    """Compose WHERE predicates and their bound values from a fetch_page-style filters dict."""
+    conditions = []
+    values = []
+    for column, condition in (filters or {}).items():
+        if isinstance(condition, list):
+            predicates = condition
+        elif isinstance(condition, tuple):
+            predicates = [condition]
+        else:
+            predicates = [('=', condition)]
+        for operator, value in predicates:
+            if operator not in FILTER_OPERATORS:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+            if value is None:
+                conditions.append(sql.SQL("{} IS NULL" if operator == '=' else "{} IS NOT NULL").format(
+                    sql.Identifier(column)))
+                continue
+            conditions.append(sql.SQL("{} " + operator + " %s").format(sql.Identifier(column)))
+            values.append(value)
+    return conditions, values
+
+def fetch_page(connection, table_name, columns=None, filters=None, order_by='id',
+               descending=False, after=None, limit=100, key_column='id'):
+    """
+    Fetches one page of rows using keyset (seek) pagination.
+
+    Unlike OFFSET paging the cost of a page does not grow with its position,
+    as long as there is an index on (order_by, key_column).
+
+    Parameters:
+    - connection: psycopg2 connection object to the database.
+    - table_name (str): Name of the table to fetch data from.
+    - columns (list): Columns to retrieve; default is None (all columns).
+    - filters (dict): Column name mapped to a value (equality), an (operator, value) tuple or a
+                      list of such tuples, operator being one of =, !=, <, <=, >, >=.
+                      Values are always bound as parameters.
+    - order_by (str): Column to sort on; rows with NULL in it sort last.
+    - descending (bool): Sort direction.
+    - after: Cursor returned for the previous page, or None for the first page.
+    - limit (int): Maximum number of rows to return.
+    - key_column (str): Unique column used to break ties in the sort order.
+
+    Returns:
+    - Tuple (rows, next_after): rows as a list of dicts, next_after is the cursor for the
+      following page or None when this was the last page.
+
+    Example:
+    rows, cursor = fetch_page(conn, 'leads', ['id', 'profile_name', 'fans'],
+                              {'platform': 'tiktok', 'fans': ('>=', 10000)},
+                              order_by='fans', descending=True, limit=50)
+    rows, cursor = fetch_page(conn, 'leads', ..., after=cursor)
+    """
+    select_columns = list(columns) if columns else None
+    if select_columns is not None:
+        for needed in (key_column, order_by):
+            if needed not in select_columns:
+                select_columns.append(needed)
+        fields = sql.SQL(', ').join(map(sql.Identifier, select_columns))
+    else:
+        fields = sql.SQL('*')
+
+    conditions, values = _filter_conditions(filters)
+
+    sort = sql.Identifier(order_by)
+    key = sql.Identifier(key_column)
+    seek = sql.SQL('<' if descending else '>')
+    direction = sql.SQL('DESC' if descending else 'ASC')
+
+    if after is not None:
+        if order_by == key_column:
+            conditions.append(sql.SQL("{key} {seek} %s").format(key=key, seek=seek))
+            values.append(after)
+        else:
+            last_value, last_key = after
+            if last_value is None:
+                # NULLs sort last, so only the remaining NULL rows are left.
+                conditions.append(sql.SQL("({sort} IS NULL AND {key} {seek} %s)").format(
+                    sort=sort, key=key, seek=seek))
+                values.append(last_key)
+            else:
+                conditions.append(sql.SQL(
+                    "({sort} {seek} %s OR ({sort} = %s AND {key} {seek} %s) OR {sort} IS NULL)"
+                ).format(sort=sort, key=key, seek=seek))
+                values.extend([last_value, last_value, last_key])
+
+    fetch_query = sql.SQL("SELECT {fields} FROM {table}").format(
+        fields=fields,
+        table=sql.Identifier(table_name)
+    )
+    if conditions:
+        fetch_query += sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions)
+    if order_by == key_column:
+        fetch_query += sql.SQL(" ORDER BY {key} {direction}").format(key=key, direction=direction)
+    else:
+        fetch_query += sql.SQL(" ORDER BY {sort} {direction} NULLS LAST, {key} {direction}").format(
+            sort=sort, key=key, direction=direction)
+    # Read one extra row to learn whether another page exists.
+    fetch_query += sql.SQL(" LIMIT %s")
+    values.append(limit + 1)
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(fetch_query, values)
+            names = [desc[0] for desc in cursor.description]
+            rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+    except Exception as error:
+        print(f"Error fetching page from {table_name}: {error}")
+        connection.rollback()
+        return [], None
+
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_after = last[key_column] if order_by == key_column else (last[order_by], last[key_column])
+    return rows, next_after
+
+def stream_data(connection, table_name, columns=None, filters=None, order_by=None,
+                descending=False, itersize=2000):
+    """
+    Streams rows from a table through a server-side (named) cursor.
+
+    Rows are pulled from PostgreSQL `itersize` at a time, so memory use stays flat
+    regardless of table size. The generator keeps a transaction open on the
+    connection until it is exhausted or closed.
+
+    Parameters:
+    - connection: psycopg2 connection object to the database.
+    - table_name (str): Name of the table to read.
+    - columns (list): Columns to retrieve; default is None (all columns).
+    - filters (dict): Same format as in fetch_page.
+    - order_by (str): Optional column to sort on.
+    - descending (bool): Sort direction.
+    - itersize (int): Rows fetched per network round trip.
+
+    Yields:
+    - One dict per row.
+
+    Example:
+    for row in stream_data(conn, 'leads', ['id', 'profile_name'], {'platform': 'tiktok'}):
+        print(row)
+    """
+    fields = sql.SQL(', ').join(map(sql.Identifier, columns)) if columns else sql.SQL('*')
+    conditions, values = _filter_conditions(filters)
+
+    stream_query = sql.SQL("SELECT {fields} FROM {table}").format(
+        fields=fields,
+        table=sql.Identifier(table_name)
+    )
+    if conditions:
+        stream_query += sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions)
+    if order_by:
+        stream_query += sql.SQL(" ORDER BY {sort} {direction}").format(
+            sort=sql.Identifier(order_by),
+            direction=sql.SQL('DESC' if descending else 'ASC'))
+
+    cursor = connection.cursor(name=f"stream_{table_name}_{uuid.uuid4().hex[:12]}")
+    cursor.itersize = itersize
+    try:
+        cursor.execute(stream_query, values)
+        names = None
+        for row in cursor:
+            if names is None:
+                names = [desc[0] for desc in cursor.description]
+            yield dict(zip(names, row))
+    finally:
+        cursor.close()
+        # End the read transaction holding the server-side cursor
+        connection.rollback()
+
+def create_index(connection, table_name, columns, index_name=None, unique=False):
+    """
+    Creates a B-tree index on the given columns if it does not exist yet.
+
+    Parameters:
+    - connection: psycopg2 connection object to the database.
+    - table_name (str): Name of the table to index.
+    - columns (list): Indexed columns, in order.
+    - index_name (str): Optional index name; derived from table and columns by default.
+    - unique (bool): Create a UNIQUE index, e.g. to back an ON CONFLICT target.
+
+    Returns:
+    - True if the index exists afterwards, False if creating it failed.
+
+    Example:
+    create_index(conn, 'leads', ['fans', 'id'])
+    create_index(conn, 'leads', ['platform', 'profile_name'], unique=True)
+    """
+    index_name = index_name or f"{'uq' if unique else 'idx'}_{table_name}_{'_'.join(columns)}"
+    index_query = sql.SQL("CREATE {unique}INDEX IF NOT EXISTS {name} ON {table} ({columns})").format(
+        unique=sql.SQL('UNIQUE ' if unique else ''),
+        name=sql.Identifier(index_name),
+        table=sql.Identifier(table_name),
+        columns=sql.SQL(', ').join(map(sql.Identifier, columns))
+    )
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(index_query)
+            connection.commit()
+            print(f"Index {index_name} created successfully.")
+            return True
+    except Exception as error:
+        print(f"Error creating index {index_name}: {error}")
+        connection.rollback()
+        return False
+
 def create_table(connection, table_name, columns_definition):
     """
     Creates a new table in the PostgreSQL database.
@@ -117,6 +706,78 @@ def create_table(connection, table_name, columns_definition):
         print(f"Error creating table {table_name}: {error}")
         connection.rollback()
 
+def add_columns(connection, table_name, columns_definition):
+    """
+    Adds columns to an existing table, skipping the ones that already exist.
+
+    Parameters:
+    - connection: psycopg2 connection object to the database.
+    - table_name (str): Name of the table to alter.
+    - columns_definition (dict): Column names mapped to their definitions, as in create_table.
+
+    Example:
+    add_columns(conn, 'leads', {'contract_metrics_updated_at': 'TIMESTAMP NULL'})
+    """
+    alter_query = sql.SQL("ALTER TABLE {table} {actions}").format(
+        table=sql.Identifier(table_name),
+        actions=sql.SQL(', ').join(
+            sql.SQL("ADD COLUMN IF NOT EXISTS {} {}").format(sql.Identifier(column), sql.SQL(definition))
+            for column, definition in columns_definition.items()
+        )
+    )
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(alter_query)
+            connection.commit()
+            print(f"Columns added to {table_name} successfully.")
+    except Exception as error:
+        print(f"Error adding columns to {table_name}: {error}")
+        connection.rollback()
+
+def add_updated_at(connection, table_name, column='updated_at'):
+    """
+    Gives a table an indexed modification timestamp that every UPDATE bumps, so
+    readers can fetch only the rows changed since a watermark.
+
+    Parameters:
+    - connection: psycopg2 connection object to the database.
+    - table_name (str): Name of the table to alter.
+    - column (str): Name of the timestamp column.
+
+    Example:
+    add_updated_at(conn, 'influencer_metrics')
+    """
+    function_name = f"{table_name}_touch_{column}"
+    statements = [
+        sql.SQL("ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'UTC')"),
+        sql.SQL("CREATE INDEX IF NOT EXISTS {index} ON {table} ({column})"),
+        sql.SQL(
+            "CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$ "
+            "BEGIN NEW.{column} := now() AT TIME ZONE 'UTC'; RETURN NEW; END; "
+            "$$ LANGUAGE plpgsql"
+        ),
+        sql.SQL("DROP TRIGGER IF EXISTS {trigger} ON {table}"),
+        sql.SQL("CREATE TRIGGER {trigger} BEFORE UPDATE ON {table} FOR EACH ROW EXECUTE FUNCTION {function}()"),
+    ]
+    names = {
+        'table': sql.Identifier(table_name),
+        'column': sql.Identifier(column),
+        'index': sql.Identifier(f"idx_{table_name}_{column}"),
+        'function': sql.Identifier(function_name),
+        'trigger': sql.Identifier(f"trg_{function_name}"),
+    }
+
+    try:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement.format(**names))
+            connection.commit()
+            print(f"Modification timestamp added to {table_name} successfully.")
+    except Exception as error:
+        print(f"Error adding modification timestamp to {table_name}: {error}")
+        connection.rollback()
+
 def delete_table(connection, table_name, confirm=False):
     """
     Deletes a table from the PostgreSQL database.
@@ -175,7 +836,7 @@ def clear_table(connection, table_name, confirm=False):
         print(f"Error clearing table {table_name}: {error}")
         connection.rollback()
 
-def update_data(connection, table_name, data, condition):
+def update_data(connection, table_name, data, condition, params=None):
     """
     Updates data in the specified PostgreSQL table based on a condition.
 
@@ -184,31 +845,31 @@ def update_data(connection, table_name, data, condition):
     - table_name (str): Name of the table to update.
     - data (dict): A dictionary where keys are column names and values are the data to update.
     - condition (str): SQL condition for identifying which row(s) to update.
+    - params (list): Values for %s placeholders in the condition, bound after the SET values.
 
     Example:
-    update_data(conn, 'employees', {'department': 'Marketing', 'salary': 65000}, "id = 5")
+    update_data(conn, 'employees', {'department': 'Marketing', 'salary': 65000}, "id = %s", [5])
     """
     if not data:
         print("No data provided for update.")
         return
 
-    # Prepare the SET part of the query
-    set_items = []
-    values = []
-    
-    for column, value in data.items():
-        set_items.append(sql.SQL("{} = %s").format(sql.Identifier(column)))
-        values.append(value)
-    
-    update_query = sql.SQL("UPDATE {table} SET {set_items} WHERE {condition}").format(
-        table=sql.Identifier(table_name),
-        set_items=sql.SQL(", ").join(set_items),
-        condition=sql.SQL(condition)
-    )
+    columns = tuple(data.keys())
+    values = [data[column] for column in columns] + list(params or [])
+
+    def build_query():
+        # Prepare the SET part of the query
+        set_items = [sql.SQL("{} = %s").format(sql.Identifier(column)) for column in columns]
+
+        return sql.SQL("UPDATE {table} SET {set_items} WHERE {condition}").format(
+            table=sql.Identifier(table_name),
+            set_items=sql.SQL(", ").join(set_items),
+            condition=sql.SQL(condition)
+        )
 
     try:
         with connection.cursor() as cursor:
-            cursor.execute(update_query, values)
+            statement_cache.execute(cursor, ('update', table_name, columns, condition), build_query, values)
             row_count = cursor.rowcount
             connection.commit()
             print(f"Updated {row_count} row(s) in {table_name} table.")
@@ -216,58 +877,50 @@ def update_data(connection, table_name, data, condition):
     except Exception as error:
         print(f"Error updating data in {table_name}: {error}")
         connection.rollback()
+        statement_cache.invalidate(connection)
         return 0
 
 # Example usage:
 if __name__ == "__main__":
-    result = urlparse(os.getenv("DATABASE_URL"))
-    username = result.username
-    password = result.password
-    database = result.path[1:]
-    hostname = result.hostname
-
-    connection = None  # Initialize connection to None
-
     try:
-        conn = psycopg2.connect(
-        user=username,
-        password=password,
-        host=hostname,
-        port="5432",
-        database=database
-        )
-
-        # delete_table(conn, 'leads', confirm=True)
-
-        # create_table(conn, 'leads', {
-        #     'id': 'SERIAL PRIMARY KEY',
-        #     'profile_name': 'VARCHAR(255) NOT NULL',
-        #     'fans': 'INTEGER',
-        #     'hearts': 'INTEGER',
-        #     'videos': 'INTEGER',
-        #     'platform': 'VARCHAR(50)',
-        #     'email': 'VARCHAR(255)',
-        #     'lead_stage': 'VARCHAR(50)',
-        #     'contract_vid': 'VARCHAR(255) NULL',
-        #     'created_at': 'TIMESTAMP NULL',
-        #     'contract_shares': 'INTEGER NULL',
-        #     'contract_plays': 'INTEGER NULL',
-        #     'contract_comments': 'INTEGER NULL'
-        # })
-
-        # insert_data(conn, 'leads', {
-        #     'profile_name': 'test_user',
-        #     'fans': 1000,
-        #     'hearts': 500,
-        #     'email': 'test@domain.com',
-        #     'contract_vid': 'test_url',
-        #     'lead_stage': 'prospect'
-        # })
-
-        print(fetch_data(conn, 'leads'))
-
+        with pooled_connection() as conn:
+            # delete_table(conn, 'leads', confirm=True)
+
+            # create_table(conn, 'leads', {
+            #     'id': 'SERIAL PRIMARY KEY',
+            #     'profile_name': 'VARCHAR(255) NOT NULL',
+            #     'fans': 'INTEGER',
+            #     'hearts': 'INTEGER',
+            #     'videos': 'INTEGER',
+            #     'platform': 'VARCHAR(50)',
+            #     'email': 'VARCHAR(255)',
+            #     'lead_stage': 'VARCHAR(50)',
+            #     'contract_vid': 'VARCHAR(255) NULL',
+            #     'created_at': 'TIMESTAMP NULL',
+            #     'contract_shares': 'INTEGER NULL',
+            #     'contract_plays': 'INTEGER NULL',
+            #     'contract_comments': 'INTEGER NULL'
+            # })
+
+            # Indexes backing the keyset-paginated /api/influencers sort orders
+            # for column in ('fans', 'platform', 'lead_stage'):
+            #     create_index(conn, 'leads', [column, 'id'])
+
+            # Conflict target for upserting scraped leads (removes existing duplicates first)
+            # from scrap_tiktok import ensure_leads_unique_index
+            # ensure_leads_unique_index(conn)
+
+            # insert_data(conn, 'leads', {
+            #     'profile_name': 'test_user',
+            #     'fans': 1000,
+            #     'hearts': 500,
+            #     'email': 'test@domain.com',
+            #     'contract_vid': 'test_url',
+            #     'lead_stage': 'prospect'
+            # })
+
+            print(fetch_data(conn, 'leads'))
+
+        print(pool_stats())
     except Exception as e:
         print(f"Database connection error: {e}")
-    finally:
-        if conn:
-            conn.close()
@@ -1,9 +1,12 @@
 from apify_client import ApifyClient
 import os
+import re
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from render_db import insert_data
-from urllib.parse import urlparse
-import psycopg2
+from render_db import add_columns, bulk_update_data
+from db_pool import pooled_connection
+from metrics_history import ensure_history_schema, record_snapshots
 
 load_dotenv()
 
@@ -11,13 +14,47 @@ load_dotenv()
 # Replace '<YOUR_API_TOKEN>' with your token.
 client = ApifyClient(os.getenv("APIFY_API_KEY"))
 
-def scrap_performance(vid_url):
+VIDEO_ID_PATTERN = re.compile(r"/video/(\d+)")
+
+def video_key(url_or_item):
+    """
+    Stable key for a TikTok video: its numeric id when it can be found,
+    otherwise the URL without query string or trailing slash.
+    """
+    if isinstance(url_or_item, dict):
+        if url_or_item.get("id"):
+            return str(url_or_item["id"])
+        url_or_item = url_or_item.get("webVideoUrl") or url_or_item.get("submittedVideoUrl") or ""
+    match = VIDEO_ID_PATTERN.search(url_or_item)
+    if match:
+        return match.group(1)
+    return url_or_item.split("?")[0].rstrip("/")
+
+def parse_create_time(value):
+    """Parse createTimeISO (e.g. 2024-03-01T12:00:00.000Z) into a naive UTC datetime."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def video_metrics(vid):
+    return {
+        "created_time": vid.get("createTimeISO"),
+        "shares": vid.get("shareCount"),
+        "plays": vid.get("playCount"),
+        "comments": vid.get("commentCount")
+    }
+
+def run_performance_actor(vid_urls):
     # Prepare the Actor input
     run_input = {
         "excludePinnedPosts": False,
-        "postURLs": [
-            vid_url
-        ],
+        "postURLs": list(vid_urls),
         "resultsPerPage": 100,
         "searchSection": "/video",
         "shouldDownloadCovers": False,
@@ -34,12 +71,150 @@ def scrap_performance(vid_url):
     items = []
     for item in client.dataset(run["defaultDatasetId"]).iterate_items():
         items.append(item)
-    
-    vid = items[0]
+    return items
+
+def scrap_performance_batch(vid_urls, urls_per_run=50, max_parallel_runs=3):
+    """
+    Scrape metrics for many videos, packing up to urls_per_run postURLs into each actor run.
+
+    Returned items are matched back to their source URLs by video id, so missing
+    or reordered results are tolerated.
+
+    Returns:
+    - Dictionary mapping every input URL to a dict with created_time, shares, plays and
+      comments, or to None when the actor returned nothing for it.
+    """
+    unique_urls = list(dict.fromkeys(vid_urls))
+    batches = [unique_urls[i:i + urls_per_run] for i in range(0, len(unique_urls), urls_per_run)]
+    if not batches:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(max_parallel_runs, len(batches))) as executor:
+        batch_items = list(executor.map(run_performance_actor, batches))
+
+    metrics_by_key = {}
+    for batch, items in zip(batches, batch_items):
+        for vid in items:
+            metrics = video_metrics(vid)
+            metrics_by_key.setdefault(video_key(vid), metrics)
+            # Short links (vm.tiktok.com/...) only match through the URL the actor was given
+            if vid.get("submittedVideoUrl"):
+                metrics_by_key.setdefault(video_key(vid["submittedVideoUrl"]), metrics)
+        # A single-URL run can only describe that URL, even if it was a short link
+        if len(batch) == 1 and items:
+            metrics_by_key.setdefault(video_key(batch[0]), video_metrics(items[0]))
+
+    return {url: metrics_by_key.get(video_key(url)) for url in unique_urls}
+
+_columns_ready = False
+
+def ensure_refresh_columns(connection):
+    """
+    Adds the bookkeeping columns the refresher relies on to the leads table.
+
+    contract_metrics_attempted_at and contract_metrics_failures record every
+    scrape attempt, including the ones that returned nothing (deleted, private
+    or unmatched videos), so those are backed off instead of retried each cycle.
+
+    Parameters:
+    - connection: psycopg2 connection object to the database.
+    """
+    global _columns_ready
+    if _columns_ready:
+        return
+    add_columns(connection, 'leads', {
+        'contract_posted_at': 'TIMESTAMP NULL',
+        'contract_metrics_updated_at': 'TIMESTAMP NULL',
+        'contract_metrics_attempted_at': 'TIMESTAMP NULL',
+        'contract_metrics_failures': 'INTEGER NOT NULL DEFAULT 0'
+    })
+    _columns_ready = True
+
+# Every scraped video gets its attempt recorded; videos the actor returned nothing for
+# (deleted, private, unmatched short links) count a failure so the refresher backs off
+RECORD_ATTEMPTS_QUERY = """
+UPDATE leads
+SET contract_metrics_attempted_at = %(attempted_at)s,
+    contract_metrics_failures = CASE WHEN contract_vid = ANY(%(found)s) THEN 0
+                                     ELSE COALESCE(contract_metrics_failures, 0) + 1 END
+WHERE contract_vid = ANY(%(urls)s)
+"""
+
+def record_attempts(connection, metrics, attempted_at):
+    """
+    Record a scrape attempt for every video in metrics, found or not.
+
+    Parameters:
+    - connection: psycopg2 connection object to the database.
+    - metrics (dict): Result of scrap_performance_batch (None for videos with no result).
+    - attempted_at (datetime): Naive UTC time of the attempt.
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(RECORD_ATTEMPTS_QUERY, {
+                "attempted_at": attempted_at,
+                "found": [url for url, m in metrics.items() if m is not None],
+                "urls": list(metrics),
+            })
+        connection.commit()
+    except Exception as error:
+        print(f"Error recording metric refresh attempts: {error}")
+        connection.rollback()
+
+def refresh_contract_metrics(vid_urls, **batch_options):
+    """
+    Scrape metrics for the given contract videos and write them to every matching
+    leads row in one set-based UPDATE. Also records when the video was posted and
+    when its metrics were refreshed (contract_posted_at, contract_metrics_updated_at),
+    records the attempt for every video including those that returned nothing,
+    and appends the readings to the metrics history for trend queries.
+
+    Returns:
+    - Tuple (metrics by URL, number of leads rows updated).
+    """
+    metrics = scrap_performance_batch(vid_urls, **batch_options)
+    refreshed_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    rows = [
+        {
+            "contract_vid": url,
+            "contract_shares": m["shares"],
+            "contract_plays": m["plays"],
+            "contract_comments": m["comments"],
+            "contract_posted_at": parse_create_time(m["created_time"]),
+            "contract_metrics_updated_at": refreshed_at
+        }
+        for url, m in metrics.items() if m is not None
+    ]
+    with pooled_connection() as conn:
+        # Both are memoized, so only the first refresh in a process touches the schema
+        ensure_refresh_columns(conn)
+        ensure_history_schema(conn)
+        record_attempts(conn, metrics, refreshed_at)
+        if not rows:
+            return metrics, 0
+        updated = bulk_update_data(conn, "leads", rows, ["contract_vid"])
+        if not updated:
+            # bulk_update_data reports a failed update as 0 rows; keep the history consistent with leads
+            return metrics, 0
+        record_snapshots(conn, [
+            {
+                "contract_vid": row["contract_vid"],
+                "plays": row["contract_plays"],
+                "shares": row["contract_shares"],
+                "comments": row["contract_comments"]
+            }
+            for row in rows
+        ], captured_at=refreshed_at)
+    return metrics, updated
+
+def scrap_performance(vid_url):
+    vid = scrap_performance_batch([vid_url])[vid_url]
+    if vid is None:
+        raise ValueError(f"No metrics returned for {vid_url}")
 
-    created_time = vid["createTimeISO"]
-    shares = vid["shareCount"]
-    plays = vid["playCount"]
-    comments = vid["commentCount"]
+    created_time = vid["created_time"]
+    shares = vid["shares"]
+    plays = vid["plays"]
+    comments = vid["comments"]
 
-    return created_time, shares, plays, comments
\ No newline at end of file
+    return created_time, shares, plays, comments
@@ -1,9 +1,11 @@
 from apify_client import ApifyClient
 import os
+import heapq
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from render_db import insert_data
-from urllib.parse import urlparse
-import psycopg2
+from render_db import upsert_data, create_index
+from db_pool import pooled_connection
+from scrape_cache import get_scrape_cache, make_cache_key, normalize_query
 
 load_dotenv()
 
@@ -11,14 +13,14 @@ load_dotenv()
 # Replace '<YOUR_API_TOKEN>' with your token.
 client = ApifyClient(os.getenv("APIFY_API_KEY"))
 
-def query_tiktok(query):
+TIKTOK_ACTOR = "clockworks/free-tiktok-scraper"
+
+def search_run_input(queries, results_per_page=20):
     # Prepare the Actor input
-    run_input = {
+    return {
         "excludePinnedPosts": False,
-        "resultsPerPage": 20,
-        "searchQueries": [
-            query
-        ],
+        "resultsPerPage": results_per_page,
+        "searchQueries": list(queries),
         "searchSection": "/video",
         "shouldDownloadCovers": False,
         "shouldDownloadSlideshowImages": False,
@@ -26,8 +28,9 @@ def query_tiktok(query):
         "shouldDownloadVideos": False
     }
 
+def run_actor(run_input):
     # Run the Actor and wait for it to finish
-    run = client.actor("clockworks/free-tiktok-scraper").call(run_input=run_input)
+    run = client.actor(TIKTOK_ACTOR).call(run_input=run_input)
 
     # Fetch and print Actor results from the run's dataset (if there are any)
     print("💾 Check your data here: https://console.apify.com/storage/datasets/" + run["defaultDatasetId"])
@@ -36,63 +39,236 @@ def query_tiktok(query):
         items.append(item)
     return items
 
-def get_top_authors(data, top_k):
-    # Sort the list by 'playCount' in descending order
-    sorted_data = sorted(data, key=lambda item: item['authorMeta']["fans"], reverse=True)
-    # Extract the 'authorMeta.name' from the top x items
-    return [item for item in sorted_data[:top_k]]
+def cached_run(run_input, force_refresh=False):
+    # Identical runs within the TTL are served from the on-disk cache
+    cache_key = make_cache_key(TIKTOK_ACTOR, run_input)
+    return get_scrape_cache().get_or_fetch(cache_key, lambda: run_actor(run_input), force_refresh=force_refresh)
+
+def query_tiktok(query, force_refresh=False):
+    return cached_run(search_run_input([query]), force_refresh=force_refresh)
+
+def query_tiktok_many(queries, queries_per_run=5, max_parallel_runs=3, results_per_page=20, force_refresh=False):
+    """
+    Search several keyword variants with as few actor runs as possible.
+
+    Queries are packed `queries_per_run` at a time into one actor input, and up
+    to `max_parallel_runs` runs execute concurrently, so a multi-keyword brief
+    costs about one run's latency. Videos found by several queries are kept
+    once; every item is tagged with `searchQuery` (first query that found it)
+    and `matchedQueries` (all of them).
+    """
+    if isinstance(queries, str):
+        raise TypeError("queries must be a list of strings, not a single string")
+    # Deduplicate the way the cache key normalizes, keeping the first spelling of each query
+    unique_queries = {}
+    for q in queries:
+        if q and q.strip():
+            unique_queries.setdefault(normalize_query(q), q.strip())
+    unique_queries = list(unique_queries.values())
+    batches = [unique_queries[i:i + queries_per_run] for i in range(0, len(unique_queries), queries_per_run)]
+    if not batches:
+        return []
+
+    def run_batch(batch):
+        items = cached_run(search_run_input(batch, results_per_page), force_refresh=force_refresh)
+        if len(batch) == 1:
+            for item in items:
+                item.setdefault("searchQuery", batch[0])
+        return items
+
+    with ThreadPoolExecutor(max_workers=min(max_parallel_runs, len(batches))) as executor:
+        batch_results = list(executor.map(run_batch, batches))
+
+    merged = {}
+    for items in batch_results:
+        for item in items:
+            video_id = item.get("id") or item.get("webVideoUrl") or id(item)
+            query = item.get("searchQuery")
+            if video_id in merged:
+                matched = merged[video_id]["matchedQueries"]
+                if query and query not in matched:
+                    matched.append(query)
+                continue
+            item["matchedQueries"] = [query] if query else []
+            merged[video_id] = item
+    return list(merged.values())
+
+def author_id(item):
+    author = item["authorMeta"]
+    return author.get("id") or author["name"]
+
+# Author-level ranking keys: the value is the same on every video of an author
+AUTHOR_RANKING_KEYS = {
+    "fans": lambda author: author.get("fans") or 0,
+    "hearts": lambda author: author.get("heart", author.get("hearts")) or 0,
+}
+
+# Video-level features computed per author by author_features (pandas), best value first
+FEATURE_RANKING_KEYS = ("median_plays", "engagement_rate", "comment_rate", "shares_per_video")
+
+def top_authors_stream(items, top_k, rank_by="fans"):
+    """
+    Select the top_k distinct authors from an item iterable in a single pass.
+
+    Videos are collapsed per author before ranking, so one creator cannot take
+    several slots. For author-level keys (fans, hearts) only a bounded min-heap
+    of the current leaders is kept, i.e. O(k) memory however many items are
+    streamed. "avg_plays" needs a running mean per author and therefore holds
+    one small counter per distinct author. The FEATURE_RANKING_KEYS need the
+    whole item set and are computed with author_features.
+
+    Returns one representative item per author, best first.
+    """
+    if top_k <= 0:
+        return []
+    if rank_by == "avg_plays":
+        return _top_authors_by_avg_plays(items, top_k)
+    if rank_by in FEATURE_RANKING_KEYS:
+        return _top_authors_by_feature(items, top_k, rank_by)
+    if rank_by not in AUTHOR_RANKING_KEYS:
+        raise ValueError(f"Unknown ranking key: {rank_by}")
+    score_of = AUTHOR_RANKING_KEYS[rank_by]
+
+    heap = []       # (score, sequence, author id); may contain stale entries
+    leaders = {}    # author id -> (score, sequence, item) for authors currently in the top_k
+    sequence = 0
+    for item in items:
+        aid = author_id(item)
+        score = score_of(item["authorMeta"])
+        current = leaders.get(aid)
+        if current is not None:
+            if score <= current[0]:
+                continue
+        elif len(leaders) >= top_k:
+            # Drop stale heap entries left by authors whose score changed
+            while heap[0][2] not in leaders or leaders[heap[0][2]][1] != heap[0][1]:
+                heapq.heappop(heap)
+            if score <= heap[0][0]:
+                continue
+            _, _, evicted = heapq.heappop(heap)
+            del leaders[evicted]
+
+        sequence += 1
+        leaders[aid] = (score, sequence, item)
+        heapq.heappush(heap, (score, sequence, aid))
+        if len(heap) > 2 * top_k:
+            heap = [(sc, seq, a) for a, (sc, seq, _) in leaders.items()]
+            heapq.heapify(heap)
+
+    ranked = sorted(leaders.values(), key=lambda entry: (-entry[0], entry[1]))
+    return [item for _, _, item in ranked]
+
+def _top_authors_by_avg_plays(items, top_k):
+    totals = {}     # author id -> [play sum, video count, first item]
+    for item in items:
+        aid = author_id(item)
+        entry = totals.get(aid)
+        if entry is None:
+            totals[aid] = [item.get("playCount") or 0, 1, item]
+        else:
+            entry[0] += item.get("playCount") or 0
+            entry[1] += 1
+    best = heapq.nlargest(top_k, totals.values(), key=lambda entry: entry[0] / entry[1])
+    return [item for _, _, item in best]
+
+def _top_authors_by_feature(items, top_k, feature):
+    # Imported here so the pandas dependency is only loaded for feature rankings
+    from author_features import aggregate_author_features, rank_authors
+    items = list(items)
+    first_items = {}
+    for item in items:
+        first_items.setdefault(author_id(item), item)
+    ranked = rank_authors(aggregate_author_features(items), by=feature, top_k=top_k)
+    return [first_items[aid] for aid in ranked.index if aid in first_items]
+
+def get_top_authors(data, top_k, rank_by="fans"):
+    # One entry per author, ranked by follower count unless rank_by says otherwise
+    return top_authors_stream(data, top_k, rank_by)
+
+# Leads are unique per platform account; repeated searches only refresh the stats
+LEAD_CONFLICT_COLUMNS = ['platform', 'profile_name']
+LEAD_REFRESH_COLUMNS = ['fans', 'hearts', 'videos']
+
+def item_to_lead(item):
+    """Build a leads row from one scraped video item."""
+    author = item["authorMeta"]
+    profile_name = author['name']
+    return {
+        'profile_name': profile_name,
+        'fans': author['fans'],
+        'hearts': author.get('heart', author.get('hearts')),
+        'videos': author.get('video', author.get('videos')),
+        'platform': 'tiktok',
+        'email': profile_name + '@gmail.com',
+        'lead_stage': 'prospect'
+    }
+
+# Keeps the oldest row of each (platform, profile_name) so the unique index can be built
+DEDUPE_LEADS_QUERY = """
+DELETE FROM leads newer
+USING leads older
+WHERE newer.platform = older.platform
+  AND newer.profile_name = older.profile_name
+  AND newer.id > older.id
+"""
+_leads_index_ready = False
+
+def ensure_leads_unique_index(connection):
+    """
+    Creates the unique index on leads(platform, profile_name) that save_leads' ON CONFLICT needs.
+
+    Duplicate leads left over from the plain inserts used before are removed first
+    (the oldest row of each account is kept), otherwise the index cannot be built.
+
+    Parameters:
+    - connection: psycopg2 connection object to the database.
+
+    Returns:
+    - True once the index exists.
+    """
+    global _leads_index_ready
+    if _leads_index_ready:
+        return True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(DEDUPE_LEADS_QUERY)
+            removed = cursor.rowcount
+        connection.commit()
+        if removed:
+            print(f"Removed {removed} duplicate lead(s).")
+    except Exception as error:
+        print(f"Error removing duplicate leads: {error}")
+        connection.rollback()
+        return False
+    _leads_index_ready = create_index(connection, 'leads', LEAD_CONFLICT_COLUMNS, unique=True)
+    return _leads_index_ready
+
+def save_leads(connection, leads, raise_errors=False):
+    """Upsert a batch of leads rows in one statement; returns the affected row count."""
+    ensure_leads_unique_index(connection)
+    return upsert_data(connection, 'leads', leads, LEAD_CONFLICT_COLUMNS, LEAD_REFRESH_COLUMNS,
+                       raise_errors=raise_errors)
 
 def extract_influencer_info(data):
-    influencer_data = []
-    for profile in data:
-        profile_name = profile["authorMeta"]['name']
-        fans = profile["authorMeta"]['fans']
-        hearts = profile["authorMeta"]['heart']
-        videos = profile["authorMeta"]['video']
-        
-        # Prepare influencer record for dataframe display
-        influencer_record = {
-            'profile_name': profile_name,
-            'fans': fans,
-            'hearts': hearts,
-            'videos': videos,
-            'platform': 'tiktok',
-            'email': profile_name + '@gmail.com',
-            'lead_stage': 'prospect'
-        }
-        influencer_data.append(influencer_record)
-        
-        # Also save to database
-        result = urlparse(os.getenv("DATABASE_URL"))
-        username = result.username
-        password = result.password
-        database = result.path[1:]
-        hostname = result.hostname
-
-        conn = None  # Initialize connection to None
-
-        try:
-            conn = psycopg2.connect(
-            user=username,
-            password=password,
-            host=hostname,
-            port="5432",
-            database=database
-            )
-
-            insert_data(conn, 'leads', influencer_record)
-        except Exception as e:
-            print(f"Database connection error: {e}")
-        finally:
-            if conn:
-                conn.close()
-                
+    # Prepare influencer records for dataframe display
+    influencer_data = [item_to_lead(profile) for profile in data]
+
+    # Also save to database
+    try:
+        with pooled_connection() as conn:
+            save_leads(conn, influencer_data)
+    except Exception as e:
+        print(f"Database connection error: {e}")
+
     # Return data for display
     return influencer_data
 
-
 if __name__ == "__main__":
     query = "AI tools"
     data = query_tiktok(query)
     top_authors = get_top_authors(data, 10)
     print(top_authors)
+
+    # Several keyword variants of one brief in a single actor run
+    data = query_tiktok_many(["AI tools", "AI voice generator", "text to speech"])
+    print(len(data))
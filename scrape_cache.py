@@ -0,0 +1,193 @@
+"""
+Persistent read-through cache for Apify scraper results.
+
+Results are stored zlib-compressed in a local SQLite file, so they survive
+restarts and are shared by every process on the host. Entries expire after a
+TTL and the least recently used ones are evicted once the cache grows past
+its size budget.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a search query."""
+    return " ".join(str(query).lower().split())
+
+
+def make_cache_key(actor_id: str, run_input: Dict[str, Any]) -> str:
+    """
+    Build a stable cache key from the actor and its input
+    Args:
+        actor_id: Apify actor name, e.g. clockworks/free-tiktok-scraper
+        run_input: Actor input; search queries are normalized before hashing
+    Returns:
+        Hex digest identifying the request
+    """
+    normalized = dict(run_input)
+    if "searchQueries" in normalized:
+        normalized["searchQueries"] = [normalize_query(q) for q in normalized["searchQueries"]]
+    payload = json.dumps({"actor": actor_id, "input": normalized}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ScrapeCache:
+    """SQLite-backed TTL + LRU cache of scraper item lists."""
+
+    def __init__(self, path: str, ttl: float = 6 * 3600, max_bytes: int = 256 * 1024 * 1024):
+        """
+        Open (or create) the cache file
+        Args:
+            path: SQLite database file
+            ttl: Seconds an entry stays fresh
+            max_bytes: Compressed size budget before LRU eviction kicks in
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "stores": 0, "evictions": 0, "bypasses": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Look up a fresh entry
+        Args:
+            key: Key from make_cache_key
+        Returns:
+            Cached items, or None on a miss or expired entry
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._stats["hits"] += 1
+        return json.loads(zlib.decompress(value))
+
+    def set(self, key: str, items: List[Dict[str, Any]]) -> None:
+        """
+        Store items and evict least recently used entries beyond max_bytes
+        Args:
+            key: Key from make_cache_key
+            items: JSON-serializable scraper items
+        """
+        value = zlib.compress(json.dumps(items, default=str).encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now)
+            )
+            self._stats["stores"] += 1
+            self._evict()
+
+    def _evict(self) -> None:
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            self._stats["evictions"] += 1
+
+    def get_or_fetch(self, key: str, fetch: Callable[[], List[Dict[str, Any]]],
+                     force_refresh: bool = False) -> List[Dict[str, Any]]:
+        """
+        Read-through access: return the cached items or fetch and store them
+        Args:
+            key: Key from make_cache_key
+            fetch: Zero-argument callable running the scraper
+            force_refresh: Skip the lookup and overwrite the entry with fresh data
+        Returns:
+            Scraper items
+        """
+        if force_refresh:
+            with self._lock:
+                self._stats["bypasses"] += 1
+        else:
+            items = self.get(key)
+            if items is not None:
+                return items
+        items = fetch()
+        self.set(key, items)
+        return items
+
+    def clear(self) -> None:
+        """Drop every cached entry."""
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Cache effectiveness counters for this process plus current size
+        Returns:
+            Dictionary with hit/miss counts, hit rate, entry count and bytes used
+        """
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                **self._stats,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_scrape_cache() -> ScrapeCache:
+    """
+    Return the process-wide scraper cache, configured from TIKTOK_CACHE_PATH,
+    TIKTOK_CACHE_TTL (seconds) and TIKTOK_CACHE_MAX_MB.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ScrapeCache(
+                    os.getenv("TIKTOK_CACHE_PATH", ".cache/tiktok_search.sqlite3"),
+                    ttl=float(os.getenv("TIKTOK_CACHE_TTL", str(6 * 3600))),
+                    max_bytes=int(float(os.getenv("TIKTOK_CACHE_MAX_MB", "256")) * 1024 * 1024),
+                )
+    return _cache
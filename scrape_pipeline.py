@@ -0,0 +1,264 @@
+"""
+Streaming scrape-to-database pipeline.
+
+Stages run in their own threads and are linked by bounded queues:
+
+    dataset iterator -> normalize -> dedupe -> batch writer
+
+Leads are written while the actor's dataset is still being paged in, and
+the queue bounds keep memory flat however many items a run returns.
+"""
+
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from db_pool import pooled_connection
+from scrap_tiktok import client, TIKTOK_ACTOR, search_run_input, item_to_lead, save_leads
+
+_END = object()
+
+
+class StageStats:
+    """Throughput counters of one pipeline stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.busy_seconds = 0.0
+        self.started_at = None
+        self.finished_at = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.monotonic()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "stage": self.name,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "busy_seconds": round(self.busy_seconds, 4),
+            "elapsed_seconds": round(elapsed, 4),
+            "items_per_second": self.items_out / elapsed if elapsed else 0.0,
+        }
+
+
+class ScrapePipeline:
+    """
+    Bounded-queue pipeline from scraper items to upserted leads.
+
+    Each stage is a callable taking one item and returning the transformed
+    item, or None to drop it. The last stage receives lists of up to
+    `batch_size` items.
+    """
+
+    def __init__(self, source: Iterable[Dict[str, Any]],
+                 batch_size: int = 200,
+                 queue_size: int = 1000,
+                 writer: Optional[Callable[[List[Dict[str, Any]]], Any]] = None,
+                 dedupe_window: int = 100_000):
+        """
+        Build the pipeline
+        Args:
+            source: Iterable of raw scraper items (e.g. iterate_tiktok())
+            batch_size: Leads per upsert statement
+            queue_size: Capacity of each inter-stage queue
+            writer: Callable persisting one batch and returning the rows written (or None to
+                count the whole batch); must raise on failure. Defaults to an upsert into leads
+            dedupe_window: Most recent lead keys remembered by the dedupe stage; older repeats
+                slip through and are absorbed by the upsert
+        """
+        self.source = source
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.writer = writer or write_leads
+        self.dedupe_window = dedupe_window
+        self._seen = OrderedDict()
+        self._error = None
+        self._stop = threading.Event()
+        self.stages = [StageStats(name) for name in ("source", "normalize", "dedupe", "write")]
+
+    def _dedupe(self, lead):
+        key = (lead['platform'], lead['profile_name'])
+        if key in self._seen:
+            self._seen.move_to_end(key)
+            return None
+        self._seen[key] = None
+        if len(self._seen) > self.dedupe_window:
+            self._seen.popitem(last=False)
+        return lead
+
+    def _put(self, q, item):
+        # Time out periodically so a failure downstream cannot block us forever
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while True:
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return _END
+
+    def _fail(self, error):
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def _run_source(self, out_q, stats):
+        stats.started_at = time.monotonic()
+        try:
+            items = iter(self.source)
+            while True:
+                # Busy time here is time spent waiting on the dataset download
+                started = time.perf_counter()
+                item = next(items, _END)
+                stats.busy_seconds += time.perf_counter() - started
+                if item is _END:
+                    break
+                stats.items_in += 1
+                if not self._put(out_q, item):
+                    return
+                stats.items_out += 1
+        except Exception as e:
+            self._fail(e)
+        finally:
+            stats.finished_at = time.monotonic()
+            self._put(out_q, _END)
+
+    def _run_map(self, fn, in_q, out_q, stats):
+        stats.started_at = time.monotonic()
+        try:
+            while True:
+                item = self._get(in_q)
+                if item is _END:
+                    break
+                stats.items_in += 1
+                started = time.perf_counter()
+                result = fn(item)
+                stats.busy_seconds += time.perf_counter() - started
+                if result is None:
+                    continue
+                if not self._put(out_q, result):
+                    return
+                stats.items_out += 1
+        except Exception as e:
+            self._fail(e)
+        finally:
+            stats.finished_at = time.monotonic()
+            self._put(out_q, _END)
+
+    def _flush(self, batch, stats):
+        started = time.perf_counter()
+        written = self.writer(batch)
+        stats.busy_seconds += time.perf_counter() - started
+        stats.items_out += len(batch) if written is None else written
+
+    def _run_writer(self, in_q, stats):
+        stats.started_at = time.monotonic()
+        batch = []
+        try:
+            while True:
+                item = self._get(in_q)
+                if item is _END:
+                    break
+                stats.items_in += 1
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    self._flush(batch, stats)
+                    batch = []
+            if batch and self._error is None:
+                self._flush(batch, stats)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            stats.finished_at = time.monotonic()
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Run every stage to completion
+        Returns:
+            Per-stage throughput counters
+        Raises:
+            The first exception raised by any stage
+        """
+        self._seen.clear()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(3)]
+        source_stats, normalize_stats, dedupe_stats, write_stats = self.stages
+        threads = [
+            threading.Thread(target=self._run_source, args=(queues[0], source_stats), name="pipeline-source"),
+            threading.Thread(target=self._run_map, args=(item_to_lead, queues[0], queues[1], normalize_stats),
+                             name="pipeline-normalize"),
+            threading.Thread(target=self._run_map, args=(self._dedupe, queues[1], queues[2], dedupe_stats),
+                             name="pipeline-dedupe"),
+            threading.Thread(target=self._run_writer, args=(queues[2], write_stats), name="pipeline-write"),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._error is not None:
+            raise self._error
+        return self.stats()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Live throughput counters, safe to call while the pipeline runs
+        Returns:
+            Dictionary with one entry per stage
+        """
+        return {"stages": [stage.as_dict() for stage in self.stages]}
+
+
+def iterate_tiktok(queries, results_per_page=20):
+    """
+    Run the search actor and yield its dataset items page by page as they are read.
+
+    Parameters:
+    - queries (list): Search queries packed into one actor run.
+    - results_per_page (int): Results per query.
+    """
+    run = client.actor(TIKTOK_ACTOR).call(run_input=search_run_input(queries, results_per_page))
+    print("💾 Check your data here: https://console.apify.com/storage/datasets/" + run["defaultDatasetId"])
+    yield from client.dataset(run["defaultDatasetId"]).iterate_items()
+
+
+def write_leads(batch):
+    """Upsert one batch of leads through the shared pool; raises if the write fails."""
+    with pooled_connection() as conn:
+        return save_leads(conn, batch, raise_errors=True)
+
+
+def scrape_to_database(queries, batch_size=200, queue_size=1000, pipeline_ready=None):
+    """
+    Stream a search straight into the leads table.
+
+    Parameters:
+    - queries (list): Search queries.
+    - batch_size (int): Leads per upsert.
+    - queue_size (int): Bound of each inter-stage queue.
+    - pipeline_ready (callable): Called with the pipeline before it starts, e.g. to poll its stats.
+
+    Returns:
+    - Per-stage throughput counters.
+
+    Example:
+    scrape_to_database(["AI tools", "text to speech"])
+    """
+    pipeline = ScrapePipeline(iterate_tiktok(queries), batch_size=batch_size, queue_size=queue_size)
+    if pipeline_ready is not None:
+        pipeline_ready(pipeline)
+    return pipeline.run()
+
+
+if __name__ == "__main__":
+    print(scrape_to_database(["AI tools"]))
@@ -0,0 +1,308 @@
+"""
+Background influencer search jobs.
+
+POST /api/influencers/search only records a job and hands it to a thread
+pool, so WSGI workers are not tied up while the Apify actor runs. Job state
+lives in the search_jobs table, which lets any worker answer status polls
+and SSE subscriptions for any job.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.extras import Json
+
+from db_pool import pooled_connection
+from render_db import add_columns, create_table, fetch_data, insert_data, update_data
+from scrap_tiktok import query_tiktok, query_tiktok_many, get_top_authors, item_to_lead, save_leads
+from scrape_pipeline import scrape_to_database
+
+JOBS_TABLE = 'search_jobs'
+JOB_COLUMNS = ['id', 'status', 'query', 'top_k', 'progress', 'message',
+               'result', 'error', 'created_at', 'updated_at']
+TERMINAL_STATUSES = {'completed', 'failed'}
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SEARCH_JOB_WORKERS", "4")),
+    thread_name_prefix="search-job"
+)
+_table_ready = False
+
+# Jobs this process has queued or is running; their heartbeat is refreshed periodically
+HEARTBEAT_INTERVAL = float(os.getenv("SEARCH_JOB_HEARTBEAT", "15"))
+# Unfinished jobs whose heartbeat is older than this belonged to a worker that died
+STALE_JOB_TIMEOUT = float(os.getenv("SEARCH_JOB_STALE_TIMEOUT", "120"))
+_active_jobs = set()
+_active_lock = threading.Lock()
+_heartbeat_thread = None
+_last_sweep = 0.0
+
+RECLAIM_QUERY = """
+UPDATE search_jobs
+SET status = 'failed',
+    message = 'Search failed',
+    error = 'Worker stopped responding',
+    updated_at = NOW()
+WHERE status IN ('queued', 'running')
+  AND heartbeat_at < NOW() - make_interval(secs => %s)
+"""
+
+def ensure_jobs_table(connection):
+    """
+    Creates the search_jobs table if it does not exist yet.
+
+    Parameters:
+    - connection: psycopg2 connection object to the database.
+    """
+    global _table_ready
+    if _table_ready:
+        return
+    create_table(connection, JOBS_TABLE, {
+        'id': 'VARCHAR(36) PRIMARY KEY',
+        'status': 'VARCHAR(20) NOT NULL',
+        'query': 'TEXT NOT NULL',
+        'top_k': 'INTEGER NOT NULL',
+        'progress': 'INTEGER NOT NULL DEFAULT 0',
+        'message': 'TEXT NULL',
+        'result': 'JSONB NULL',
+        'error': 'TEXT NULL',
+        'created_at': 'TIMESTAMP NOT NULL DEFAULT NOW()',
+        'updated_at': 'TIMESTAMP NOT NULL DEFAULT NOW()'
+    })
+    add_columns(connection, JOBS_TABLE, {'heartbeat_at': 'TIMESTAMP NOT NULL DEFAULT NOW()'})
+    _table_ready = True
+
+def _heartbeat_loop():
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        with _active_lock:
+            job_ids = list(_active_jobs)
+        if not job_ids:
+            continue
+        try:
+            with pooled_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("UPDATE search_jobs SET heartbeat_at = NOW() WHERE id = ANY(%s)", (job_ids,))
+                conn.commit()
+        except Exception as e:
+            print(f"Search job heartbeat failed: {e}")
+
+def _track_job(job_id):
+    global _heartbeat_thread
+    with _active_lock:
+        _active_jobs.add(job_id)
+        if _heartbeat_thread is None:
+            _heartbeat_thread = threading.Thread(target=_heartbeat_loop, name="search-job-heartbeat", daemon=True)
+            _heartbeat_thread.start()
+
+def reclaim_stale_jobs(connection, timeout=STALE_JOB_TIMEOUT):
+    """
+    Fails queued or running jobs whose worker stopped sending heartbeats.
+
+    Parameters:
+    - connection: psycopg2 connection object to the database.
+    - timeout (float): Seconds without a heartbeat after which a job is given up.
+
+    Returns:
+    - Number of jobs marked as failed.
+    """
+    global _last_sweep
+    _last_sweep = time.monotonic()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(RECLAIM_QUERY, (timeout,))
+            reclaimed = cursor.rowcount
+        connection.commit()
+    except Exception as error:
+        print(f"Error reclaiming stale search jobs: {error}")
+        connection.rollback()
+        return 0
+    if reclaimed:
+        print(f"Marked {reclaimed} stale search job(s) as failed.")
+    return reclaimed
+
+def get_job(job_id):
+    """
+    Reads the current state of a job.
+
+    Parameters:
+    - job_id (str): Id returned by submit_search.
+
+    Returns:
+    - Dictionary with the job columns, or None if the job does not exist.
+    """
+    with pooled_connection() as conn:
+        ensure_jobs_table(conn)
+        # Polls double as the sweep for jobs orphaned by a dead worker, at most once per heartbeat
+        if time.monotonic() - _last_sweep > HEARTBEAT_INTERVAL:
+            reclaim_stale_jobs(conn)
+        rows = fetch_data(conn, JOBS_TABLE, JOB_COLUMNS, "id = %s", [job_id])
+    if not rows:
+        return None
+    job = dict(zip(JOB_COLUMNS, rows[0]))
+    for column in ('created_at', 'updated_at'):
+        job[column] = job[column].isoformat() if job[column] else None
+    return job
+
+def _update_job(job_id, **fields):
+    if fields.get('result') is not None:
+        fields['result'] = Json(fields['result'])
+    # Every change bumps updated_at so SSE subscribers notice it
+    fields['updated_at'] = datetime.now()
+    # A job the sweeper already failed stays terminal, even if its worker finishes afterwards
+    with pooled_connection() as conn:
+        updated = update_data(conn, JOBS_TABLE, fields, "id = %s AND status NOT IN ('completed', 'failed')", [job_id])
+    if updated == 0:
+        print(f"Search job {job_id} is already finished; dropped update {sorted(fields)}")
+    return updated
+
+def run_search(job_id, query, top_k, force_refresh=False, queries=None, rank_by='fans'):
+    """
+    Worker body: runs the TikTok actor, stores partial results, then upserts the leads.
+
+    Parameters:
+    - job_id (str): Job to report progress on.
+    - query (str): Search query for the scraper.
+    - top_k (int): Number of top authors to keep.
+    - force_refresh (bool): Bypass the scraper result cache.
+    - queries (list): Keyword variants fanned out together instead of the single query.
+    - rank_by (str): Author ranking key, see scrap_tiktok.top_authors_stream.
+    """
+    try:
+        _update_job(job_id, status='running', progress=10, message='Running TikTok scraper')
+        if queries:
+            tiktok_data = query_tiktok_many(queries, force_refresh=force_refresh)
+        else:
+            tiktok_data = query_tiktok(query, force_refresh=force_refresh)
+
+        top_influencers = get_top_authors(tiktok_data, top_k, rank_by)
+        # Partial result: clients can render the authors before they are saved
+        _update_job(job_id, progress=70, message=f'Found {len(top_influencers)} influencers, saving leads',
+                    result=top_influencers)
+
+        with pooled_connection() as conn:
+            save_leads(conn, [item_to_lead(profile) for profile in top_influencers], raise_errors=True)
+
+        _update_job(job_id, status='completed', progress=100, message='Search completed')
+    except Exception as e:
+        print(f"Search job {job_id} failed: {e}")
+        _update_job(job_id, status='failed', message='Search failed', error=str(e))
+    finally:
+        with _active_lock:
+            _active_jobs.discard(job_id)
+
+def submit_search(query, top_k=10, force_refresh=False, queries=None, rank_by='fans'):
+    """
+    Records a new search job and schedules it on the worker pool.
+
+    Parameters:
+    - query (str): Search query for the scraper.
+    - top_k (int): Number of top authors to keep.
+    - force_refresh (bool): Bypass the scraper result cache.
+    - queries (list): Optional keyword variants searched together (see query_tiktok_many).
+    - rank_by (str): Author ranking key: fans, hearts, avg_plays or one of
+      scrap_tiktok.FEATURE_RANKING_KEYS.
+
+    Returns:
+    - The new job id.
+
+    Raises:
+    - RuntimeError if the job could not be recorded.
+    """
+    job_id = _record_job(query or ' | '.join(queries or []), top_k)
+    _executor.submit(run_search, job_id, query, top_k, force_refresh, queries, rank_by)
+    return job_id
+
+def _record_job(query, top_k):
+    job_id = str(uuid.uuid4())
+    with pooled_connection() as conn:
+        ensure_jobs_table(conn)
+        recorded = insert_data(conn, JOBS_TABLE, {
+            'id': job_id,
+            'status': 'queued',
+            'query': query,
+            'top_k': top_k,
+            'progress': 0,
+            'message': 'Queued'
+        })
+    if not recorded:
+        raise RuntimeError("Could not record the search job")
+    _track_job(job_id)
+    return job_id
+
+def run_import(job_id, queries, batch_size=200):
+    """
+    Worker body: streams every result of a search into the leads table (see scrape_pipeline).
+
+    Parameters:
+    - job_id (str): Job to report progress on.
+    - queries (list): Search queries packed into one actor run.
+    - batch_size (int): Leads per upsert.
+    """
+    try:
+        _update_job(job_id, status='running', progress=10, message='Streaming TikTok results into leads')
+        stats = scrape_to_database(queries, batch_size=batch_size)
+        written = stats['stages'][-1]['items_out']
+        _update_job(job_id, status='completed', progress=100, message=f'Imported {written} leads', result=stats)
+    except Exception as e:
+        print(f"Import job {job_id} failed: {e}")
+        _update_job(job_id, status='failed', message='Import failed', error=str(e))
+    finally:
+        with _active_lock:
+            _active_jobs.discard(job_id)
+
+def submit_import(queries, batch_size=200):
+    """
+    Records a bulk import job, which saves every author a search returns rather than the top few.
+
+    Parameters:
+    - queries (list): Search queries.
+    - batch_size (int): Leads per upsert.
+
+    Returns:
+    - The new job id; its result holds the pipeline's per-stage throughput counters.
+
+    Raises:
+    - RuntimeError if the job could not be recorded.
+    """
+    job_id = _record_job(' | '.join(queries), 0)
+    _executor.submit(run_import, job_id, queries, batch_size)
+    return job_id
+
+def job_events(job_id, poll_interval=1.0, timeout=600.0):
+    """
+    Generator of Server-Sent Events for a job, emitted whenever its row changes.
+
+    The job table is polled, so the subscriber may be served by a different
+    worker than the one running the job.
+
+    Parameters:
+    - job_id (str): Job to follow.
+    - poll_interval (float): Seconds between polls.
+    - timeout (float): Give up after this many seconds.
+
+    Yields:
+    - SSE-formatted strings.
+    """
+    last_seen = None
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = get_job(job_id)
+        if job is None:
+            yield f"event: error\ndata: {json.dumps({'error': 'Job not found'})}\n\n"
+            return
+        if job['updated_at'] != last_seen:
+            last_seen = job['updated_at']
+            yield f"event: progress\ndata: {json.dumps(job, default=str)}\n\n"
+        if job['status'] in TERMINAL_STATUSES:
+            yield f"event: done\ndata: {json.dumps({'status': job['status']})}\n\n"
+            return
+        # Comment line keeps proxies from closing an idle stream
+        yield ": keep-alive\n\n"
+        time.sleep(poll_interval)
+    yield f"event: error\ndata: {json.dumps({'error': 'Timed out'})}\n\n"
@@ -0,0 +1,163 @@
+"""
+Compiled statement cache for the render_db CRUD helpers.
+
+Composed SQL is cached per (operation, table, columns, condition) so hot
+insert/update paths skip rebuilding psycopg2.sql compositions. On pooled
+connections the statement is also PREPAREd server-side once and run with
+EXECUTE afterwards, which skips PostgreSQL's parse/plan step.
+"""
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence
+
+_PLACEHOLDER = re.compile(r"%%|%s")
+
+
+def _to_positional(query: str) -> str:
+    """Rewrite psycopg2 %s placeholders to PREPARE-style $1, $2, ..."""
+    counter = [0]
+
+    def replace(match):
+        if match.group(0) == "%%":
+            return "%"
+        counter[0] += 1
+        return f"${counter[0]}"
+
+    return _PLACEHOLDER.sub(replace, query)
+
+
+class StatementCache:
+    """
+    LRU cache of composed SQL text plus per-connection prepared statements.
+
+    Connections opt into server-side preparation by exposing a
+    `prepared_statements` OrderedDict (see db_pool.PooledConnection); any other
+    connection just runs the cached SQL text.
+    """
+
+    def __init__(self, max_statements: int = 256, max_prepared_per_connection: int = 64):
+        """
+        Initialize the cache
+        Args:
+            max_statements: Composed statements kept process-wide
+            max_prepared_per_connection: Prepared statements kept on each connection before DEALLOCATE
+        """
+        self.max_statements = max_statements
+        self.max_prepared_per_connection = max_prepared_per_connection
+        self._statements = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "prepares": 0,
+            "deallocations": 0,
+        }
+
+    def get(self, connection, key: Hashable, build: Callable[[], Any]) -> str:
+        """
+        Return the SQL text for key, composing it with build() on a miss
+        Args:
+            connection: Connection used to render the psycopg2.sql composition
+            key: Cache key, e.g. ('insert', table, columns)
+            build: Zero-argument callable returning a psycopg2.sql Composable
+        Returns:
+            SQL text with %s placeholders
+        """
+        with self._lock:
+            query = self._statements.get(key)
+            if query is not None:
+                self._statements.move_to_end(key)
+                self._stats["hits"] += 1
+                return query
+            self._stats["misses"] += 1
+
+        query = build().as_string(connection)
+
+        with self._lock:
+            self._statements[key] = query
+            self._statements.move_to_end(key)
+            while len(self._statements) > self.max_statements:
+                self._statements.popitem(last=False)
+                self._stats["evictions"] += 1
+        return query
+
+    def execute(self, cursor, key: Hashable, build: Callable[[], Any],
+                params: Optional[Sequence[Any]] = None) -> None:
+        """
+        Execute the cached statement for key on cursor
+        Args:
+            cursor: Open cursor of the connection to run on
+            key: Cache key identifying the statement shape
+            build: Zero-argument callable returning the psycopg2.sql composition
+            params: Values for the %s placeholders
+        """
+        connection = cursor.connection
+        query = self.get(connection, key, build)
+
+        prepared = getattr(connection, "prepared_statements", None)
+        if prepared is None:
+            cursor.execute(query, params)
+            return
+
+        # Raw SQL text rather than the key: different keys may share a statement
+        name = "rdb_" + hashlib.sha1(query.encode("utf-8")).hexdigest()[:16]
+        if name in prepared:
+            prepared.move_to_end(name)
+        else:
+            statement = _to_positional(query) if params else query
+            cursor.execute(f"PREPARE {name} AS {statement}")
+            prepared[name] = query
+            with self._lock:
+                self._stats["prepares"] += 1
+            while len(prepared) > self.max_prepared_per_connection:
+                oldest, _ = prepared.popitem(last=False)
+                cursor.execute(f"DEALLOCATE {oldest}")
+                with self._lock:
+                    self._stats["deallocations"] += 1
+
+        if params:
+            cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+    def invalidate(self, connection) -> None:
+        """
+        Forget the statements prepared on a connection, e.g. after an error.
+        The connection must not be in an aborted transaction.
+        """
+        prepared = getattr(connection, "prepared_statements", None)
+        if not prepared:
+            return
+        prepared.clear()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("DEALLOCATE ALL")
+            connection.commit()
+        except Exception:
+            connection.rollback()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Cache effectiveness counters
+        Returns:
+            Dictionary with hit/miss/eviction counts and the hit rate
+        """
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "size": len(self._statements),
+                "max_statements": self.max_statements,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                **self._stats,
+            }
+
+
+statement_cache = StatementCache(
+    max_statements=int(os.getenv("STATEMENT_CACHE_SIZE", "256")),
+    max_prepared_per_connection=int(os.getenv("PREPARED_STATEMENTS_PER_CONNECTION", "64")),
+)
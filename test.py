@@ -3,9 +3,7 @@ from product_to_query import product_description_to_query
 from render_db import fetch_data
 from influencerOutreach.email_function import send_simple_message
 import streamlit as st
-import psycopg2
-from urllib.parse import urlparse
-import os
+from db_pool import get_pool
 from dotenv import load_dotenv
 import pandas as pd
 
@@ -22,20 +20,7 @@ if 'email_sent' not in st.session_state:
 # Function to establish database connection
 def get_db_connection():
     try:
-        result = urlparse(os.getenv("DATABASE_URL"))
-        username = result.username
-        password = result.password
-        database = result.path[1:]
-        hostname = result.hostname
-        
-        conn = psycopg2.connect(
-            user=username,
-            password=password,
-            host=hostname,
-            port="5432",
-            database=database
-        )
-        return conn
+        return get_pool().getconn()
     except Exception as e:
         st.error(f"Database connection error: {e}")
         return None
@@ -161,7 +146,7 @@ with tab2:
                     st.error(f"Error fetching data: {e}")
                     st.session_state.has_data = False
                 finally:
-                    conn.close()
+                    get_pool().putconn(conn)
             else:
                 st.error("Failed to connect to the database. Check your DATABASE_URL environment variable.")
     